@@ -0,0 +1,94 @@
+"""Client-side interpolation vs server-side binding on the read paths
+
+Runs the trip and item list lookups against a Database per cursor mode:
+client (ClientCursor, the default) and server (server-side binding with
+prepared statements after --prepare-threshold executions).
+
+Needs the same environment as the test suite (TP_* variables and a database):
+
+    python benchmarks/bench_cursor_modes.py --iterations 2000
+"""
+
+import argparse
+import statistics
+import time
+from dataclasses import replace
+from unittest.mock import patch
+
+from turplanlegger.app import create_app, db
+from turplanlegger.database.base import Database
+from turplanlegger.utils.config import config
+
+
+def seed(database: Database) -> tuple[int, int]:
+    with database._cursor() as cur:
+        cur.execute(
+            'INSERT INTO users (id, name, last_name, email, auth_method) '
+            "VALUES (gen_random_uuid(), 'Ola', 'N', 'bench@norge.no', 'basic') "
+            'RETURNING id'
+        )
+        owner = cur.fetchone().id
+        cur.execute('INSERT INTO trips (owner, name) VALUES (%s, %s) RETURNING id', (owner, 'Bench trip'))
+        trip_id = cur.fetchone().id
+        for day in range(5):
+            cur.execute(
+                'INSERT INTO trip_dates (trip_id, owner, start_time, end_time) '
+                "VALUES (%s, %s, now() + %s * interval '1 day', now() + (%s + 1) * interval '1 day')",
+                (trip_id, owner, day, day),
+            )
+        cur.execute('INSERT INTO item_lists (owner, name) VALUES (%s, %s) RETURNING id', (owner, 'Bench list'))
+        item_list_id = cur.fetchone().id
+        for i in range(50):
+            cur.execute(
+                'INSERT INTO lists_items (content, item_list, owner, checked) VALUES (%s, %s, %s, %s)',
+                (f'item {i}', item_list_id, owner, i % 3 == 0),
+            )
+    return trip_id, item_list_id
+
+
+def run(lookup, iterations: int) -> list[float]:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        lookup()
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--prepare-threshold', type=int, default=config.database_prepare_threshold)
+    args = parser.parse_args()
+
+    app = create_app()
+    trip_id, item_list_id = seed(db)
+
+    try:
+        for mode in ('client', 'server'):
+            mode_config = replace(config, database_cursor=mode, database_prepare_threshold=args.prepare_threshold)
+            with patch('turplanlegger.database.base.config', mode_config):
+                database = Database()
+                database.init_db(app)
+
+            lookups = {
+                'get_trip_hydrated': lambda: database.get_trip_hydrated(trip_id),
+                'get_item_list': lambda: (
+                    database.get_item_list(item_list_id),
+                    database.get_list_items_by_item_lists([item_list_id]),
+                ),
+            }
+            for name, lookup in lookups.items():
+                run(lookup, 50)
+                timings = run(lookup, args.iterations)
+                print(
+                    f'{mode:>6} {name:>17}: mean={statistics.mean(timings):.0f}us '
+                    f'p50={statistics.median(timings):.0f}us p99={sorted(timings)[int(len(timings) * 0.99)]:.0f}us'
+                )
+            database.conn.close()
+    finally:
+        db.destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Bulk import of list items: pipelined INSERTs vs COPY
+
+Adds --items items to an item list with ListItem.create_many, which
+pipelines one INSERT per item, and with ListItem.import_many, which
+streams them with COPY.
+
+Needs the same environment as the test suite (TP_* variables and a database):
+
+    python benchmarks/bench_import.py --items 10000 --rounds 5
+"""
+
+import argparse
+import statistics
+import time
+
+from turplanlegger.app import create_app, db
+from turplanlegger.auth.utils import hash_password
+from turplanlegger.models.item_lists import ItemList
+from turplanlegger.models.list_items import ListItem
+from turplanlegger.models.user import User
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    create_app()
+    owner = User.create(
+        User(
+            name='Ola',
+            last_name='Nordmann',
+            email='bench@norge.no',
+            auth_method='basic',
+            password=hash_password('bench'),
+        )
+    )
+    item_list = ItemList(owner=owner.id, name='Bench list').create()
+    records = [{'content': f'item {i}', 'checked': i % 3 == 0} for i in range(args.items)]
+
+    runs = {
+        'create_many': lambda: ListItem.create_many(
+            [
+                ListItem(owner=owner.id, item_list=item_list.id, checked=record['checked'], content=record['content'])
+                for record in records
+            ]
+        ),
+        'import_many': lambda: ListItem.import_many(item_list.id, owner.id, records),
+    }
+
+    try:
+        for name, run in runs.items():
+            timings = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f'{name:>11}: {args.items} items mean={statistics.mean(timings):.0f}ms min={min(timings):.0f}ms')
+    finally:
+        db.destroy()
+
+
+if __name__ == '__main__':
+    main()
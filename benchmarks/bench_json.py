@@ -0,0 +1,99 @@
+"""Response serialization: Flask's default json provider vs ujson
+
+Seeds trips with dates and routes with long geometries, then times
+GET /trips/mine and GET /routes/mine, and dumping their payloads alone,
+with each provider.
+
+Needs the same environment as the test suite (TP_* variables and a database):
+
+    python benchmarks/bench_json.py --trips 500 --routes 50 --points 5000
+"""
+
+import argparse
+import json
+import statistics
+import time
+from datetime import UTC, datetime, timedelta
+
+from flask.json.provider import DefaultJSONProvider
+
+from turplanlegger.app import create_app, db
+from turplanlegger.auth.utils import hash_password
+from turplanlegger.models.route import Route
+from turplanlegger.models.trip import Trip
+from turplanlegger.models.trip_date import TripDate
+from turplanlegger.models.user import User
+from turplanlegger.utils.json_provider import UJSONProvider
+
+
+def seed(owner: User, trips: int, routes: int, points: int) -> None:
+    now = datetime.now(UTC)
+    for i in range(trips):
+        Trip(
+            owner=owner.id,
+            name=f'Trip {i}',
+            dates=[
+                TripDate(owner=owner.id, start_time=now + timedelta(days=d), end_time=now + timedelta(days=d + 1))
+                for d in range(3)
+            ],
+        ).create()
+    geometry = {'type': 'LineString', 'coordinates': [[11.6 + i * 1e-5, 60.6 + i * 1e-5] for i in range(points)]}
+    for i in range(routes):
+        Route(owner=owner.id, route=geometry, name=f'Route {i}').create()
+
+
+def timed(func, rounds: int) -> list[float]:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trips', type=int, default=500)
+    parser.add_argument('--routes', type=int, default=50)
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    owner = User.create(
+        User(
+            name='Ola',
+            last_name='Nordmann',
+            email='bench@norge.no',
+            auth_method='basic',
+            password=hash_password('test'),
+        )
+    )
+    seed(owner, args.trips, args.routes, args.points)
+
+    response = client.post('/login', json={'email': owner.email, 'password': 'test'})
+    headers = {'Authorization': f'Bearer {json.loads(response.data)["token"]}'}
+    urls = {'/trips/mine': f'/trips/mine?limit={args.trips}', '/routes/mine': f'/routes/mine?limit={args.routes}'}
+    with app.test_request_context():
+        payloads = {
+            '/trips/mine': [trip.serialize for trip in Trip.find_trips_by_owner(owner.id, limit=args.trips)],
+            '/routes/mine': [route.serialize for route in Route.find_routes_by_owner(owner.id, limit=args.routes)],
+        }
+
+    try:
+        for provider in (DefaultJSONProvider(app), UJSONProvider(app)):
+            app.json = provider
+            for name, url in urls.items():
+                request = timed(lambda: client.get(url, headers=headers), args.rounds)
+                dumps = timed(lambda: provider.dumps(payloads[name]), args.rounds)
+                print(
+                    f'{type(provider).__name__:>19} {name:>12}: request p50={statistics.median(request):.1f}ms, '
+                    f'dumps p50={statistics.median(dumps):.1f}ms'
+                )
+    finally:
+        db.destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""API latency while /login is flooded
+
+Serves the app on a fixed number of threads, like gunicorn's gthread worker,
+floods /login from many clients and measures the latency of GET /whoami
+from a single client. Runs once with the bounded password hasher from config
+and once with a hasher that admits every login, for comparison.
+
+Needs the same environment as the test suite (TP_* variables and a database):
+
+    python benchmarks/bench_login_storm.py --threads 4 --logins 16 --duration 10
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from werkzeug.serving import BaseWSGIServer
+
+from turplanlegger.app import create_app, db
+from turplanlegger.auth import utils
+from turplanlegger.auth.utils import PasswordHasher, hash_password
+from turplanlegger.models.user import User
+from turplanlegger.utils.config import config
+
+
+class GthreadServer(BaseWSGIServer):
+    """Serves requests on a fixed number of threads"""
+
+    def __init__(self, host: str, port: int, app, threads: int) -> None:
+        super().__init__(host, port, app)
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address) -> None:
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def storm(url: str, token: str, email: str, logins: int, duration: float) -> tuple[list[float], Counter]:
+    stop = threading.Event()
+    statuses = Counter()
+
+    def login():
+        with httpx.Client(timeout=30) as client:
+            while not stop.is_set():
+                response = client.post(f'{url}/login', json={'email': email, 'password': 'test'})
+                statuses[response.status_code] += 1
+
+    threads = [threading.Thread(target=login) for _ in range(logins)]
+    for thread in threads:
+        thread.start()
+
+    latencies = []
+    with httpx.Client(timeout=30) as client:
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            client.get(f'{url}/whoami', headers={'Authorization': f'Bearer {token}'})
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return latencies, statuses
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4, help='request threads, as gunicorn --threads')
+    parser.add_argument('--logins', type=int, default=16, help='concurrent clients calling /login')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per run')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    app = create_app()
+    user = User.create(
+        User(
+            name='Ola',
+            last_name='Nordmann',
+            email='bench@norge.no',
+            auth_method='basic',
+            password=hash_password('test'),
+        )
+    )
+
+    server = GthreadServer('127.0.0.1', 0, app, args.threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}'
+
+    response = httpx.post(f'{url}/login', json={'email': user.email, 'password': 'test'})
+    token = json.loads(response.text)['token']
+
+    bounded = utils.hasher
+    unbounded = PasswordHasher(workers=args.logins, queue_size=0)
+    runs = {
+        f'bounded ({config.password_hash_workers}+{config.password_hash_queue_size})': bounded,
+        'unbounded': unbounded,
+    }
+
+    try:
+        for name, hasher in runs.items():
+            utils.hasher = hasher
+            latencies, statuses = storm(url, token, user.email, args.logins, args.duration)
+            print(
+                f'{name:>16}: /whoami n={len(latencies)} '
+                f'p50={statistics.median(latencies):.1f}ms p99={percentile(latencies, 0.99):.1f}ms, '
+                f'/login {dict(sorted(statuses.items()))}'
+            )
+    finally:
+        utils.hasher = bounded
+        server.shutdown()
+        db.destroy()
+
+
+if __name__ == '__main__':
+    main()
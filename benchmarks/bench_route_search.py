@@ -0,0 +1,115 @@
+"""Viewport search of routes with and without the bounding box index
+
+Seeds --routes routes spread over Norway, owned by --users users with a
+share of them shared with another user, and times Route.find_routes_in_bbox
+over viewports of a town, a county and the whole country for a typical
+user and for a heavy user owning --heavy of all routes. Runs once with
+routes_bbox_idx and once without, for comparison.
+
+Needs the same environment as the test suite (TP_* variables and a database):
+
+    python benchmarks/bench_route_search.py --routes 1000000 --users 1000
+"""
+
+import argparse
+import statistics
+import time
+
+from turplanlegger.app import create_app, db
+from turplanlegger.database.base import Database
+from turplanlegger.models.route import Route
+
+VIEWPORTS = {
+    'town': (10.6, 59.85, 10.9, 60.0),
+    'county': (9.5, 59.5, 12.0, 61.0),
+    'country': (4.0, 57.5, 31.5, 71.5),
+}
+
+
+def seed(database: Database, routes: int, users: int, shared: float, heavy: float) -> list:
+    with database._cursor() as cur:
+        cur.execute('SELECT setseed(0.21)')
+        cur.execute(
+            'INSERT INTO users (id, name, last_name, email, auth_method) '
+            "SELECT gen_random_uuid(), 'Ola', 'N', 'bench' || i || '@norge.no', 'basic' "
+            'FROM generate_series(1, %s) i RETURNING id',
+            (users,),
+        )
+        user_ids = [rec.id for rec in cur.fetchall()]
+
+        # Routes up to ~10km across, denser in the south like the trails
+        cur.execute(
+            """
+            INSERT INTO routes (owner, name, route, bbox, centroid, length, segment_lengths, points)
+            SELECT owner, 'Bench route', jsonb_build_object(
+                    'type', 'LineString', 'coordinates', jsonb_build_array(
+                        jsonb_build_array(lon, lat), jsonb_build_array(lon + w, lat + h))),
+                ARRAY[lon, lat, lon + w, lat + h], ARRAY[lon + w / 2, lat + h / 2], 0, '{}', 2
+            FROM (
+                SELECT CASE WHEN random() < %(heavy)s THEN (%(users)s)[1]
+                    ELSE (%(users)s)[1 + floor(random() * cardinality(%(users)s))::int] END AS owner,
+                    4.5 + random() * 26 AS lon, 58 + 13 * power(random(), 2) AS lat,
+                    random() * 0.15 AS w, random() * 0.08 AS h
+                FROM generate_series(1, %(routes)s)
+            ) seeded
+            """,
+            {'users': user_ids, 'routes': routes, 'heavy': heavy},
+        )
+        cur.execute(
+            """
+            INSERT INTO route_permissions (object_id, subject_id, access_level)
+            SELECT id, (%(users)s)[1 + floor(random() * cardinality(%(users)s))::int], 'READ'
+            FROM routes WHERE random() < %(shared)s
+            ON CONFLICT DO NOTHING
+            """,
+            {'users': user_ids, 'shared': shared},
+        )
+        cur.execute('ANALYZE routes')
+        cur.execute('ANALYZE route_permissions')
+    return user_ids
+
+
+def run(subject_id, bbox, limit: int, iterations: int) -> tuple[list[float], int]:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        found = Route.find_routes_in_bbox(subject_id, bbox, limit=limit, detail=8)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, len(found)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--shared', type=float, default=0.05, help='share of routes shared with another user')
+    parser.add_argument('--heavy', type=float, default=0.1, help='share of routes owned by the heavy user')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    create_app()
+    start = time.perf_counter()
+    user_ids = seed(db, args.routes, args.users, args.shared, args.heavy)
+    print(f'seeded {args.routes} routes for {args.users} users in {time.perf_counter() - start:.0f}s')
+    subjects = {'typical': user_ids[1], 'heavy': user_ids[0]}
+
+    try:
+        for index in ('with index', 'without index'):
+            if index == 'without index':
+                with db._cursor() as cur:
+                    cur.execute('DROP INDEX routes_bbox_idx')
+            for user, subject_id in subjects.items():
+                for name, bbox in VIEWPORTS.items():
+                    run(subject_id, bbox, args.limit, 5)
+                    timings, found = run(subject_id, bbox, args.limit, args.iterations)
+                    print(
+                        f'{index:>13} {user:>7} {name:>7}: {found:>2} routes '
+                        f'p50={statistics.median(timings):.1f}ms max={max(timings):.1f}ms'
+                    )
+    finally:
+        db.destroy()
+
+
+if __name__ == '__main__':
+    main()
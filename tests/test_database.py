@@ -1,10 +1,25 @@
 import datetime
+import threading
+import time
 import unittest
 from collections import namedtuple
+from dataclasses import replace
+from unittest.mock import patch
 from uuid import uuid4
 
-from turplanlegger.app import create_app, db
+import psycopg
+
+from turplanlegger.app import adb, create_app, db
 from turplanlegger.auth.utils import hash_password
+from turplanlegger.database.base import Database
+from turplanlegger.models.access_level import AccessLevel
+from turplanlegger.models.item_lists import ItemList
+from turplanlegger.models.list_items import ListItem
+from turplanlegger.models.permission import Permission
+from turplanlegger.models.trip import Trip
+from turplanlegger.models.trip_date import TripDate
+from turplanlegger.models.user import User
+from turplanlegger.utils.config import config
 
 
 class UsersTestCase(unittest.TestCase):
@@ -76,3 +91,369 @@ class UsersTestCase(unittest.TestCase):
 
         res = db._insert(insert, correct_vars)
         self.assertEqual(correct, res)
+
+
+class PooledDatabaseTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.db = Database()
+        pooled_config = replace(config, database_pool=True, database_pool_min_size=2, database_pool_max_size=4)
+        with patch('turplanlegger.database.base.config', pooled_config):
+            cls.db.init_db(cls.app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.pool.close()
+        db.destroy()
+
+    def test_threads_run_queries_concurrently(self):
+        pids = []
+
+        def query():
+            pids.append(self.db._fetchone('SELECT pg_backend_pid() AS pid, pg_sleep(0.5)', []).pid)
+
+        threads = [threading.Thread(target=query) for _ in range(4)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(time.perf_counter() - start, 1.5)
+        self.assertEqual(len(set(pids)), 4)
+
+    def test_connection_is_held_for_the_request(self):
+        with self.app.app_context():
+            first = self.db._fetchone('SELECT pg_backend_pid() AS pid', []).pid
+            second = self.db._fetchone('SELECT pg_backend_pid() AS pid', []).pid
+            self.assertEqual(first, second)
+            self.assertEqual(self.db.pool_stats()['pool_available'], self.db.pool_stats()['pool_size'] - 1)
+
+        self.assertEqual(self.db.pool_stats()['pool_available'], self.db.pool_stats()['pool_size'])
+
+    def test_pool_stats(self):
+        self.db._fetchone('SELECT 1 AS one', [])
+        stats = self.db.pool_stats()
+        self.assertEqual(stats['pool_min'], 2)
+        self.assertEqual(stats['pool_max'], 4)
+        self.assertIn('requests_num', stats)
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """EXPLAIN the lookups in Database over seeded data, with sequential
+    scans disabled a 'Seq Scan' in the plan means no index can serve it"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.owner = uuid4()
+        cls.now = datetime.datetime.now(datetime.UTC)
+
+        # One statement at a time, server-side binding can not prepare several at once
+        seed = """
+                INSERT INTO users (id, name, last_name, email, auth_method)
+                SELECT CASE WHEN i = 1 THEN %(owner)s ELSE gen_random_uuid() END,
+                    'n', 'l', 'user' || i || '@norge.no', 'basic'
+                FROM generate_series(1, 100) i;
+
+                INSERT INTO notes (owner, content, private)
+                SELECT id, 'content', FALSE FROM users, generate_series(1, 20);
+                INSERT INTO routes (owner, route)
+                SELECT id, '{}' FROM users, generate_series(1, 20);
+                INSERT INTO trips (owner, name)
+                SELECT id, 'trip' FROM users, generate_series(1, 20);
+                INSERT INTO item_lists (owner, name, private)
+                SELECT id, 'list', i %% 2 = 0 FROM users, generate_series(1, 20) i;
+
+                INSERT INTO lists_items (content, item_list, owner)
+                SELECT 'item', item_lists.id, owner FROM item_lists, generate_series(1, 10);
+                INSERT INTO trip_dates (start_time, end_time, owner, trip_id)
+                SELECT now(), now() + interval '1 day', owner, id FROM trips;
+
+                INSERT INTO note_permissions SELECT id, %(owner)s, 'READ' FROM notes WHERE id %% 7 = 0;
+                INSERT INTO route_permissions SELECT id, %(owner)s, 'READ' FROM routes WHERE id %% 7 = 0;
+                INSERT INTO trip_permissions SELECT id, %(owner)s, 'READ' FROM trips WHERE id %% 7 = 0;
+                INSERT INTO item_list_permissions SELECT id, %(owner)s, 'READ' FROM item_lists WHERE id %% 7 = 0;
+
+                ANALYZE;
+                """
+        with db._cursor() as cur:
+            for statement in seed.split(';'):
+                if statement.strip():
+                    cur.execute(statement, {'owner': cls.owner})
+
+    @classmethod
+    def tearDownClass(cls):
+        db.destroy()
+
+    def explain(self, lookup) -> str:
+        captured = []
+
+        def capture(query, vars, *args, **kwargs):
+            captured.append((query, vars))
+
+        with (
+            patch.object(db, '_fetchone', side_effect=capture),
+            patch.object(db, '_fetchall', side_effect=capture),
+            patch.object(db, '_updateone', side_effect=capture),
+        ):
+            lookup()
+
+        query, vars = captured[0]
+        with db._cursor() as cur:
+            cur.execute('SET LOCAL enable_seqscan = off')
+            cur.execute('EXPLAIN ' + query, vars)
+            return '\n'.join(row[0] for row in cur.fetchall())
+
+    def test_lookups_use_indexes(self):
+        after = (self.now, 1)
+        lookups = {
+            'get_item_list': lambda: db.get_item_list(1),
+            'get_item_list_by_owner': lambda: db.get_item_list_by_owner(self.owner, limit=10, after=after),
+            'get_public_item_lists': lambda: db.get_public_item_lists(limit=10, after=after),
+            'get_list_items': lambda: db.get_list_items(1),
+            'get_list_items_by_item_lists': lambda: db.get_list_items_by_item_lists([1, 2, 3]),
+            'delete_list_items_all': lambda: db.delete_list_items_all(1),
+            'get_item_list_all_permissions': lambda: db.get_item_list_all_permissions(1),
+            'get_item_list_permissions_by_item_lists': lambda: db.get_item_list_permissions_by_item_lists([1, 2]),
+            'get_route': lambda: db.get_route(1),
+            'get_routes_by_owner': lambda: db.get_routes_by_owner(self.owner, limit=10, after=after),
+            'get_route_all_permissions': lambda: db.get_route_all_permissions(1),
+            'get_note': lambda: db.get_note(1),
+            'get_note_by_owner': lambda: db.get_note_by_owner(self.owner, limit=10, after=after),
+            'get_note_all_permissions': lambda: db.get_note_all_permissions(1),
+            'get_user': lambda: db.get_user(self.owner),
+            'get_user_by_email': lambda: db.get_user_by('email', 'User1@norge.no'),
+            'get_trip_hydrated': lambda: db.get_trip_hydrated(1),
+            'get_trips_hydrated_by_owner': lambda: db.get_trips_hydrated_by_owner(self.owner, limit=10, after=after),
+            'get_trip_dates_by_trip': lambda: db.get_trip_dates_by_trip(1, deleted=False),
+        }
+
+        for name, lookup in lookups.items():
+            with self.subTest(name):
+                plan = self.explain(lookup)
+                self.assertNotIn('Seq Scan', plan, plan)
+
+
+class QueryLogTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.destroy()
+
+    def test_query_not_interpolated_unless_logged(self):
+        with patch.object(psycopg.ClientCursor, 'mogrify') as mogrify:
+            db.get_user(uuid4())
+        mogrify.assert_not_called()
+
+        user_id = uuid4()
+        with self.assertLogs('turplanlegger.database', 'DEBUG') as logs:
+            db.get_user(user_id)
+        self.assertRegex(logs.output[0], f'{user_id.hex}|{user_id}')
+
+    def test_slow_query_log(self):
+        user_id = uuid4()
+        with patch.object(db, 'slow_query_ms', 1e-6), self.assertLogs('turplanlegger.database.slow', 'WARNING') as logs:
+            User.find_user(user_id)
+
+        record = logs.records[0]
+        self.assertEqual(record.method, 'get_user')
+        self.assertEqual(record.caller, 'turplanlegger.models.user.find_user')
+        self.assertEqual(record.rows, 0)
+        self.assertGreater(record.duration_ms, 0)
+
+    def test_slow_query_log_disabled(self):
+        with self.assertNoLogs('turplanlegger.database.slow'):
+            User.find_user(uuid4())
+
+
+class CursorModeTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.destroy()
+
+    def test_server_cursor(self):
+        server_config = replace(config, database_cursor='server', database_prepare_threshold=1, database_pool=False)
+        with patch('turplanlegger.database.base.config', server_config):
+            database = Database()
+            database.init_db(self.app)
+
+        try:
+            self.assertIs(database.conn.cursor_factory, psycopg.Cursor)
+            self.assertEqual(database.conn.prepare_threshold, 1)
+
+            # access_level is still adapted to and from AccessLevel
+            for _ in range(3):
+                row = database._fetchone('SELECT %s::access_level AS access_level', (AccessLevel.MODIFY,))
+                self.assertIs(row.access_level, AccessLevel.MODIFY)
+        finally:
+            database.conn.close()
+
+    def test_invalid_cursor(self):
+        with patch('turplanlegger.database.base.config', replace(config, database_cursor='bogus')):
+            with self.assertRaises(RuntimeError):
+                Database().init_db(self.app)
+
+
+class UnitOfWorkTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+
+        cls.owner = User.create(
+            User(name='Ola', last_name='Nordmann', email='ola.uow@norge.no', auth_method='basic', password=b'test')
+        )
+        cls.subject = User.create(
+            User(name='Kari', last_name='Nordmann', email='kari.uow@norge.no', auth_method='basic', password=b'test')
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        db.destroy()
+
+    def test_item_list_create_is_batched(self):
+        item_list = ItemList(
+            owner=self.owner.id,
+            name='Packing list',
+            items=[ListItem(owner=self.owner.id, checked=False, content=f'item {i}') for i in range(100)],
+            items_checked=[ListItem(owner=self.owner.id, checked=True, content=f'done {i}') for i in range(20)],
+            permissions=[Permission(None, self.subject.id, AccessLevel.READ)],
+        )
+
+        with patch.object(db, '_execute', wraps=db._execute) as execute:
+            created = item_list.create()
+
+        # The list, its permissions and all of its items
+        self.assertEqual(execute.call_count, 3)
+        self.assertEqual([item.content for item in created.items], [f'item {i}' for i in range(100)])
+        self.assertEqual([item.content for item in created.items_checked], [f'done {i}' for i in range(20)])
+        self.assertEqual(created.permissions[0].object_id, created.id)
+
+        found = ItemList.find_item_list(created.id)
+        self.assertEqual([item.id for item in found.items], [item.id for item in created.items])
+        self.assertEqual([item.id for item in found.items_checked], [item.id for item in created.items_checked])
+
+    def test_trip_create_is_batched(self):
+        now = datetime.datetime.now(datetime.UTC)
+        trip = Trip(
+            owner=self.owner.id,
+            name='Trip',
+            dates=[
+                TripDate(owner=self.owner.id, start_time=now, end_time=now + datetime.timedelta(days=1))
+                for _ in range(5)
+            ],
+            permissions=[Permission(None, self.subject.id, AccessLevel.MODIFY)],
+        )
+
+        with patch.object(db, '_execute', wraps=db._execute) as execute:
+            created = trip.create()
+
+        self.assertEqual(execute.call_count, 3)
+        self.assertEqual(len(created.dates), 5)
+        self.assertTrue(all(date.trip_id == created.id for date in created.dates))
+        self.assertEqual(created.permissions[0].access_level, AccessLevel.MODIFY)
+
+    def test_unit_of_work_rolls_back(self):
+        with self.assertRaises(psycopg.errors.ForeignKeyViolation):
+            # The permission subject does not exist
+            ItemList(
+                owner=self.owner.id,
+                name='Rolled back',
+                items=[ListItem(owner=self.owner.id, checked=False, content='item')],
+                permissions=[Permission(None, uuid4(), AccessLevel.READ)],
+            ).create()
+
+        with self.assertRaises(RuntimeError):
+            with db.unit_of_work():
+                item_list = ItemList(owner=self.owner.id, name='Rolled back').create()
+                raise RuntimeError('abort')
+
+        self.assertIsNone(ItemList.find_item_list(item_list.id))
+        names = [item_list.name for item_list in ItemList.find_item_list_by_owner(self.owner.id)]
+        self.assertNotIn('Rolled back', names)
+
+
+class AsyncDatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+
+        cls.owner = User.create(
+            User(name='Ola', last_name='Nordmann', email='ola.async@norge.no', auth_method='basic', password=b'test')
+        )
+        now = datetime.datetime.now(datetime.UTC)
+        cls.trip = Trip(
+            owner=cls.owner.id,
+            name='Trip',
+            dates=[TripDate(owner=cls.owner.id, start_time=now, end_time=now + datetime.timedelta(days=1))],
+        ).create()
+        cls.item_list = ItemList(
+            owner=cls.owner.id,
+            name='List',
+            items=[ListItem(owner=cls.owner.id, checked=False, content=f'item {i}') for i in range(3)],
+        ).create()
+
+    async def asyncSetUp(self):
+        await adb.open()
+
+    async def asyncTearDown(self):
+        await adb.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.destroy()
+
+    async def test_queries_match_sync_database(self):
+        queries = [
+            ('get_user', (self.owner.id,)),
+            ('get_user_by', ('email', self.owner.email)),
+            ('get_trip_hydrated', (self.trip.id,)),
+            ('get_trips_hydrated_by_owner', (self.owner.id,)),
+            ('get_item_list', (self.item_list.id,)),
+            ('get_list_items_by_item_lists', ([self.item_list.id],)),
+            ('get_item_list_permissions_by_item_lists', ([self.item_list.id],)),
+            ('get_trip_dates_by_trip', (self.trip.id, False)),
+        ]
+        for name, args in queries:
+            with self.subTest(name):
+                self.assertEqual(await getattr(adb, name)(*args), getattr(db, name)(*args))
+
+    async def test_finders(self):
+        user = await User.find_user_async(self.owner.id)
+        self.assertEqual(user.email, self.owner.email)
+
+        trip = await Trip.find_trip_async(self.trip.id)
+        self.assertEqual(trip.serialize, Trip.find_trip(self.trip.id).serialize)
+        self.assertEqual(trip.dates[0].id, self.trip.dates[0].id)
+
+        trips = await Trip.find_trips_by_owner_async(self.owner.id, limit=1)
+        self.assertEqual([trip.id for trip in trips], [self.trip.id])
+
+    async def test_writes(self):
+        items = [ListItem(owner=self.owner.id, checked=False, item_list=self.item_list.id, content='new')] * 2
+        created = await adb.create_list_items(items)
+        self.assertEqual(len(created), 2)
+
+        imported = await adb.copy_list_items(self.item_list.id, self.owner.id, [('copied', True)])
+        self.assertEqual(len(imported), 1)
+
+        toggled = await adb.toggle_list_items_check(self.item_list.id, [imported[0].id])
+        self.assertFalse(toggled[0].checked)
+
+    async def test_unit_of_work_rolls_back(self):
+        with self.assertRaises(RuntimeError):
+            async with adb.unit_of_work():
+                rec = await adb.create_item_list(ItemList(owner=self.owner.id, name='Rolled back'))
+                # Queries in the unit of work see its writes
+                self.assertIsNotNone(await adb.get_item_list(rec.id))
+                raise RuntimeError('abort')
+
+        self.assertIsNone(await adb.get_item_list(rec.id))
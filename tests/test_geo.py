@@ -0,0 +1,392 @@
+import io
+import json
+import unittest
+import xml.etree.ElementTree as ET
+from unittest.mock import patch
+
+from turplanlegger.geo import exporter
+from turplanlegger.geo.encoding import compact, decode_coordinates, encode_coordinates, expand
+from turplanlegger.geo.history import apply, diff
+from turplanlegger.geo.importer import read_route
+from turplanlegger.geo.simplify import levels, simplify, simplify_positions, tolerance
+from turplanlegger.geo.stats import measure
+
+
+class GeoEncodingTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        geometries = [
+            [[11.615295, 60.603483], [11.638641, 60.612921], [-179.999999, -89.5]],
+            [[11.615295, 60.603483, 412.5], [11.638641, 60.612921, -3.25]],
+            [[[0, 0], [1, 0], [1, 1], [0, 0]], [], [[0.25, 0.25], [0.5, 0.5], [0.25, 0.25]]],
+            [[[[5, 5], [6, 6], [5, 5]]], [[[1, 2], [3, 4], [1, 2]], [[0, 0], [1, 1]]]],
+        ]
+        for coordinates in geometries:
+            with self.subTest(coordinates=coordinates):
+                encoded = encode_coordinates(coordinates)
+                self.assertIsInstance(encoded, str)
+                self.assertEqual(decode_coordinates(encoded), coordinates)
+
+    def test_quantization(self):
+        decoded = decode_coordinates(encode_coordinates([[10.1234567, 59.9876543, 100.12345]]))
+        self.assertEqual(decoded, [[10.123457, 59.987654, 100.123]])
+
+    def test_not_encoded(self):
+        for coordinates in (
+            [11.615295, 60.603483],
+            [],
+            [[]],
+            [[1, 2], [1, 2, 3]],
+            [[1, 2, 3, 4]],
+            [[1, '2']],
+            [[1, True]],
+            [[1e10, 0]],
+            [[float('nan'), 0]],
+            [[[1, 2]], [1, 2]],
+        ):
+            with self.subTest(coordinates=coordinates):
+                self.assertIsNone(encode_coordinates(coordinates))
+
+    def test_decode_invalid(self):
+        for encoded in ('', 'not base64!', 'bm90IGNvbXBhY3Q='):
+            with self.subTest(encoded=encoded), self.assertRaises(ValueError):
+                decode_coordinates(encoded)
+
+    def test_compact_geojson(self):
+        geojson = {
+            'type': 'FeatureCollection',
+            'features': [
+                {
+                    'type': 'Feature',
+                    'properties': {'name': 'Tur'},
+                    'geometry': {'type': 'LineString', 'coordinates': [[11.6, 60.6], [11.7, 60.7]]},
+                },
+                {
+                    'type': 'Feature',
+                    'properties': {},
+                    'geometry': {
+                        'type': 'GeometryCollection',
+                        'geometries': [
+                            {'type': 'Point', 'coordinates': [11.6, 60.6]},
+                            {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [0, 0]]]},
+                        ],
+                    },
+                },
+            ],
+        }
+
+        compacted = compact(geojson)
+        features = compacted['features']
+        self.assertIsInstance(features[0]['geometry']['coordinates'], str)
+        self.assertEqual(features[1]['geometry']['geometries'][0]['coordinates'], [11.6, 60.6])
+        self.assertIsInstance(features[1]['geometry']['geometries'][1]['coordinates'], str)
+        self.assertEqual(features[0]['properties'], {'name': 'Tur'})
+
+        self.assertEqual(expand(compacted), geojson)
+        self.assertEqual(compact(compacted), compacted)
+        self.assertEqual(expand(geojson), geojson)
+
+
+class GeoHistoryTestCase(unittest.TestCase):
+    def test_diff_apply(self):
+        # As expanded from storage, quantized to the precision kept by the encoding
+        track = [[round(11.0 + i / 1000, 6), round(60.0 + i / 2000, 6)] for i in range(1000)]
+        line = {'type': 'LineString', 'coordinates': track}
+        edits = {
+            'insert': track[:10] + [[1.0, 2.0]] + track[10:],
+            'delete': track[:500] + track[510:],
+            'replace': track[:100] + [[1.0, 2.0], [3.0, 4.0]] + track[101:900] + [[5.0, 6.0]] + track[901:],
+            'append': track + [[7.0, 8.0]],
+            'truncate': track[:-1],
+            'rewrite': [[1.0, 2.0], [3.0, 4.0]],
+        }
+        for name, coordinates in edits.items():
+            with self.subTest(name):
+                edited = {'type': 'LineString', 'coordinates': coordinates}
+                patch = diff(edited, line)
+                self.assertEqual(apply(edited, patch), line)
+                self.assertEqual(apply(line, diff(line, edited)), edited)
+                if name != 'rewrite':
+                    self.assertIn('edits', patch['geometries'][0])
+
+        self.assertEqual(diff(line, line), {})
+        self.assertEqual(apply(line, {}), line)
+
+    def test_diff_apply_structure(self):
+        polygon = {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]}
+        feature = {'type': 'Feature', 'properties': {'name': 'Tur'}, 'geometry': polygon}
+        collection = {'type': 'FeatureCollection', 'features': [feature, feature]}
+
+        moved = {**polygon, 'coordinates': [[[0, 0], [2, 0], [2, 2], [0, 0]]]}
+        changed = {**collection, 'features': [feature, {**feature, 'geometry': moved}]}
+        patch = diff(changed, collection)
+        self.assertEqual(patch['geometries'][0], None)
+        self.assertIn('coordinates', patch['geometries'][1])
+        self.assertEqual(apply(changed, patch), collection)
+
+        renamed = {**collection, 'features': [feature, {**feature, 'properties': {'name': 'Ny tur'}}]}
+        patch = diff(renamed, collection)
+        self.assertIn('document', patch)
+        self.assertEqual(apply(renamed, patch), collection)
+
+
+class GeoSimplifyTestCase(unittest.TestCase):
+    def test_simplify_positions(self):
+        line = [[0, 0], [1, 0.05], [2, -0.05], [3, 1], [4, 0.1], [5, 0]]
+        self.assertEqual(simplify_positions(line, 0.1), [[0, 0], [2, -0.05], [3, 1], [4, 0.1], [5, 0]])
+        self.assertEqual(simplify_positions(line, 0.5), [[0, 0], [2, -0.05], [3, 1], [5, 0]])
+        self.assertEqual(simplify_positions(line, 0.01), line)
+        self.assertEqual(simplify_positions(line, 2), [[0, 0], [5, 0]])
+        self.assertEqual(simplify_positions(line[:2], 2), line[:2])
+
+        # Positions past the ends of the segment are measured from the nearest end
+        self.assertEqual(simplify_positions([[0, 0], [3, 0], [1, 0]], 1), [[0, 0], [3, 0], [1, 0]])
+
+    def test_simplify_geometries(self):
+        ring = [[0, 0], [1, 0.01], [2, 0], [2, 2], [0, 2], [0, 0]]
+        polygon = {'type': 'Polygon', 'coordinates': [ring, [[0.5, 0.5], [0.6, 0.5], [0.5, 0.6], [0.5, 0.5]]]}
+        feature = {'type': 'Feature', 'properties': {}, 'geometry': polygon}
+        point = {'type': 'Point', 'coordinates': [1.0, 2.0]}
+
+        simplified = simplify({'type': 'GeometryCollection', 'geometries': [polygon, point]}, 0.5)
+        rings = simplified['geometries'][0]['coordinates']
+        self.assertEqual(rings[0], [[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]])
+        # Not below 4 positions
+        self.assertEqual(rings[1], polygon['coordinates'][1])
+        self.assertEqual(simplified['geometries'][1], point)
+        self.assertEqual(simplify(feature, 0.5)['properties'], {})
+
+    def test_levels(self):
+        track = [[11.0 + i * 1e-4, 60.0 + (i % 7) * 1e-5 + (i // 100) * 1e-3] for i in range(1000)]
+        versions = levels({'type': 'LineString', 'coordinates': track})
+        self.assertEqual(list(versions), ['14', '11', '8'])
+        counts = [len(expand(version)['coordinates']) for version in versions.values()]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertLess(counts[0], len(track))
+
+        self.assertEqual(levels({'type': 'LineString', 'coordinates': [[11.0, 60.0], [11.1, 60.1]]}), {})
+        self.assertGreater(tolerance(8), tolerance(14))
+
+
+class GeoStatsTestCase(unittest.TestCase):
+    def test_measure_line(self):
+        oslo, bergen, trondheim = [10.752245, 59.913868], [5.32205, 60.39299], [10.39506, 63.43049]
+        stats = measure({'type': 'LineString', 'coordinates': [oslo, bergen, trondheim]})
+
+        self.assertAlmostEqual(stats.length, 305_000 + 429_500, delta=1_000)
+        self.assertEqual(stats.segment_lengths, (stats.length,))
+        self.assertEqual(stats.bbox, (5.32205, 59.913868, 10.752245, 63.43049))
+        self.assertEqual(stats.points, 3)
+        # Weighted by length, closer to the middle of Bergen to Trondheim
+        self.assertGreater(stats.centroid[1], 61.0)
+
+        stats = measure({'type': 'LineString', 'coordinates': encode_coordinates([oslo, bergen])})
+        self.assertAlmostEqual(stats.length, 305_000, delta=1_000)
+
+    def test_measure_geometries(self):
+        ring = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+        collection = {
+            'type': 'FeatureCollection',
+            'features': [
+                {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Polygon', 'coordinates': [ring]}},
+                {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'MultiPoint', 'coordinates': [[5, 5]]}},
+            ],
+        }
+        stats = measure(collection)
+        self.assertEqual(len(stats.segment_lengths), 1)
+        self.assertAlmostEqual(stats.length, 4 * 111_195, delta=100)
+        self.assertEqual(stats.bbox, (0.0, 0.0, 5.0, 5.0))
+        self.assertAlmostEqual(stats.centroid[0], 0.5)
+        self.assertEqual(stats.points, 6)
+
+        stats = measure({'type': 'Point', 'coordinates': [1, 2]})
+        self.assertEqual((stats.length, stats.centroid, stats.segment_lengths), (0.0, (1.0, 2.0), ()))
+
+        stats = measure({'type': 'LineString', 'coordinates': []})
+        self.assertEqual((stats.bbox, stats.centroid, stats.points), (None, None, 0))
+
+
+GPX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="test">
+  <metadata><name>Sommer</name></metadata>
+  <wpt lat="60.5" lon="11.5"><name>Hytta</name></wpt>
+  <trk>
+    <name>Mj\xc3\xb8sa rundt</name>
+    <trkseg>
+      <trkpt lat="60.603483" lon="11.615295"><ele>412.5</ele><time>2024-06-01T10:00:00Z</time></trkpt>
+      <trkpt lat="60.612921" lon="11.638641"><ele>420</ele></trkpt>
+    </trkseg>
+    <trkseg><trkpt lat="60.6" lon="11.7"><ele>1</ele></trkpt></trkseg>
+    <trkseg>
+      <trkpt lat="60.613258" lon="11.6819"><ele>431.25</ele></trkpt>
+      <trkpt lat="60.601797" lon="11.697693"><ele>400</ele></trkpt>
+    </trkseg>
+  </trk>
+</gpx>
+"""
+
+
+class GeoImporterTestCase(unittest.TestCase):
+    def test_read_gpx(self):
+        for chunk_size in (1, 7, 4096):
+            route, name = read_route(io.BytesIO(GPX), 'application/gpx+xml', chunk_size)
+            self.assertEqual(name, 'Mjøsa rundt')
+            # The segment of one position is left out
+            self.assertEqual(
+                expand(route),
+                {
+                    'type': 'MultiLineString',
+                    'coordinates': [
+                        [[11.615295, 60.603483, 412.5], [11.638641, 60.612921, 420.0]],
+                        [[11.6819, 60.613258, 431.25], [11.697693, 60.601797, 400.0]],
+                    ],
+                },
+            )
+
+        # Elevation is left out unless every position has one
+        gpx = b'<gpx><rte><rtept lat="60" lon="11"><ele>3</ele></rtept><rtept lat="61" lon="12"/></rte></gpx>'
+        route, name = read_route(io.BytesIO(gpx), 'application/gpx+xml')
+        self.assertEqual(expand(route), {'type': 'LineString', 'coordinates': [[11.0, 60.0], [12.0, 61.0]]})
+        self.assertIsNone(name)
+
+    def test_read_geojson(self):
+        collection = {
+            'type': 'FeatureCollection',
+            'features': [
+                {
+                    'type': 'Feature',
+                    'properties': {'name': 'Tur "1"\n', 'tags': ['å', None, True, 1.5e3, -2]},
+                    'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]},
+                },
+                {'type': 'Feature', 'properties': None, 'geometry': {'type': 'Point', 'coordinates': [10.5, 60]}},
+                {
+                    'type': 'Feature',
+                    'properties': {},
+                    'geometry': {
+                        'type': 'MultiLineString',
+                        'coordinates': [[[11.1, 60.1, 100], [11.2, 60.2, 101.5]], [], [[12, 61, 0], [12, 61, -1]]],
+                    },
+                },
+            ],
+        }
+        document = json.dumps(collection, indent=2, ensure_ascii=False).encode('utf-8')
+        for chunk_size in (1, 5, 4096):
+            route, name = read_route(io.BytesIO(document), 'application/geo+json', chunk_size)
+            self.assertEqual(route, compact(collection))
+            self.assertIsNone(name)
+
+        feature = {'type': 'Feature', 'properties': {'name': 'Tur'}, 'geometry': collection['features'][1]['geometry']}
+        self.assertEqual(
+            read_route(io.BytesIO(json.dumps(feature).encode('utf-8')), 'application/json'), (feature, 'Tur')
+        )
+
+    def test_read_invalid(self):
+        for document, mimetype, error in (
+            (b'<gpx/>', 'text/plain', 'Content-Type must be one of'),
+            (b'<gpx><trk><trkseg>', 'application/gpx+xml', 'GPX is not valid XML'),
+            (b'<kml></kml>', 'application/gpx+xml', 'document is not GPX'),
+            (b'<gpx><wpt lat="60" lon="11"/></gpx>', 'application/gpx+xml', 'GPX has no tracks or routes'),
+            (
+                b'<gpx><rte><rtept lat="60"/><rtept lat="60" lon="1"/></rte></gpx>',
+                'application/gpx+xml',
+                'GPX positions must',
+            ),
+            (
+                b'<gpx><rte><rtept lat="95" lon="1"/><rtept lat="60" lon="1"/></rte></gpx>',
+                'application/gpx+xml',
+                'GPX has positions out of range',
+            ),
+            (b'{"type": "LineString", "coordinates": [[1, 2], [3, 4]]', 'application/geo+json', 'GeoJSON ends before'),
+            (b'{"type": "Point", "coordinates": [1, 2]} {}', 'application/geo+json', 'GeoJSON has data after'),
+            (b'{"type": "Point" "coordinates": [1, 2]}', 'application/geo+json', 'GeoJSON is not valid JSON'),
+            (b'[{"type": "Point"}]', 'application/geo+json', 'GeoJSON must be an object with a type'),
+            (
+                b'{"type": "LineString", "coordinates": [[1, 2], [1, 2, 3]]}',
+                'application/geo+json',
+                'GeoJSON positions of',
+            ),
+            (
+                b'{"type": "LineString", "coordinates": [[1, 2, 3, 4]]}',
+                'application/geo+json',
+                'GeoJSON positions must have',
+            ),
+            (
+                b'{"type": "LineString", "coordinates": [[]]}',
+                'application/geo+json',
+                'GeoJSON geometries must have positions',
+            ),
+            (
+                b'{"type": "LineString", "coordinates": [[1e10, 1]]}',
+                'application/geo+json',
+                'GeoJSON has positions out of',
+            ),
+            (b'{"a": ' * 100 + b'1' + b'}' * 100, 'application/geo+json', 'GeoJSON is nested too deep'),
+        ):
+            with self.subTest(document=document[:40]):
+                with self.assertRaises(ValueError) as context:
+                    read_route(io.BytesIO(document), mimetype, 3)
+                self.assertTrue(str(context.exception).startswith(error), str(context.exception))
+
+
+class GeoExporterTestCase(unittest.TestCase):
+    line = {'type': 'LineString', 'coordinates': [[11.0, 60.0, 100.5], [11.1, 60.1, 101.0], [11.2, 60.2, 99.0]]}
+    collection = {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'properties': {'name': 'Topp', 'ele': 1},
+                'geometry': {'type': 'Point', 'coordinates': [9, 61]},
+            },
+            {
+                'type': 'Feature',
+                'properties': None,
+                'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]},
+            },
+        ],
+    }
+
+    def test_geojson(self):
+        routes = [({'id': 1, 'name': 'Tur & retur'}, self.line), ({'id': 2, 'name': None}, self.collection)]
+        with patch.object(exporter, 'BATCH_SIZE', 2):
+            document = json.loads(''.join(exporter.export(routes, 'geojson')))
+            lines = ''.join(exporter.export(routes, 'ndjson')).splitlines()
+
+        self.assertEqual(document['type'], 'FeatureCollection')
+        self.assertEqual(
+            document['features'],
+            [
+                {'type': 'Feature', 'geometry': self.line, 'properties': {'id': 1, 'name': 'Tur & retur'}},
+                {**self.collection['features'][0], 'properties': {'name': None, 'ele': 1, 'id': 2}},
+                {**self.collection['features'][1], 'properties': {'id': 2, 'name': None}},
+            ],
+        )
+        self.assertEqual([json.loads(line) for line in lines], document['features'])
+        self.assertEqual(
+            json.loads(''.join(exporter.export([], 'geojson'))), {'type': 'FeatureCollection', 'features': []}
+        )
+
+    def test_gpx(self):
+        routes = [({'id': 1, 'name': 'Tur & retur', 'comment': '<3'}, self.line), ({'id': 2}, self.collection)]
+        with patch.object(exporter, 'BATCH_SIZE', 2):
+            document = ''.join(exporter.export(routes, 'gpx'))
+
+        root = ET.fromstring(document)
+        ns = {'gpx': 'http://www.topografix.com/GPX/1/1'}
+        tracks = root.findall('gpx:trk', ns)
+        self.assertEqual(len(tracks), 2)
+        self.assertEqual(tracks[0].findtext('gpx:name', namespaces=ns), 'Tur & retur')
+        self.assertEqual(tracks[0].findtext('gpx:desc', namespaces=ns), '<3')
+        points = tracks[0].findall('gpx:trkseg/gpx:trkpt', ns)
+        self.assertEqual(
+            [
+                [float(point.get('lon')), float(point.get('lat')), float(point.findtext('gpx:ele', namespaces=ns))]
+                for point in points
+            ],
+            self.line['coordinates'],
+        )
+        # The point is left out, the ring is a segment
+        self.assertEqual(len(tracks[1].findall('gpx:trkseg/gpx:trkpt', ns)), 4)
+
+        # Exported GPX imports as it was
+        document = ''.join(exporter.export(routes[:1], 'gpx')).encode('utf-8')
+        self.assertEqual(read_route(io.BytesIO(document), 'application/gpx+xml'), (compact(self.line), 'Tur & retur'))
@@ -1,8 +1,11 @@
 import json
 import unittest
+from unittest.mock import patch
 
 from turplanlegger.app import create_app, db
 from turplanlegger.auth.utils import hash_password
+from turplanlegger.models.item_lists import ItemList
+from turplanlegger.models.list_items import ListItem
 from turplanlegger.models.user import User
 
 
@@ -269,6 +272,65 @@ class ItemListsTestCase(unittest.TestCase):
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(data['item_list']['name'], 'new list name')
 
+    def test_get_list_not_modified(self):
+        response = self.client.post('/item_lists', data=json.dumps(self.empty_item_list), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        list_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.get(f'/item_lists/{list_id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = self.client.get(f'/item_lists/{list_id}', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(f'/item_lists/{list_id}', headers={**self.user2_headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 404)
+
+        # Adding items changes the list they are in
+        response = self.client.patch(
+            f'/item_lists/{list_id}/add', data=json.dumps(self.item_to_add), headers=self.headers_json
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/item_lists/{list_id}', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['item_list']['items']), 2)
+
+    def test_rename_list_if_match(self):
+        response = self.client.post('/item_lists', data=json.dumps(self.item_list), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        list_id = data['id']
+        item_id = data['item_list']['items'][0]['id']
+        etag = self.client.get(f'/item_lists/{list_id}', headers=self.headers).headers['ETag']
+
+        response = self.client.patch(
+            f'/item_lists/{list_id}/toggle_check',
+            data=json.dumps({'toggle_items': [item_id]}),
+            headers={**self.headers_json, 'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.patch(
+            f'/item_lists/{list_id}/rename',
+            data=json.dumps({'name': 'new list name'}),
+            headers={**self.headers_json, 'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 412)
+
+        response = self.client.get(f'/item_lists/{list_id}', headers=self.headers)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['item_list']['name'], self.item_list['name'])
+
+        response = self.client.patch(
+            f'/item_lists/{list_id}/rename',
+            data=json.dumps({'name': 'new list name'}),
+            headers={**self.headers_json, 'If-Match': response.headers['ETag']},
+        )
+        self.assertEqual(response.status_code, 200)
+
     def test_change_list_owner(self):
         response = self.client.post('/item_lists', data=json.dumps(self.empty_item_list), headers=self.headers_json)
         self.assertEqual(response.status_code, 201)
@@ -301,12 +363,20 @@ class ItemListsTestCase(unittest.TestCase):
             create_data['item_list']['items_checked'][0]['id'],
         ]
 
-        response = self.client.patch(
-            f'/item_lists/{list_id}/toggle_check',
-            data=json.dumps({'toggle_items': toggle_list_items}),
-            headers=self.headers_json,
-        )
+        with patch.object(db, 'toggle_list_items_check', wraps=db.toggle_list_items_check) as toggle:
+            response = self.client.patch(
+                f'/item_lists/{list_id}/toggle_check',
+                data=json.dumps({'toggle_items': toggle_list_items}),
+                headers=self.headers_json,
+            )
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(toggle.call_count, 1)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(
+            [(item['id'], item['checked']) for item in data['items']],
+            [(toggle_list_items[0], True), (toggle_list_items[1], False)],
+        )
 
         response = self.client.get(f'/item_lists/{list_id}', headers=self.headers)
         self.assertEqual(response.status_code, 200)
@@ -317,10 +387,36 @@ class ItemListsTestCase(unittest.TestCase):
         self.assertEqual(data['item_list']['items'][1]['content'], self.item_list['items'][2]['content'])
         self.assertEqual(data['item_list']['items'][2]['content'], self.item_list['items_checked'][0]['content'])
         self.assertEqual(len(data['item_list']['items_checked']), 2)
+        self.assertEqual(data['item_list']['items_checked'][0]['content'], self.item_list['items'][0]['content'])
         self.assertEqual(
-            data['item_list']['items_checked'][0]['content'], self.item_list['items_checked'][1]['content']
+            data['item_list']['items_checked'][1]['content'], self.item_list['items_checked'][1]['content']
         )
-        self.assertEqual(data['item_list']['items_checked'][1]['content'], self.item_list['items'][0]['content'])
+
+    def test_toggle_check_invalid(self):
+        response = self.client.post('/item_lists', data=json.dumps(self.item_list), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        list_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.post('/item_lists', data=json.dumps(self.item_list), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        other_item_id = json.loads(response.data.decode('utf-8'))['item_list']['items'][0]['id']
+
+        for toggle_items in ([], ['1'], [True], 1):
+            response = self.client.patch(
+                f'/item_lists/{list_id}/toggle_check',
+                data=json.dumps({'toggle_items': toggle_items}),
+                headers=self.headers_json,
+            )
+            self.assertEqual(response.status_code, 400, toggle_items)
+
+        # Items of another list are not toggled
+        response = self.client.patch(
+            f'/item_lists/{list_id}/toggle_check',
+            data=json.dumps({'toggle_items': [other_item_id]}),
+            headers=self.headers_json,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ListItem.find_list_item(other_item_id).checked)
 
     def test_get_my_list(self):
         response = self.client.post('/item_lists', data=json.dumps(self.item_list), headers=self.headers_json)
@@ -371,6 +467,22 @@ class ItemListsTestCase(unittest.TestCase):
         self.assertEqual(data['item_list'][1]['items_checked'][0]['owner'], data['item_list'][1]['owner'])
         self.assertEqual(data['item_list'][1]['items_checked'][0]['item_list'], data['item_list'][1]['id'])
 
+    def test_get_my_lists_query_count(self):
+        for _ in range(5):
+            response = self.client.post('/item_lists', data=json.dumps(self.item_list), headers=self.headers_json)
+            self.assertEqual(response.status_code, 201)
+
+        with patch.object(db, '_fetchall', wraps=db._fetchall) as fetchall:
+            item_lists = ItemList.find_item_list_by_owner(self.user1.id)
+
+        # Lists, items and permissions
+        self.assertEqual(fetchall.call_count, 3)
+        self.assertEqual(len(item_lists), 5)
+        for item_list in item_lists:
+            self.assertEqual(len(item_list.items), len(self.item_list['items']))
+            self.assertEqual(len(item_list.items_checked), len(self.item_list['items_checked']))
+            self.assertTrue(all(item.item_list == item_list.id for item in item_list.items + item_list.items_checked))
+
     def test_get_all_public_list(self):
         # User1
         response = self.client.post('/item_lists', data=json.dumps(self.item_list), headers=self.headers_json)
@@ -422,3 +534,91 @@ class ItemListsTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(data['count'], 2)
+
+    def test_get_public_lists_paginated(self):
+        for _ in range(3):
+            response = self.client.post(
+                '/item_lists', data=json.dumps(self.item_list_public), headers=self.headers_json
+            )
+            self.assertEqual(response.status_code, 201)
+
+        response = self.client.get('/item_lists/public?limit=2', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([item_list['id'] for item_list in data['item_list']], [1, 2])
+        self.assertIsNotNone(data['next_cursor'])
+
+        response = self.client.get(f'/item_lists/public?limit=2&cursor={data["next_cursor"]}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([item_list['id'] for item_list in data['item_list']], [3])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_import_items(self):
+        response = self.client.post('/item_lists', data=json.dumps(self.empty_item_list), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        item_list_id = json.loads(response.data.decode('utf-8'))['id']
+
+        bodies = {
+            'application/json': json.dumps([{'content': f'item {i}', 'checked': i % 2 == 0} for i in range(4)]),
+            'application/x-ndjson': '\n'.join(
+                json.dumps({'content': f'item {i}', 'checked': i % 2 == 0}) for i in range(4, 8)
+            ),
+            'text/csv': 'content,checked\n' + ''.join(f'"item {i}",{i % 2 == 0}\n' for i in range(8, 12)),
+        }
+        ids = []
+        for content_type, body in bodies.items():
+            response = self.client.post(
+                f'/item_lists/{item_list_id}/import',
+                data=body,
+                headers={**self.headers, 'Content-type': content_type},
+            )
+            self.assertEqual(response.status_code, 201, content_type)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['count'], 4)
+            ids.extend(data['ids'])
+
+        response = self.client.get(f'/item_lists/{item_list_id}', headers=self.headers)
+        data = json.loads(response.data.decode('utf-8'))['item_list']
+        items = sorted(data['items'] + data['items_checked'], key=lambda item: item['id'])
+        self.assertEqual([item['id'] for item in items], ids)
+        self.assertEqual([item['content'] for item in items], [f'item {i}' for i in range(12)])
+        self.assertEqual([item['checked'] for item in items], [i % 2 == 0 for i in range(12)])
+
+    def test_import_items_invalid(self):
+        response = self.client.post('/item_lists', data=json.dumps(self.empty_item_list), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        item_list_id = json.loads(response.data.decode('utf-8'))['id']
+
+        body = '\n'.join(json.dumps({'content': 'item'}) for _ in range(3)) + '\n' + json.dumps({'content': 'x' * 513})
+        response = self.client.post(
+            f'/item_lists/{item_list_id}/import',
+            data=body,
+            headers={**self.headers, 'Content-type': 'application/x-ndjson'},
+        )
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['detail'], "record 4: 'content' is too long")
+
+        # Nothing was imported
+        response = self.client.get(f'/item_lists/{item_list_id}', headers=self.headers)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['item_list']['items'], [])
+
+        response = self.client.post(
+            f'/item_lists/{item_list_id}/import',
+            data='content,checked\nitem,maybe\n',
+            headers={**self.headers, 'Content-type': 'text/csv'},
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            f'/item_lists/{item_list_id}/import', data='item', headers={**self.headers, 'Content-type': 'text/plain'}
+        )
+        self.assertEqual(response.status_code, 415)
+
+        response = self.client.post(
+            f'/item_lists/{item_list_id}/import',
+            data=json.dumps([{'content': 'item'}]),
+            headers={**self.user2_headers, 'Content-type': 'application/json'},
+        )
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,77 @@
+import json
+import unittest
+from datetime import UTC, date, datetime
+from uuid import uuid4
+
+from flask.json.provider import DefaultJSONProvider
+
+from turplanlegger.app import create_app, db
+from turplanlegger.auth.utils import hash_password
+from turplanlegger.models.access_level import AccessLevel
+from turplanlegger.models.permission import Permission
+from turplanlegger.models.user import User
+from turplanlegger.utils.json_provider import UJSONProvider
+
+
+class JSONProviderTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.client = cls.app.test_client()
+
+        cls.user = User.create(
+            User(
+                name='Ola',
+                last_name='Nordmann',
+                email='ola.json@norge.no',
+                auth_method='basic',
+                password=hash_password('test'),
+            )
+        )
+        response = cls.client.post(
+            '/login',
+            data=json.dumps({'email': cls.user.email, 'password': 'test'}),
+            headers={'Content-type': 'application/json'},
+        )
+        if response.status_code != 200:
+            raise RuntimeError('Failed to login')
+        cls.token = json.loads(response.data.decode('utf-8'))['token']
+
+    @classmethod
+    def tearDownClass(cls):
+        db.destroy()
+
+    def test_provider_is_used(self):
+        self.assertIsInstance(self.app.json, UJSONProvider)
+
+    def test_same_as_default_provider(self):
+        obj = {
+            'id': uuid4(),
+            'create_time': datetime.now(UTC),
+            'date': date.today(),
+            'access_level': AccessLevel.MODIFY,
+            'permission': Permission(1, uuid4(), AccessLevel.READ),
+            'permissions': [Permission(2, uuid4(), AccessLevel.DELETE)],
+            'name': 'Tur på Rondane/Smuksjøseter',
+            'route': {'type': 'LineString', 'coordinates': [[11.615295, 60.603483], [11.638641, 60.612921]]},
+            'nothing': None,
+        }
+
+        self.assertEqual(
+            json.loads(self.app.json.dumps(obj)),
+            json.loads(DefaultJSONProvider(self.app).dumps(obj)),
+        )
+
+    def test_unserializable(self):
+        with self.assertRaises(TypeError):
+            self.app.json.dumps({'object': object()})
+
+    def test_request_json(self):
+        headers = {'Content-type': 'application/json', 'Authorization': f'Bearer {self.token}'}
+
+        response = self.client.post('/notes', data=json.dumps({'content': 'Blåbær'}), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['content'], 'Blåbær')
+
+        response = self.client.post('/notes', data='{"content": ', headers=headers)
+        self.assertEqual(response.status_code, 400)
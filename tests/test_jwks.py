@@ -0,0 +1,223 @@
+import json
+import threading
+import time
+import unittest
+from datetime import UTC, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from uuid import uuid4
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from turplanlegger.app import create_app, db
+from turplanlegger.auth.utils import hash_password
+from turplanlegger.models.user import User
+from turplanlegger.utils.config import config
+from turplanlegger.utils.jwks import JwksCache
+
+
+class StubJwksHandler(BaseHTTPRequestHandler):
+    """Serves `server.jwks` with `server.cache_control` and counts the requests"""
+
+    def do_GET(self):
+        self.server.requests += 1
+        body = json.dumps(self.server.jwks).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.server.cache_control:
+            self.send_header('Cache-Control', self.server.cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def public_jwk(private_key, kid: str) -> dict:
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid=kid, use='sig')
+    return jwk
+
+
+class JwksTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.client = cls.app.test_client()
+
+        cls.key1 = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.key2 = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubJwksHandler)
+        cls.server.jwks = {'keys': []}
+        cls.server.cache_control = None
+        cls.server.requests = 0
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/keys'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.http_client = httpx.Client()
+
+    def setUp(self):
+        self.server.jwks = {'keys': [public_jwk(self.key1, 'kid1')]}
+        self.server.cache_control = 'public, max-age=3600'
+        self.server.requests = 0
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.http_client.close()
+        db.destroy()
+
+    def cache(self) -> JwksCache:
+        return JwksCache(url=self.url, http_client=self.http_client)
+
+    def test_keys_are_fetched_once(self):
+        cache = self.cache()
+
+        for _ in range(5):
+            key = cache.get_key('kid1')
+
+        self.assertIsInstance(key, rsa.RSAPublicKey)
+        self.assertEqual(self.server.requests, 1)
+        self.assertAlmostEqual(cache.expires_at - cache.fetched_at, 3600)
+
+    def test_max_age_missing(self):
+        self.server.cache_control = None
+        cache = self.cache()
+
+        cache.get_key('kid1')
+
+        self.assertAlmostEqual(cache.expires_at - cache.fetched_at, config.azure_ad_b2c_key_cache_time)
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        cache = self.cache()
+        self.assertIsNotNone(cache.get_key('kid1'))
+
+        # Keys were just fetched, unknown kid does not fetch again
+        self.assertIsNone(cache.get_key('kid2'))
+        self.assertEqual(self.server.requests, 1)
+
+        self.server.jwks['keys'].append(public_jwk(self.key2, 'kid2'))
+        cache.min_refresh_interval = 0
+        self.assertIsInstance(cache.get_key('kid2'), rsa.RSAPublicKey)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_no_refresh_for_local_kid(self):
+        cache = self.cache()
+        cache.min_refresh_interval = 0
+        cache.get_key('kid1')
+
+        self.assertIsNone(cache.get_key(config.secret_key_id, refresh_unknown=False))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_background_refresh(self):
+        cache = self.cache()
+        cache.get_key('kid1')
+        cache.min_refresh_interval = 0
+        cache.refresh_at = time.monotonic()
+
+        self.server.jwks = {'keys': [public_jwk(self.key2, 'kid2')]}
+        # The cached key is served while the refresh runs
+        self.assertIsNotNone(cache.get_key('kid1', refresh_unknown=False))
+        cache._refresher.join(timeout=5)
+
+        self.assertEqual(self.server.requests, 2)
+        self.assertIsNone(cache.get_key('kid1', refresh_unknown=False))
+        self.assertIsInstance(cache.get_key('kid2'), rsa.RSAPublicKey)
+
+    def test_expired_keys_are_refreshed(self):
+        cache = self.cache()
+        cache.get_key('kid1')
+        cache.min_refresh_interval = 0
+        cache.expires_at = time.monotonic()
+
+        cache.get_key('kid1')
+
+        self.assertEqual(self.server.requests, 2)
+
+    def test_failed_refresh_backs_off(self):
+        cache = JwksCache(url='http://127.0.0.1:1/keys', http_client=self.http_client)
+
+        with patch.object(self.http_client, 'get', wraps=self.http_client.get) as get:
+            for _ in range(3):
+                self.assertIsNone(cache.get_key('kid1'))
+
+        self.assertEqual(get.call_count, 1)
+
+    def test_local_token_skips_jwks(self):
+        user = User.create(
+            User(
+                name='Ola',
+                last_name='Nordmann',
+                email='ola.local@norge.no',
+                auth_method='basic',
+                password=hash_password('test'),
+            )
+        )
+        cache = JwksCache(url='http://127.0.0.1:1/keys', http_client=self.http_client)
+
+        with patch.object(self.app, 'jwks', cache):
+            response = self.client.post(
+                '/login',
+                data=json.dumps({'email': user.email, 'password': 'test'}),
+                headers={'Content-type': 'application/json'},
+            )
+            self.assertEqual(response.status_code, 200)
+            token = json.loads(response.data.decode('utf-8'))['token']
+
+            response = self.client.get('/whoami', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 200)
+
+        self.assertIsNone(cache.attempted_at)
+
+    def b2c_token(self, email: str) -> str:
+        now = datetime.now(UTC)
+        return jwt.encode(
+            {
+                'sub': str(uuid4()),
+                'aud': config.audience,
+                'exp': now + timedelta(minutes=5),
+                'nbf': now,
+                'iat': now,
+                'given_name': 'Ola',
+                'family_name': 'Nordmann',
+                'emails': [email],
+            },
+            key=self.key1,
+            algorithm='RS256',
+            headers={'kid': 'kid1'},
+        )
+
+    def test_b2c_token(self):
+        token = self.b2c_token('ola.b2c@norge.no')
+
+        with patch.object(self.app, 'jwks', self.cache()):
+            for _ in range(3):
+                response = self.client.get('/whoami', headers={'Authorization': f'Bearer {token}'})
+                self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['user']['email'], 'ola.b2c@norge.no')
+        self.assertEqual(self.server.requests, 1)
+
+    def test_b2c_signup_email_taken(self):
+        User.create(
+            User(
+                name='Ola',
+                last_name='Nordmann',
+                email='Ola.Taken@norge.no',
+                auth_method='basic',
+                password=hash_password('test'),
+            )
+        )
+        token = self.b2c_token('ola.taken@norge.no')
+
+        with patch.object(self.app, 'jwks', self.cache()):
+            response = self.client.get('/whoami', headers={'Authorization': f'Bearer {token}'})
+
+        self.assertEqual(response.status_code, 409)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['detail'], 'A user with this email already exists')
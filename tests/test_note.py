@@ -255,6 +255,69 @@ class NotesTestCase(unittest.TestCase):
         self.assertEqual(data['note']['name'], 'newname')
         self.assertEqual(data['note']['content'], 'newcontent')
 
+    def test_get_note_not_modified(self):
+        response = self.client.post('/notes', data=json.dumps(self.note_full), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        note_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.get(f'/notes/{note_id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        response = self.client.get(f'/notes/{note_id}', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.data, b'')
+
+        # Private notes are not found by others, with or without the ETag
+        response = self.client.get(f'/notes/{note_id}', headers={**self.headers2, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.put(
+            f'/notes/{note_id}', data=json.dumps({'content': 'newcontent'}), headers=self.headers_json
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+        response = self.client.get(f'/notes/{note_id}', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['note']['content'], 'newcontent')
+
+    def test_update_note_if_match(self):
+        response = self.client.post('/notes', data=json.dumps(self.note_full), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        note_id = json.loads(response.data.decode('utf-8'))['id']
+        etag = self.client.get(f'/notes/{note_id}', headers=self.headers).headers['ETag']
+
+        response = self.client.put(
+            f'/notes/{note_id}',
+            data=json.dumps({'content': 'first'}),
+            headers={**self.headers_json, 'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # The second writer read the note before the first one updated it
+        response = self.client.put(
+            f'/notes/{note_id}',
+            data=json.dumps({'content': 'second'}),
+            headers={**self.headers_json, 'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 412)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['title'], 'Precondition failed')
+
+        response = self.client.delete(f'/notes/{note_id}', headers={**self.headers, 'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+
+        response = self.client.get(f'/notes/{note_id}', headers=self.headers)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['note']['content'], 'first')
+
+        response = self.client.delete(
+            f'/notes/{note_id}', headers={**self.headers, 'If-Match': response.headers['ETag']}
+        )
+        self.assertEqual(response.status_code, 200)
+
     def test_update_empty(self):
         response = self.client.post('/notes', data=json.dumps(self.note_full), headers=self.headers_json)
         self.assertEqual(response.status_code, 201)
@@ -339,3 +402,57 @@ class NotesTestCase(unittest.TestCase):
         self.assertEqual(data['note'][1]['owner'], str(self.user1.id))
         self.assertEqual(data['note'][1]['content'], self.note_full2['content'])
         self.assertEqual(data['note'][1]['name'], self.note_full2['name'])
+
+    def test_get_my_notes_paginated(self):
+        for _ in range(5):
+            response = self.client.post('/notes', data=json.dumps(self.note_full), headers=self.headers_json)
+            self.assertEqual(response.status_code, 201)
+
+        note_ids = []
+        pages = 0
+        url = '/notes/mine?limit=2'
+        while url:
+            response = self.client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertLessEqual(data['count'], 2)
+            note_ids.extend(note['id'] for note in data['note'])
+            pages += 1
+            url = f'/notes/mine?limit=2&cursor={data["next_cursor"]}' if data['next_cursor'] else None
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(note_ids, [1, 2, 3, 4, 5])
+
+    def test_get_my_notes_invalid_page_args(self):
+        response = self.client.get('/notes/mine?limit=0', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/notes/mine?cursor=bogus', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['title'], 'Failed to look up notes')
+        self.assertEqual(data['detail'], 'cursor is invalid')
+
+    def test_import_notes(self):
+        body = 'name,content,private\nFirst,"Are er kul",false\n,"Petter er kul",\n'
+        response = self.client.post('/notes/import', data=body, headers={**self.headers, 'Content-type': 'text/csv'})
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['count'], 2)
+
+        response = self.client.get(f'/notes/{data["ids"][0]}', headers=self.headers2)
+        self.assertEqual(response.status_code, 200)
+        note = json.loads(response.data.decode('utf-8'))['note']
+        self.assertEqual((note['name'], note['content'], note['private']), ('First', 'Are er kul', False))
+
+        response = self.client.get(f'/notes/{data["ids"][1]}', headers=self.headers2)
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.post(
+            '/notes/import',
+            data=json.dumps([self.note_full, self.note_no_content]),
+            headers=self.headers_json,
+        )
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['detail'], "record 2: Missing mandatory field 'content'")
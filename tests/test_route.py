@@ -1,9 +1,28 @@
 import json
+import math
+import random
 import unittest
 
 from turplanlegger.app import create_app, db
 from turplanlegger.auth.utils import hash_password
+from turplanlegger.models.access_level import AccessLevel
+from turplanlegger.models.permission import Permission
+from turplanlegger.models.route import Route
 from turplanlegger.models.user import User
+from turplanlegger.utils.response import COMPACT_MIMETYPE
+
+
+def recorded_track(points: int) -> list:
+    """A winding track recorded 1s apart at walking speed, with GPS noise and elevation"""
+    random.seed(17)
+    lon, lat, ele, heading, coordinates = 11.615295, 60.603483, 412.0, 0.0, []
+    for _ in range(points):
+        heading += random.uniform(-0.1, 0.1)
+        lon += 2.5e-5 * math.cos(heading) + random.uniform(-4e-6, 4e-6)
+        lat += 1.2e-5 * math.sin(heading) + random.uniform(-4e-6, 4e-6)
+        ele += random.uniform(-0.4, 0.5)
+        coordinates.append([round(lon, 6), round(lat, 6), round(ele, 1)])
+    return coordinates
 
 
 class RoutesTestCase(unittest.TestCase):
@@ -99,6 +118,104 @@ class RoutesTestCase(unittest.TestCase):
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(data['route']['owner'], str(self.user1.id))
 
+    def test_get_route_compact(self):
+        response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        created_route_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.get(f'/routes/{created_route_id}', headers=self.headers)
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertIn('Accept', response.vary)
+        route = json.loads(response.data.decode('utf-8'))['route']['route']
+        self.assertEqual(route, self.route['route'])
+
+        response = self.client.get(
+            f'/routes/{created_route_id}', headers={**self.headers, 'Accept': f'{COMPACT_MIMETYPE}, */*;q=0.5'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, COMPACT_MIMETYPE)
+        compact = json.loads(response.data.decode('utf-8'))['route']['route']
+        self.assertEqual(compact['type'], 'LineString')
+        self.assertIsInstance(compact['coordinates'], str)
+
+        # Compact routes can be sent back as they are
+        response = self.client.post('/routes', data=json.dumps({'route': compact}), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        route = json.loads(response.data.decode('utf-8'))['route']
+        self.assertEqual(route, self.route['route'])
+
+    def test_get_route_not_modified(self):
+        response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        created_route_id = json.loads(response.data.decode('utf-8'))['id']
+        compact = {**self.headers, 'Accept': COMPACT_MIMETYPE}
+
+        etags = {}
+        for name, args, headers in (
+            ('full', '', self.headers),
+            ('compact', '', compact),
+            ('low', '?detail=low', self.headers),
+            ('low compact', '?detail=low', compact),
+        ):
+            response = self.client.get(f'/routes/{created_route_id}{args}', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            etags[name] = response.headers['ETag']
+
+            response = self.client.get(
+                f'/routes/{created_route_id}{args}', headers={**headers, 'If-None-Match': etags[name]}
+            )
+            self.assertEqual(response.status_code, 304)
+            self.assertIn('Accept', response.vary)
+        # Every representation has an ETag of its own
+        self.assertEqual(len(set(etags.values())), 4)
+
+        response = self.client.get(f'/routes/{created_route_id}', headers={**compact, 'If-None-Match': etags['full']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, COMPACT_MIMETYPE)
+
+        # Any of them is a precondition of an update, the revision is the same
+        response = self.client.put(
+            f'/routes/{created_route_id}',
+            data=json.dumps({**self.route, 'name': 'Renamed'}),
+            headers={**self.headers_json, 'If-Match': etags['low compact']},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(response.headers['ETag'], etags.values())
+
+        response = self.client.get(
+            f'/routes/{created_route_id}', headers={**self.headers, 'If-None-Match': etags['full']}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['route']['name'], 'Renamed')
+
+        response = self.client.delete(
+            f'/routes/{created_route_id}', headers={**self.headers, 'If-Match': etags['full']}
+        )
+        self.assertEqual(response.status_code, 412)
+        response = self.client.delete(f'/routes/{created_route_id}', headers={**self.headers, 'If-Match': '*'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_add_route_compact_invalid(self):
+        route = {'route': {'type': 'LineString', 'coordinates': 'bm90IGNvbXBhY3Q='}}
+        response = self.client.post('/routes', data=json.dumps(route), headers=self.headers_json)
+        self.assertEqual(response.status_code, 400)
+
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['title'], 'Failed to parse route')
+        self.assertEqual(data['detail'], 'encoded coordinates are invalid')
+
+    def test_route_compact_size(self):
+        route = {'route': {'type': 'LineString', 'coordinates': recorded_track(5000)}}
+
+        response = self.client.post('/routes', data=json.dumps(route), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        created_route_id = json.loads(response.data.decode('utf-8'))['id']
+
+        plain = self.client.get(f'/routes/{created_route_id}', headers=self.headers)
+        compact = self.client.get(f'/routes/{created_route_id}', headers={**self.headers, 'Accept': COMPACT_MIMETYPE})
+        self.assertEqual(json.loads(plain.data.decode('utf-8'))['route']['route'], route['route'])
+        self.assertLess(len(compact.data) * 3, len(plain.data))
+
     def test_get_route_not_found(self):
         response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
         self.assertEqual(response.status_code, 201)
@@ -172,3 +289,292 @@ class RoutesTestCase(unittest.TestCase):
 
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(data['route'][0]['owner'], str(self.user1.id))
+
+    def test_get_my_routes_paginated(self):
+        for _ in range(3):
+            response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
+            self.assertEqual(response.status_code, 201)
+
+        response = self.client.get('/routes/mine?limit=2', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([route['id'] for route in data['route']], [1, 2])
+        self.assertIsNotNone(data['next_cursor'])
+
+        response = self.client.get(f'/routes/mine?limit=2&cursor={data["next_cursor"]}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([route['id'] for route in data['route']], [3])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_update_route_history(self):
+        response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        created_route_id = data['id']
+        self.assertEqual(data['version'], 1)
+
+        versions = [self.route['route']]
+        coordinates = self.route['route']['coordinates']
+        for edit in (
+            coordinates[:3] + [[11.69, 60.62]] + coordinates[4:],
+            coordinates[:3] + [[11.69, 60.62]] + coordinates[4:-1],
+        ):
+            versions.append({'type': 'LineString', 'coordinates': edit})
+            response = self.client.put(
+                f'/routes/{created_route_id}', data=json.dumps({'route': versions[-1]}), headers=self.headers_json
+            )
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['route']['version'], len(versions))
+            self.assertEqual(data['route']['route'], versions[-1])
+
+        # Renaming makes a version without geometry changes
+        response = self.client.put(
+            f'/routes/{created_route_id}',
+            data=json.dumps({'route': versions[-1], 'name': 'Rundtur'}),
+            headers=self.headers_json,
+        )
+        self.assertEqual(response.status_code, 200)
+        versions.append(versions[-1])
+
+        response = self.client.get(f'/routes/{created_route_id}/history', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['version'], 4)
+        self.assertEqual([version['version'] for version in data['versions']], [1, 2, 3, 4])
+
+        for number, version in enumerate(versions, start=1):
+            response = self.client.get(f'/routes/{created_route_id}/history/{number}', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['version'], number)
+            self.assertEqual(data['route'], version)
+
+        # Only the changed positions are kept
+        patches = db.get_route_patches(created_route_id, 1)
+        self.assertEqual([len(patch.patch['geometries'][0]['edits']) for patch in patches[1:]], [1, 1])
+        self.assertEqual(patches[0].patch, {})
+
+        for version in (0, 5):
+            response = self.client.get(f'/routes/{created_route_id}/history/{version}', headers=self.headers)
+            self.assertEqual(response.status_code, 404)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['title'], 'Route version not found')
+
+    def test_update_route_not_permitted(self):
+        response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        created_route_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.post(
+            '/login',
+            data=json.dumps({'email': self.user2.email, 'password': 'test'}),
+            headers={'Content-type': 'application/json'},
+        )
+        token = json.loads(response.data.decode('utf-8'))['token']
+        headers = {'Content-type': 'application/json', 'Authorization': f'Bearer {token}'}
+
+        response = self.client.put(f'/routes/{created_route_id}', data=json.dumps(self.route), headers=headers)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f'/routes/{created_route_id}/history', headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_route_detail(self):
+        route = {'route': {'type': 'LineString', 'coordinates': recorded_track(5000)}}
+        response = self.client.post('/routes', data=json.dumps(route), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        created_route_id = json.loads(response.data.decode('utf-8'))['id']
+        response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        short_route_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.get(f'/routes/{created_route_id}', headers=self.headers)
+        full = response.data
+        self.assertIsNone(json.loads(full.decode('utf-8'))['route']['detail'])
+
+        sizes = []
+        for args, detail in (('detail=high', 14), ('zoom=12', 14), ('zoom=11', 11), ('detail=low', 8), ('zoom=3', 8)):
+            response = self.client.get(f'/routes/{created_route_id}?{args}', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data.decode('utf-8'))['route']
+            self.assertEqual(data['detail'], detail)
+            coordinates = data['route']['coordinates']
+            self.assertEqual(coordinates[0], route['route']['coordinates'][0])
+            self.assertEqual(coordinates[-1], route['route']['coordinates'][-1])
+            sizes.append(len(response.data))
+        self.assertLess(sizes[0] * 10, len(full))
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+        for args in ('detail=full', 'zoom=15'):
+            response = self.client.get(f'/routes/{created_route_id}?{args}', headers=self.headers)
+            self.assertEqual(json.loads(response.data.decode('utf-8'))['route']['detail'], None)
+            self.assertEqual(len(response.data), len(full))
+
+        # Too short to simplify
+        response = self.client.get(f'/routes/{short_route_id}?detail=low', headers=self.headers)
+        data = json.loads(response.data.decode('utf-8'))['route']
+        self.assertIsNone(data['detail'])
+        self.assertEqual(data['route'], self.route['route'])
+
+        response = self.client.get('/routes/mine?detail=medium', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([route['detail'] for route in data['route']], [11, None])
+
+    def test_get_route_detail_invalid(self):
+        response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
+        created_route_id = json.loads(response.data.decode('utf-8'))['id']
+
+        for args, detail in (
+            ('detail=tiny', 'detail must be one of low, medium, high, full'),
+            ('zoom=x', 'zoom must be an integer'),
+            ('zoom=-1', 'zoom must be between 0 and 24'),
+            ('zoom=3&detail=low', 'detail and zoom can not be combined'),
+        ):
+            response = self.client.get(f'/routes/{created_route_id}?{args}', headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['title'], 'Failed to look up route')
+            self.assertEqual(data['detail'], detail)
+
+    def test_route_stats(self):
+        response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        created_route_id = data['id']
+        stats = data['stats']
+        self.assertEqual(stats['points'], 9)
+        self.assertAlmostEqual(stats['length'], 14_640, delta=10)
+        self.assertEqual(len(stats['segment_lengths']), 1)
+        self.assertEqual(stats['bbox'], [11.611862, 60.568064, 11.712112, 60.613258])
+
+        response = self.client.get('/routes/mine?detail=low', headers=self.headers)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['route'][0]['stats'], stats)
+
+        route = {'type': 'LineString', 'coordinates': self.route['route']['coordinates'][:2]}
+        response = self.client.put(
+            f'/routes/{created_route_id}', data=json.dumps({'route': route}), headers=self.headers_json
+        )
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['route']['stats']['points'], 2)
+        self.assertLess(data['route']['stats']['length'], stats['length'])
+
+    def test_import_route(self):
+        points = ''.join(
+            f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele></trkpt>' for lon, lat, ele in recorded_track(2000)
+        )
+        gpx = f'<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><name>Rundt</name><trkseg>{points}</trkseg></trk></gpx>'
+        response = self.client.post(
+            '/routes/import?comment=Fra%20klokka',
+            data=gpx.encode('utf-8'),
+            headers={**self.headers, 'Content-type': 'application/gpx+xml'},
+        )
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual((data['name'], data['comment']), ('Rundt', 'Fra klokka'))
+        self.assertEqual(data['route'], {'type': 'LineString', 'coordinates': recorded_track(2000)})
+        self.assertEqual(data['stats']['points'], 2000)
+
+        response = self.client.post(
+            '/routes/import?name=Hamar',
+            data=json.dumps(self.route['route']),
+            headers={**self.headers, 'Content-type': 'application/geo+json'},
+        )
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual((data['name'], data['route']), ('Hamar', self.route['route']))
+
+    def test_import_route_invalid(self):
+        response = self.client.post('/routes/import', data=b'<gpx/>', headers=self.headers)
+        self.assertEqual(response.status_code, 415)
+
+        response = self.client.post('/routes/import', data=b'<gpx/>', headers=self.headers_json)
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['title'], 'Failed to import route')
+        self.assertEqual(data['detail'], 'GeoJSON is not valid JSON')
+
+        response = self.client.post(
+            '/routes/import', data=b'<gpx/>', headers={**self.headers, 'Content-type': 'application/gpx+xml'}
+        )
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['detail'], 'GPX has no tracks or routes')
+
+    def test_export_route(self):
+        response = self.client.post('/routes', data=json.dumps(self.route), headers=self.headers_json)
+        route_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.get(f'/routes/{route_id}/export', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/gpx+xml')
+        self.assertEqual(response.headers['Content-Disposition'], f'attachment; filename="route-{route_id}.gpx"')
+        self.assertEqual(response.data.count(b'<trkpt '), 9)
+
+        response = self.client.get(f'/routes/{route_id}/export?format=geojson', headers=self.headers)
+        self.assertEqual(response.mimetype, 'application/geo+json')
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['features'][0]['geometry'], self.route['route'])
+        self.assertEqual(data['features'][0]['properties']['id'], route_id)
+
+        response = self.client.get(f'/routes/{route_id}/export?format=kml', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['detail'], 'format must be one of gpx, geojson, ndjson')
+
+        others = Route(owner=self.user2.id, route=self.route['route']).create()
+        response = self.client.get(f'/routes/{others.id}/export', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_routes(self):
+        def line(lon, lat):
+            return {'type': 'LineString', 'coordinates': [[lon, lat], [lon + 0.05, lat + 0.02]]}
+
+        hamar = self.route['route']
+        mine = Route(owner=self.user1.id, route=hamar).create()
+        Route(owner=self.user1.id, route=line(5.32, 60.39)).create()
+        shared = Route(
+            owner=self.user2.id,
+            route=line(11.70, 60.60),
+            permissions=[Permission(object_id=None, subject_id=self.user1.id, access_level=AccessLevel.READ)],
+        ).create()
+        Route(owner=self.user2.id, route=line(11.65, 60.59)).create()
+
+        response = self.client.get('/routes/search?bbox=11.5,60.5,11.8,60.7', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([route['id'] for route in data['route']], [mine.id, shared.id])
+
+        # Touching the corner of a bounding box is enough
+        response = self.client.get('/routes/search?bbox=11.75,60.62,12,61&limit=1', headers=self.headers)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([route['id'] for route in data['route']], [shared.id])
+        self.assertIsNone(data['next_cursor'])
+
+        response = self.client.get('/routes/search?bbox=11.5,60.5,11.8,60.7&limit=1&detail=low', headers=self.headers)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([route['id'] for route in data['route']], [mine.id])
+        self.assertIsNotNone(data['next_cursor'])
+
+        # A viewport of the whole country is filtered without the bounding box index
+        response = self.client.get('/routes/search?bbox=4,57.5,31.5,71.5', headers=self.headers)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['count'], 3)
+
+        response = self.client.get('/routes/search?bbox=0,0,1,1', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_routes_invalid(self):
+        for bbox, detail in (
+            ('', 'bbox must be four numbers: min lon,min lat,max lon,max lat'),
+            ('1,2,3', 'bbox must be four numbers: min lon,min lat,max lon,max lat'),
+            ('1,2,3,nan', 'bbox must be four numbers: min lon,min lat,max lon,max lat'),
+            ('170,0,-170,10', 'bbox longitudes must be between -180 and 180, min lon first'),
+            ('0,-91,1,1', 'bbox latitudes must be between -90 and 90, min lat first'),
+        ):
+            response = self.client.get(f'/routes/search?bbox={bbox}', headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['title'], 'Failed to search routes')
+            self.assertEqual(data['detail'], detail)
@@ -0,0 +1,159 @@
+import json
+import unittest
+
+from turplanlegger.app import create_app, db
+from turplanlegger.auth.utils import hash_password
+from turplanlegger.models.user import User
+
+
+class SyncTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.client = cls.app.test_client()
+
+        cls.user1 = User.create(
+            User(
+                name='Ola',
+                last_name='Nordamnn',
+                email='old.nordmann@norge.no',
+                auth_method='basic',
+                password=hash_password('test'),
+            )
+        )
+        cls.user2 = User.create(
+            User(
+                name='Kari',
+                last_name='Nordamnn',
+                email='kari.nordmann@norge.no',
+                auth_method='basic',
+                password=hash_password('test'),
+            )
+        )
+
+        cls.route = {
+            'route': {'type': 'LineString', 'coordinates': [[11.615295, 60.603483], [11.638641, 60.612921]]},
+            'name': 'Pretty route',
+        }
+        cls.note = {'content': 'Are er kul', 'name': 'Best note ever'}
+        cls.item_list = {'name': 'Test list', 'items': [{'content': 'item one'}]}
+        cls.trip = {'name': 'UTrippin?'}
+
+        cls.headers_json = {}
+        cls.headers = {}
+        for user in (cls.user1, cls.user2):
+            response = cls.client.post(
+                '/login',
+                data=json.dumps({'email': user.email, 'password': 'test'}),
+                headers={'Content-type': 'application/json'},
+            )
+            if response.status_code != 200:
+                raise RuntimeError('Failed to login')
+
+            data = json.loads(response.data.decode('utf-8'))
+            cls.headers_json[user.id] = {'Content-type': 'application/json', 'Authorization': f'Bearer {data["token"]}'}
+            cls.headers[user.id] = {'Authorization': f'Bearer {data["token"]}'}
+
+    def tearDown(self):
+        db.truncate_table('trips')
+        db.truncate_table('routes')
+        db.truncate_table('lists_items')
+        db.truncate_table('item_lists')
+        db.truncate_table('notes')
+
+    @classmethod
+    def tearDownClass(cls):
+        db.destroy()
+
+    def create(self, path: str, obj: dict, user: User = None) -> int:
+        user = user or self.user1
+        response = self.client.post(path, data=json.dumps(obj), headers=self.headers_json[user.id])
+        self.assertEqual(response.status_code, 201)
+        return json.loads(response.data.decode('utf-8'))['id']
+
+    def sync(self, since: str = None, user: User = None) -> dict:
+        user = user or self.user1
+        response = self.client.get(
+            '/sync', query_string={'since': since} if since else {}, headers=self.headers[user.id]
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode('utf-8'))
+
+    def ids(self, data: dict) -> dict:
+        return {kind: [obj['id'] for obj in data[kind]] for kind in ('trips', 'notes', 'routes', 'item_lists')}
+
+    def test_sync_everything(self):
+        trip_id = self.create('/trips', self.trip)
+        note_id = self.create('/notes', self.note)
+        route_id = self.create('/routes', self.route)
+        item_list_id = self.create('/item_lists', self.item_list)
+        self.create('/notes', self.note, user=self.user2)
+
+        data = self.sync()
+        self.assertEqual(data['status'], 'ok')
+        self.assertIsInstance(data['token'], str)
+        self.assertEqual(
+            self.ids(data), {'trips': [trip_id], 'notes': [note_id], 'routes': [route_id], 'item_lists': [item_list_id]}
+        )
+        self.assertEqual(data['routes'][0]['route'], self.route['route'])
+        self.assertEqual(data['item_lists'][0]['items'][0]['content'], 'item one')
+        self.assertEqual(data['deleted'], {'trips': [], 'notes': [], 'routes': [], 'item_lists': []})
+
+        # Nothing has changed since
+        data = self.sync(data['token'])
+        self.assertEqual(self.ids(data), {'trips': [], 'notes': [], 'routes': [], 'item_lists': []})
+
+    def test_sync_since(self):
+        trip_id = self.create('/trips', self.trip)
+        note_id = self.create('/notes', self.note)
+        route_id = self.create('/routes', self.route)
+        item_list_id = self.create('/item_lists', self.item_list)
+        other_item_list_id = self.create('/item_lists', self.item_list)
+        token = self.sync()['token']
+
+        new_note_id = self.create('/notes', self.note)
+        response = self.client.put(
+            f'/routes/{route_id}',
+            data=json.dumps({**self.route, 'name': 'Renamed'}),
+            headers=self.headers_json[self.user1.id],
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(
+            f'/item_lists/{item_list_id}/add',
+            data=json.dumps({'items': [{'content': 'item two'}], 'items_checked': [{'content': 'item three'}]}),
+            headers=self.headers_json[self.user1.id],
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.delete(f'/notes/{note_id}', headers=self.headers[self.user1.id])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.delete(f'/item_lists/{other_item_list_id}', headers=self.headers[self.user1.id])
+        self.assertEqual(response.status_code, 200)
+        self.create('/notes', self.note, user=self.user2)
+
+        data = self.sync(token)
+        self.assertEqual(
+            self.ids(data), {'trips': [], 'notes': [new_note_id], 'routes': [route_id], 'item_lists': [item_list_id]}
+        )
+        self.assertEqual(data['routes'][0]['name'], 'Renamed')
+        self.assertEqual([item['content'] for item in data['item_lists'][0]['items']], ['item one', 'item two'])
+        self.assertEqual([item['content'] for item in data['item_lists'][0]['items_checked']], ['item three'])
+        self.assertEqual(
+            data['deleted'], {'trips': [], 'notes': [note_id], 'routes': [], 'item_lists': [other_item_list_id]}
+        )
+
+        # Dates are part of the trip
+        response = self.client.put(
+            f'/trips/{trip_id}', data=json.dumps({'private': True}), headers=self.headers_json[self.user1.id]
+        )
+        self.assertEqual(response.status_code, 200)
+        data = self.sync(data['token'])
+        self.assertEqual(self.ids(data), {'trips': [trip_id], 'notes': [], 'routes': [], 'item_lists': []})
+        self.assertEqual(data['deleted'], {'trips': [], 'notes': [], 'routes': [], 'item_lists': []})
+
+    def test_sync_invalid_token(self):
+        for since in ('bogus', 'eGlkfGFiYw==', 'Y3w0Mg=='):
+            response = self.client.get('/sync', query_string={'since': since}, headers=self.headers[self.user1.id])
+            self.assertEqual(response.status_code, 400)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['title'], 'Failed to sync')
+            self.assertEqual(data['detail'], 'since is not a sync token')
@@ -0,0 +1,119 @@
+import json
+import time
+import unittest
+from datetime import UTC, datetime, timedelta
+from unittest.mock import patch
+
+import jwt
+
+from turplanlegger.app import create_app, db
+from turplanlegger.auth.utils import hash_password
+from turplanlegger.models.token import JWT, verified_tokens
+from turplanlegger.models.user import User
+from turplanlegger.utils.cache import TTLCache
+from turplanlegger.utils.config import config
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.client = cls.app.test_client()
+
+        cls.user = User.create(
+            User(
+                name='Ola',
+                last_name='Nordamnn',
+                email='ola.token@norge.no',
+                auth_method='basic',
+                password=hash_password('test'),
+            )
+        )
+
+        response = cls.client.post(
+            '/login',
+            data=json.dumps({'email': cls.user.email, 'password': 'test'}),
+            headers={'Content-type': 'application/json'},
+        )
+        if response.status_code != 200:
+            raise RuntimeError('Failed to login')
+        cls.token = json.loads(response.data.decode('utf-8'))['token']
+        cls.headers = {'Authorization': f'Bearer {cls.token}'}
+
+    def setUp(self):
+        verified_tokens.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.destroy()
+
+    def test_token_verified_once(self):
+        with patch('turplanlegger.models.token.jwt.decode', wraps=jwt.decode) as decode:
+            for _ in range(5):
+                response = self.client.get('/whoami', headers=self.headers)
+                self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(verified_tokens.stats['hits'], 4)
+        self.assertEqual(verified_tokens.stats['misses'], 1)
+
+    def test_invalid_token_not_cached(self):
+        token = self.token[:-4] + 'AAAA'
+
+        for _ in range(2):
+            response = self.client.get('/whoami', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 401)
+
+        self.assertEqual(len(verified_tokens), 0)
+
+    def test_cached_until_exp(self):
+        now = datetime.now(UTC)
+        token = JWT(
+            iss='http://localhost/',
+            sub=str(self.user.id),
+            aud=config.audience,
+            exp=now + timedelta(seconds=2),
+            nbf=now,
+            iat=now,
+            jti='jti',
+            typ='JWT',
+        ).tokenize()
+
+        response = self.client.get('/whoami', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(verified_tokens), 1)
+
+        time.sleep(2.1)
+        response = self.client.get('/whoami', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 401)
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats, {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2})
+
+    def test_expiry(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1, ttl=0.05)
+        cache.set('b', 2, ttl=-1)
+
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        cache = TTLCache(maxsize=0, ttl=60)
+        cache.set('a', 1)
+
+        self.assertIsNone(cache.get('a'))
@@ -1,9 +1,12 @@
 import json
 import unittest
 from datetime import UTC, datetime, timedelta
+from unittest.mock import patch
 
 from turplanlegger.app import create_app, db
 from turplanlegger.auth.utils import hash_password
+from turplanlegger.models.route import Route
+from turplanlegger.models.trip import Trip
 from turplanlegger.models.user import User
 
 
@@ -206,6 +209,7 @@ class TripsTestCase(unittest.TestCase):
         )
         self.assertEqual(response.status_code, 201)
         data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['notes'], [note_id])
 
         response = self.client.get(f'/trips/{trip_id}', headers=self.headers)
         self.assertEqual(response.status_code, 200)
@@ -231,6 +235,7 @@ class TripsTestCase(unittest.TestCase):
         )
         self.assertEqual(response.status_code, 201)
         data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['routes'], [route_id])
 
         response = self.client.get(f'/trips/{trip_id}', headers=self.headers)
         self.assertEqual(response.status_code, 200)
@@ -238,6 +243,39 @@ class TripsTestCase(unittest.TestCase):
 
         self.assertEqual(data['trip']['routes'], [route_id])
 
+    def test_export_trip(self):
+        response = self.client.post('/trips', data=json.dumps(self.trip), headers=self.headers_json)
+        trip_id = json.loads(response.data.decode('utf-8'))['id']
+
+        route_ids = []
+        for name in ('Dag 1', 'Dag 2'):
+            route = {'route': json.loads(self.route['route']), 'name': name}
+            response = self.client.post('/routes', data=json.dumps(route), headers=self.headers_json)
+            route_ids.append(json.loads(response.data.decode('utf-8'))['id'])
+            self.client.patch(
+                f'/trips/{trip_id}/routes', data=json.dumps({'route_id': route_ids[-1]}), headers=self.headers_json
+            )
+        # Routes the user can not read are left out
+        unshared = Route(owner=self.user2.id, route=json.loads(self.route['route'])).create()
+        Trip.find_trip(trip_id).add_route_reference(unshared.id)
+
+        response = self.client.get(f'/trips/{trip_id}/export?format=ndjson', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        features = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual([feature['properties']['id'] for feature in features], route_ids)
+        self.assertEqual([feature['properties']['name'] for feature in features], ['Dag 1', 'Dag 2'])
+
+        response = self.client.get(f'/trips/{trip_id}/export', headers=self.headers)
+        self.assertEqual(response.mimetype, 'application/gpx+xml')
+        self.assertEqual(response.data.count(b'<trk>'), 2)
+
+        # The trip is not private, others get the routes of it they can read
+        response = self.client.get(f'/trips/{trip_id}/export?format=ndjson', headers=self.headers2)
+        features = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual([feature['properties']['id'] for feature in features], [unshared.id])
+
     def test_create_trip_add_item_list(self):
         response = self.client.post('/trips', data=json.dumps(self.trip), headers=self.headers_json)
         self.assertEqual(response.status_code, 201)
@@ -259,6 +297,8 @@ class TripsTestCase(unittest.TestCase):
         )
         self.assertEqual(response.status_code, 201)
         data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['item_lists'], [item_list_id])
+        self.assertEqual(data['routes'], [])
 
         response = self.client.get(f'/trips/{trip_id}', headers=self.headers)
         self.assertEqual(response.status_code, 200)
@@ -318,6 +358,54 @@ class TripsTestCase(unittest.TestCase):
         self.assertEqual(data['trip'][2]['dates'][0]['end_time'], self.trip_with_date['dates'][0]['end_time'])
         self.assertEqual(data['trip'][2]['owner'], str(self.user1.id))
 
+    def test_get_my_trips_paginated(self):
+        for trip in (self.trip, self.trip2, self.trip_with_date, self.trip_with_multiple_dates, self.trip):
+            response = self.client.post('/trips', data=json.dumps(trip), headers=self.headers_json)
+            self.assertEqual(response.status_code, 201)
+
+        trips = []
+        pages = 0
+        url = '/trips/mine?limit=2'
+        while url:
+            response = self.client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertLessEqual(data['count'], 2)
+            trips.extend(data['trip'])
+            pages += 1
+            url = f'/trips/mine?limit=2&cursor={data["next_cursor"]}' if data['next_cursor'] else None
+
+        self.assertEqual(pages, 3)
+        self.assertEqual([trip['id'] for trip in trips], [1, 2, 3, 4, 5])
+        self.assertEqual([len(trip['dates']) for trip in trips], [0, 0, 1, 2, 0])
+
+    def test_get_my_trips_is_one_query(self):
+        trip_with_permissions = {
+            'name': 'trippin pete shared',
+            'permissions': [{'subject_id': str(self.user2.id), 'access_level': 'READ'}],
+        }
+        for trip in (self.trip, self.trip_with_multiple_dates, trip_with_permissions):
+            response = self.client.post('/trips', data=json.dumps(trip), headers=self.headers_json)
+            self.assertEqual(response.status_code, 201)
+
+        with (
+            patch.object(db, '_fetchall', wraps=db._fetchall) as fetchall,
+            patch.object(db, '_fetchone', wraps=db._fetchone) as fetchone,
+        ):
+            trips = Trip.find_trips_by_owner(self.user1.id)
+
+        self.assertEqual(fetchall.call_count, 1)
+        self.assertEqual(fetchone.call_count, 0)
+        self.assertEqual(len(trips), 3)
+        trips = {trip.name: trip for trip in trips}
+        self.assertEqual(len(trips[self.trip_with_multiple_dates['name']].dates), 2)
+        self.assertLess(
+            trips[self.trip_with_multiple_dates['name']].dates[0].start_time,
+            trips[self.trip_with_multiple_dates['name']].dates[1].start_time,
+        )
+        self.assertEqual(trips[trip_with_permissions['name']].permissions[0].subject_id, self.user2.id)
+        self.assertEqual(trips[self.trip['name']].permissions, [])
+
     def test_create_trip_with_date(self):
         response = self.client.post('/trips', data=json.dumps(self.trip_with_date), headers=self.headers_json)
 
@@ -638,6 +726,80 @@ class TripsTestCase(unittest.TestCase):
         self.assertEqual(data['dates'][1]['start_time'], trip['dates'][1]['start_time'])
         self.assertEqual(data['dates'][1]['end_time'], trip['dates'][1]['end_time'])
 
+    def test_get_trip_not_modified(self):
+        response = self.client.post('/trips', data=json.dumps(self.trip_with_date), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        trip_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.get(f'/trips/{trip_id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        # The trip is public, it is not modified for anyone
+        for headers in (self.headers, self.headers2):
+            response = self.client.get(f'/trips/{trip_id}', headers={**headers, 'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+        # Dates and references change the trip they are in
+        start_time = (datetime.now(UTC) + timedelta(days=7)).isoformat()
+        end_time = (datetime.now(UTC) + timedelta(days=14)).isoformat()
+        response = self.client.patch(
+            f'/trips/{trip_id}/dates',
+            data=json.dumps({'start_time': start_time, 'end_time': end_time}),
+            headers=self.headers_json,
+        )
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(f'/trips/{trip_id}', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data.decode('utf-8'))['trip']['dates']), 2)
+        etag_dates = response.headers['ETag']
+        self.assertNotEqual(etag_dates, etag)
+
+        response = self.client.post('/notes', data=json.dumps(self.note), headers=self.headers_json)
+        note_id = json.loads(response.data.decode('utf-8'))['id']
+        response = self.client.patch(
+            f'/trips/{trip_id}/notes', data=json.dumps({'note_id': note_id}), headers=self.headers_json
+        )
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(f'/trips/{trip_id}', headers={**self.headers, 'If-None-Match': etag_dates})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['trip']['notes'], [note_id])
+
+    def test_update_trip_if_match(self):
+        response = self.client.post('/trips', data=json.dumps(self.trip_with_multiple_dates), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        trip = json.loads(response.data.decode('utf-8'))
+        etag = self.client.get(f'/trips/{trip["id"]}', headers=self.headers).headers['ETag']
+
+        response = self.client.put(
+            f'/trips/{trip["id"]}',
+            data=json.dumps({'name': 'New tripin pete', 'dates': trip['dates'][:1]}),
+            headers={**self.headers_json, 'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 200)
+        etag_updated = response.headers['ETag']
+
+        # Removing the date is part of the update, the ETag is of all of it
+        response = self.client.get(f'/trips/{trip["id"]}', headers=self.headers)
+        self.assertEqual(response.headers['ETag'], etag_updated)
+        self.assertEqual(len(json.loads(response.data.decode('utf-8'))['trip']['dates']), 1)
+
+        response = self.client.put(
+            f'/trips/{trip["id"]}',
+            data=json.dumps({'name': 'Old tripin pete', 'dates': []}),
+            headers={**self.headers_json, 'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 412)
+
+        # Nothing of the failed update is written
+        response = self.client.get(f'/trips/{trip["id"]}', headers={**self.headers, 'If-None-Match': etag_updated})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.delete(f'/trips/{trip["id"]}', headers={**self.headers, 'If-Match': etag_updated})
+        self.assertEqual(response.status_code, 200)
+
     def test_update_trip_add_date(self):
         response = self.client.post('/trips', data=json.dumps(self.trip_with_multiple_dates), headers=self.headers_json)
 
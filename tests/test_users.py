@@ -1,10 +1,12 @@
 import json
+import threading
 import unittest
+from unittest.mock import patch
 from uuid import uuid4
 
 from turplanlegger.app import create_app, db
-from turplanlegger.auth.utils import hash_password
-from turplanlegger.models.user import User
+from turplanlegger.auth.utils import HasherBusy, PasswordHasher, hash_password, hasher
+from turplanlegger.models.user import User, user_cache
 
 
 class UsersTestCase(unittest.TestCase):
@@ -394,3 +396,85 @@ class UsersTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         response = self.client.get(f'/users/{self.user10["id"]}', headers={'Authorization': f'Bearer {data["token"]}'})
         self.assertEqual(response.status_code, 200)
+
+    def test_auth_user_cached(self):
+        response = self.client.post('/notes', data=json.dumps({'content': 'note'}), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+
+        with patch.object(db, 'get_user', wraps=db.get_user) as get_user:
+            for _ in range(3):
+                response = self.client.get('/notes/mine', headers=self.headers)
+                self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(get_user.call_count, 0)
+
+    def test_auth_user_cache_invalidated(self):
+        response = self.client.post('/notes', data=json.dumps({'content': 'note'}), headers=self.headers_json)
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNotNone(user_cache.get(self.test_user.id))
+
+        response = self.client.patch(
+            f'/users/{self.test_user.id}/rename', data=json.dumps({'name': 'Kari'}), headers=self.headers_json
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(user_cache.get(self.test_user.id))
+
+        response = self.client.get('/notes/mine', headers=self.headers)
+        self.assertEqual(user_cache.get(self.test_user.id).name, 'Kari')
+
+        response = self.client.patch(f'/users/{self.test_user.id}/private', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(user_cache.get(self.test_user.id))
+
+        response = self.client.get('/notes/mine', headers=self.headers)
+        self.assertTrue(user_cache.get(self.test_user.id).private)
+
+        response = self.client.delete(f'/users/{self.test_user.id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(user_cache.get(self.test_user.id))
+
+    def test_login_hasher_busy(self):
+        with patch.object(hasher, '_slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+
+            response = self.client.post(
+                '/login',
+                data=json.dumps({'email': self.test_user.email, 'password': 'test'}),
+                headers={'Content-type': 'application/json'},
+            )
+            self.assertEqual(response.status_code, 503)
+
+            response = self.client.post('/users', data=json.dumps(self.user1), headers=self.headers_json)
+            self.assertEqual(response.status_code, 503)
+
+    def test_password_hasher_bounded(self):
+        password_hasher = PasswordHasher(workers=1, queue_size=0)
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking():
+            started.set()
+            release.wait(timeout=10)
+
+        thread = threading.Thread(target=password_hasher.run, args=(blocking,))
+        thread.start()
+        started.wait(timeout=10)
+
+        with self.assertRaises(HasherBusy):
+            password_hasher.run(blocking)
+
+        release.set()
+        thread.join(timeout=10)
+        self.assertTrue(password_hasher.run(lambda: True))
+
+    def test_password_hasher_timeout(self):
+        password_hasher = PasswordHasher(workers=1, queue_size=1, timeout=0.1)
+        release = threading.Event()
+        blocked = password_hasher.executor.submit(release.wait, 10)
+
+        # Queued behind the blocked worker, gives up after the timeout
+        with self.assertRaises(HasherBusy):
+            password_hasher.run(lambda: True)
+
+        release.set()
+        blocked.result(timeout=10)
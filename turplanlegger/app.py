@@ -1,23 +1,32 @@
 from flask import Flask
 
+from turplanlegger.database.aio import AsyncDatabase
 from turplanlegger.database.base import Database
 from turplanlegger.exceptions import ExceptionHandlers
 from turplanlegger.utils.cors import Cors
 from turplanlegger.utils.http_client import HttpClient
+from turplanlegger.utils.json_provider import UJSONProvider
+from turplanlegger.utils.jwks import JwksCache
 
 handlers = ExceptionHandlers()
 db = Database()
+# Opened with `await adb.open()` by an asyncio deployment, after db.init_db
+adb = AsyncDatabase()
 cors = Cors()
 http_client = HttpClient()
+jwks = JwksCache()
 
 
 def create_app() -> Flask:
     app = Flask(__name__)
+    app.json = UJSONProvider(app)
 
     handlers.register(app)
 
     http_client.init_app(app)
 
+    jwks.init_app(app)
+
     db.init_db(app)
 
     cors.init_app(app)
@@ -40,7 +40,7 @@ def auth(func):
             log.exception(f'Auth failed:\n{str(e)}')
             raise AuthError('Auth failed', 401)
 
-        user = User.find_user(UUID(jwt.subject))
+        user = User.find_user_cached(UUID(jwt.subject))
         if user is not None:
             if user.deleted:
                 raise AuthError('Inactive user', 401)
@@ -50,7 +50,16 @@ def auth(func):
             return func(*args, **kwargs)
 
         try:
-            user = User.create(JWT.parse_user_from_token(token))
+            user = JWT.parse_user_from_token(token)
+            existing_user = User.find_by_email(user.email)
+        except Exception as e:
+            raise ApiProblem('Failed to create user', str(e), 500)
+
+        if existing_user is not None:
+            raise ApiProblem('Failed to create user', 'A user with this email already exists', 409)
+
+        try:
+            user = User.create(user)
         except Exception as e:
             raise ApiProblem('Failed to create user', str(e), 500)
 
@@ -25,7 +25,10 @@ def login():
 
     from turplanlegger.models.user import User
 
-    user = User.check_credentials(email, password)
+    try:
+        user = User.check_credentials(email, password)
+    except utils.HasherBusy as e:
+        raise ApiProblem('Authorization failed', str(e), 503)
 
     if not user:
         raise ApiProblem('Authorization failed', 'Could not authorize user', 401)
@@ -1,5 +1,55 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable
+
 import bcrypt
 
+from turplanlegger.utils.config import config
+
+
+class HasherBusy(RuntimeError):
+    """Raised when the password hasher can not take on more work"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded pool of threads
+
+    The request thread waiting for a result is still occupied, so the number
+    of admitted calls, `workers + queue_size`, bounds how many request threads
+    logins can hold. Keep it below the number of threads serving requests
+    (gunicorn --threads=4) so other traffic always has a thread, calls beyond
+    it are turned away at once with HasherBusy. Queued calls that do not get
+    a worker within `timeout` seconds are turned away as well.
+
+    Args:
+        workers (int): Number of threads running bcrypt
+        queue_size (int): Number of calls allowed to wait for a free thread
+        timeout (float): Seconds a call may wait for a result
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: float = None) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def run(self, func: Callable, *args) -> Any:
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Too many password checks in progress, try again later')
+
+        try:
+            future = self.executor.submit(func, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                raise HasherBusy('Timed out waiting for password check, try again later')
+        finally:
+            self._slots.release()
+
+
+hasher = PasswordHasher(config.password_hash_workers, config.password_hash_queue_size, config.password_hash_timeout)
+
 
 def hash_password(provided_pw: str) -> bytes:
     """Hashes a password using bcrypt.hashpw
@@ -7,10 +57,13 @@ def hash_password(provided_pw: str) -> bytes:
     Args:
         provided_pw (str): Password to encrypt
 
+    Raises:
+        HasherBusy: If the password hasher is at capacity
+
     Returns:
         Encoded password (bytes)
     """
-    return bcrypt.hashpw(provided_pw.encode('utf-8'), bcrypt.gensalt())
+    return hasher.run(bcrypt.hashpw, provided_pw.encode('utf-8'), bcrypt.gensalt())
 
 
 def check_password(hashed_pw: str, provided_pw: str) -> bool:
@@ -20,7 +73,10 @@ def check_password(hashed_pw: str, provided_pw: str) -> bool:
         hashed_pw (str): hashed password (from db)
         provided_pw (str): password provided by user
 
+    Raises:
+        HasherBusy: If the password hasher is at capacity
+
     Returns:
         bool
     """
-    return bcrypt.checkpw(provided_pw.encode('utf-8'), hashed_pw.encode('utf-8'))
+    return hasher.run(bcrypt.checkpw, provided_pw.encode('utf-8'), hashed_pw.encode('utf-8'))
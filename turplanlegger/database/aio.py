@@ -0,0 +1,165 @@
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import psycopg
+from psycopg.types.composite import CompositeInfo
+from psycopg.types.enum import EnumInfo
+from psycopg_pool import AsyncConnectionPool
+
+from turplanlegger.database.base import Database
+from turplanlegger.utils.config import config
+from turplanlegger.utils.logger import log_db
+
+
+class AsyncDatabase(Database):
+    """asyncio twin of Database
+
+    Runs the queries of Database on a psycopg AsyncConnectionPool, every
+    query method returns an awaitable instead of the result:
+
+        user = User.get_user(await adb.get_user(id))
+
+    Creating the schema and the admin user is left to Database.init_db,
+    open() expects them to be in place. Connections are checked out per
+    query, or per unit_of_work(), and a task only holds one while its
+    query runs.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._unit_of_work = ContextVar('unit_of_work', default=None)
+
+    async def open(self) -> None:
+        """Look up the database types and open the connection pool"""
+        self.uri = config.database_uri
+        self.max_retries = config.database_max_retries
+        self.timeout = config.database_timeout
+        self.slow_query_ms = config.database_slow_query_ms
+
+        async with await psycopg.AsyncConnection.connect(conninfo=self.uri, autocommit=True) as conn:
+            self.access_level_info = await EnumInfo.fetch(conn, 'access_level')
+            self.composite_infos = tuple(
+                [await CompositeInfo.fetch(conn, table) for table in ('trip_dates', 'trip_permissions')]
+            )
+
+        self.pool = AsyncConnectionPool(
+            conninfo=self.uri,
+            kwargs=self._connect_kwargs(),
+            min_size=config.database_pool_min_size,
+            max_size=config.database_pool_max_size,
+            timeout=config.database_pool_timeout,
+            configure=self._configure_connection,
+            name='turplanlegger-async',
+            open=False,
+        )
+        try:
+            await self.pool.open(wait=True, timeout=self.timeout)
+        except Exception as e:
+            log_db.exception(str(e))
+            await self.pool.close()
+            raise RuntimeError(f'Database connect error. Failed to fill connection pool within {self.timeout}s.')
+        log_db.debug('Async database connection pool opened')
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def _connect_kwargs(self) -> dict:
+        kwargs = super()._connect_kwargs()
+        kwargs['cursor_factory'] = (
+            psycopg.AsyncCursor if config.database_cursor == 'server' else psycopg.AsyncClientCursor
+        )
+        return kwargs
+
+    async def _configure_connection(self, conn: psycopg.AsyncConnection) -> None:
+        super()._configure_connection(conn)
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        """Run every query in the block in a single transaction
+
+        The transaction belongs to the task, nested blocks join the
+        outermost one, an exception rolls back all of it.
+        """
+        if self._unit_of_work.get() is not None:
+            yield
+            return
+
+        async with self._cursor() as cur:
+            token = self._unit_of_work.set(cur)
+            try:
+                yield
+            finally:
+                self._unit_of_work.reset(token)
+
+    @asynccontextmanager
+    async def _cursor(self):
+        """Yield a cursor inside a transaction"""
+        cur = self._unit_of_work.get()
+        if cur is not None:
+            yield cur
+            return
+
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    yield cur
+
+    async def _insert(self, query, vars):
+        async with self._cursor() as cur:
+            await self._execute(cur, '_insert', query, vars)
+            return await cur.fetchone()
+
+    async def _insertmany(self, query, vars_list):
+        if not vars_list:
+            return []
+
+        async with self._cursor() as cur:
+            await self._execute(cur, '_insertmany', query, vars_list, many=True)
+            rows = [await cur.fetchone()]
+            while cur.nextset():
+                rows.append(await cur.fetchone())
+            return rows
+
+    async def _copy(self, create, copy, rows, insert, vars):
+        async with self._cursor() as cur:
+            await self._execute(cur, '_copy', create, None)
+            self._log(cur, '_copy', copy, None)
+            async with cur.copy(copy) as loader:
+                for row in rows:
+                    await loader.write_row(row)
+            await self._execute(cur, '_copy', insert, vars)
+            return await cur.fetchall()
+
+    async def _fetchone(self, query, vars):
+        async with self._cursor() as cur:
+            await self._execute(cur, '_fetchone', query, vars)
+            return await cur.fetchone()
+
+    async def _fetchall(self, query, vars):
+        async with self._cursor() as cur:
+            await self._execute(cur, '_fetchall', query, vars)
+            return await cur.fetchall()
+
+    async def _updateone(self, query, vars, returning=False):
+        async with self._cursor() as cur:
+            await self._execute(cur, '_updateone', query, vars)
+            return await cur.fetchone() if returning else None
+
+    async def _deleteone(self, query, vars, returning=False):
+        async with self._cursor() as cur:
+            await self._execute(cur, '_deleteone', query, vars)
+            return await cur.fetchone() if returning else None
+
+    async def _execute(self, cur, func_name, query, vars, many=False):
+        self._log(cur, func_name, query, vars, many)
+        start = time.perf_counter()
+        if many:
+            await cur.executemany(query, vars, returning=True)
+        else:
+            await cur.execute(query, vars)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if 0 < self.slow_query_ms <= duration_ms:
+            self._log_slow(cur, func_name, duration_ms)
@@ -1,20 +1,51 @@
+import logging
+import sys
+import threading
 import time
+from contextlib import contextmanager, nullcontext
+from functools import partial
 from uuid import UUID
 
 import psycopg
 import ujson
+from flask import g, has_app_context
 from psycopg.rows import TupleRow, namedtuple_row
+from psycopg.types.composite import CompositeInfo, register_composite
 from psycopg.types.enum import EnumInfo, register_enum
 from psycopg.types.json import Jsonb, set_json_dumps, set_json_loads
+from psycopg_pool import ConnectionPool
 
 from turplanlegger.models.access_level import AccessLevel
 from turplanlegger.utils.config import config
-from turplanlegger.utils.logger import log_db
+from turplanlegger.utils.logger import log_db, log_db_slow
+
+# Columns of routes besides route and its simplified versions in route_lod
+ROUTE_COLUMNS = (
+    'id, owner, name, comment, route_history, version, length, bbox, centroid, segment_lengths, points, '
+    'revision, create_time, deleted, delete_time'
+)
+# Tables with a revision, see schema.sql, and the permissions granting read access to them
+REVISION_TABLES = {
+    'item_lists': 'item_list_permissions',
+    'notes': 'note_permissions',
+    'routes': 'route_permissions',
+    'trips': 'trip_permissions',
+}
+# Rows fetched at a time by _stream
+STREAM_SIZE = 20
+# Square degrees, above which a viewport is assumed to hold most routes of an owner
+WIDE_VIEWPORT = 1.0
 
 
 class Database:
     def __init__(self, app=None):
         self.app = None
+        self.conn = None
+        self.pool = None
+        # Cursors are not thread safe, every thread gets its own
+        self._local = threading.local()
+        # Serializes transactions when all threads share a single connection
+        self._lock = threading.RLock()
         if app:
             self.init_db
 
@@ -22,11 +53,20 @@ class Database:
         self.uri = config.database_uri
         self.max_retries = config.database_max_retries
         self.timeout = config.database_timeout
+        self.slow_query_ms = config.database_slow_query_ms
+        if config.database_cursor not in ('client', 'server'):
+            raise RuntimeError(
+                f"Config entry DATABASE_CURSOR must be 'client' or 'server', not {config.database_cursor}"
+            )
 
         # Use a faster dump function
         set_json_dumps(ujson.dumps)
         set_json_loads(ujson.loads)
 
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
         self.conn = self.connect()
         log_db.debug('Database connection opened')
 
@@ -38,10 +78,19 @@ class Database:
                 log_db.exception(e)
                 raise
 
-        info = EnumInfo.fetch(self.conn, 'access_level')
-        register_enum(info, self.conn, AccessLevel)
-        # Create cursor with ENUM
-        self.cur = self.conn.cursor()
+        self.access_level_info = EnumInfo.fetch(self.conn, 'access_level')
+        self.composite_infos = tuple(
+            CompositeInfo.fetch(self.conn, table) for table in ('trip_dates', 'trip_permissions')
+        )
+        self._configure_connection(self.conn)
+
+        if config.database_pool is True:
+            # The pool takes over, the bootstrap connection is only used for the schema
+            self.conn.close()
+            self.conn = None
+            self.pool = self.create_pool()
+            app.teardown_appcontext(self.release_connection)
+            log_db.debug('Database connection pool opened')
 
         if config.create_admin_user is True and not self.check_admin_user(config.admin_email):
             log_db.debug('Did not find admin user, creating one')
@@ -49,17 +98,35 @@ class Database:
 
             create_admin_user(email=config.admin_email, password=config.admin_password)
 
+    def _connect_kwargs(self) -> dict:
+        """Connection options, config.database_cursor picks how parameters are bound
+
+        client: queries are interpolated client-side by ClientCursor
+        server: parameters are bound server-side, a query is prepared once it has
+                run config.database_prepare_threshold times on a connection
+        """
+        kwargs = {
+            'client_encoding': 'UTF8',
+            'cursor_factory': psycopg.ClientCursor,
+            'row_factory': namedtuple_row,
+            'autocommit': True,
+        }
+        if config.database_cursor == 'server':
+            kwargs['cursor_factory'] = psycopg.Cursor
+            kwargs['prepare_threshold'] = config.database_prepare_threshold
+        return kwargs
+
+    def _configure_connection(self, conn: psycopg.Connection) -> None:
+        """Register the access_level ENUM and the composite row types on a new connection"""
+        register_enum(self.access_level_info, conn, AccessLevel)
+        for info in self.composite_infos:
+            register_composite(info, conn)
+
     def connect(self):
         retry = 0
         while True:
             try:
-                conn = psycopg.connect(
-                    conninfo=self.uri,
-                    client_encoding='UTF8',
-                    cursor_factory=psycopg.ClientCursor,
-                    row_factory=namedtuple_row,
-                    autocommit=True,
-                )
+                conn = psycopg.connect(conninfo=self.uri, **self._connect_kwargs())
                 break
             except Exception as e:
                 log_db.exception(str(e))
@@ -76,11 +143,43 @@ class Database:
         else:
             raise RuntimeError(f'Database connect error. Failed to connect after {self.max_retries} retries.')
 
+    def create_pool(self) -> ConnectionPool:
+        """Open a connection pool sized by config.database_pool_min_size and database_pool_max_size"""
+        pool = ConnectionPool(
+            conninfo=self.uri,
+            kwargs=self._connect_kwargs(),
+            min_size=config.database_pool_min_size,
+            max_size=config.database_pool_max_size,
+            timeout=config.database_pool_timeout,
+            configure=self._configure_connection,
+            name='turplanlegger',
+            open=False,
+        )
+        try:
+            pool.open(wait=True, timeout=self.timeout)
+        except Exception as e:
+            log_db.exception(str(e))
+            pool.close()
+            raise RuntimeError(f'Database connect error. Failed to fill connection pool within {self.timeout}s.')
+        return pool
+
+    def pool_stats(self) -> dict:
+        """Connection pool metrics, e.g. requests_wait_ms and requests_queued
+
+        Returns an empty dict when not running in pooled mode"""
+        return self.pool.get_stats() if self.pool is not None else {}
+
+    def release_connection(self, exception=None) -> None:
+        """Return the connection checked out by the current request to the pool"""
+        conn = g.pop('db_conn', None)
+        if conn is not None:
+            self.pool.putconn(conn)
+
     def close(self, db):
         db.close()
 
     def destroy(self):
-        with self.conn.transaction():
+        with self._cursor() as cur:
             for table in [
                 'trips',
                 'trip_dates',
@@ -89,6 +188,7 @@ class Database:
                 'lists_items',
                 'users',
                 'routes',
+                'route_versions',
                 'route_permissions',
                 'notes',
                 'note_permissions',
@@ -97,12 +197,13 @@ class Database:
                 'trips_routes_references',
                 'trips_item_lists_references',
             ]:
-                self.cur.execute(psycopg.sql.SQL('DROP TABLE IF EXISTS {} CASCADE'.format(table)))
-            self.cur.execute('DROP TYPE access_level CASCADE')
+                cur.execute(psycopg.sql.SQL('DROP TABLE IF EXISTS {} CASCADE'.format(table)))
+            cur.execute('DROP TYPE access_level CASCADE')
+            cur.execute('DROP SEQUENCE IF EXISTS revisions')
 
     def truncate_table(self, table: str):
-        with self.conn.transaction():
-            self.cur.execute(psycopg.sql.SQL('TRUNCATE TABLE {} RESTART IDENTITY CASCADE'.format(table)))
+        with self._cursor() as cur:
+            cur.execute(psycopg.sql.SQL('TRUNCATE TABLE {} RESTART IDENTITY CASCADE'.format(table)))
 
     # Item List
 
@@ -124,7 +225,9 @@ class Database:
         """
         return self._insert(insert, vars(item_list))
 
-    def get_item_list_by_owner(self, owner_id: str, deleted=False):
+    def get_item_list_by_owner(
+        self, owner_id: str, deleted=False, limit: int = None, after: tuple = None, since: int = None
+    ):
         select = """
             SELECT * FROM item_lists WHERE owner = %s
         """
@@ -132,15 +235,16 @@ class Database:
             select += ' AND deleted = TRUE'
         else:
             select += ' AND deleted = FALSE'
-        return self._fetchall(select, (owner_id,))
+        select, vars = self._since(select, (owner_id,), since)
+        return self._fetchall(*self._paginate(select, vars, limit, after))
 
-    def get_public_item_lists(self, deleted=False):
+    def get_public_item_lists(self, deleted=False, limit: int = None, after: tuple = None):
         select = 'SELECT * FROM item_lists WHERE private = FALSE'
         if deleted:
             select += ' AND deleted = TRUE'
         else:
             select += ' AND deleted = FALSE'
-        return self._fetchall(select, [])
+        return self._fetchall(*self._paginate(select, (), limit, after))
 
     def delete_item_list(self, id):
         update = """
@@ -172,6 +276,29 @@ class Database:
         """
         return self._insert(insert, vars(item_list_item))
 
+    def create_list_items(self, item_list_items):
+        insert = """
+            INSERT INTO lists_items (content, checked, item_list, owner)
+            VALUES (%(content)s, %(checked)s, %(item_list)s, %(owner)s)
+            RETURNING *
+        """
+        return self._insertmany(insert, [vars(item) for item in item_list_items])
+
+    def copy_list_items(self, item_list_id: int, owner: UUID, items) -> list[int]:
+        """Load (content, checked) rows with COPY, returning the ids in the same order"""
+        create = """
+            CREATE TEMP TABLE import_lists_items (
+                n int GENERATED ALWAYS AS IDENTITY, content text, checked boolean
+            ) ON COMMIT DROP
+        """
+        copy = 'COPY import_lists_items (content, checked) FROM STDIN'
+        insert = """
+            INSERT INTO lists_items (content, checked, item_list, owner)
+            SELECT content, checked, %s, %s FROM import_lists_items ORDER BY n
+            RETURNING id
+        """
+        return self._copy(create, copy, items, insert, (item_list_id, owner))
+
     def delete_list_item(self, id):
         update = """
             UPDATE lists_items
@@ -197,6 +324,16 @@ class Database:
         """
         return self._updateone(update, {'id': id, 'checked': checked})
 
+    def toggle_list_items_check(self, item_list_id: int, ids: list[int]):
+        """Flip the checked flag of the items in ids that belong to the item list"""
+        update = """
+            UPDATE lists_items
+                SET checked = NOT checked
+                WHERE id = ANY(%(ids)s) AND item_list = %(item_list_id)s AND deleted = FALSE
+            RETURNING *
+        """
+        return self._fetchall(update, {'ids': ids, 'item_list_id': item_list_id})
+
     def get_list_item(self, id, deleted=False):
         select = """
             SELECT * FROM lists_items WHERE id = %s
@@ -222,8 +359,22 @@ class Database:
         elif checked is True:
             select += ' AND checked = TRUE'
 
+        # Items are returned in the order they were added, checking an item does not move it
+        select += ' ORDER BY id'
         return self._fetchall(select, [item_list_id])
 
+    def get_list_items_by_item_lists(self, item_list_ids: list[int], deleted=False):
+        """Select the items of several item lists at once"""
+        select = 'SELECT * FROM lists_items WHERE item_list = ANY(%s)'
+
+        if deleted:
+            select += ' AND deleted = TRUE'
+        else:
+            select += ' AND deleted = FALSE'
+
+        select += ' ORDER BY item_list, id'
+        return self._fetchall(select, (item_list_ids,))
+
     # Item list permissions
     def get_item_list_subject_permissions(self, object_id: int, subject_id: UUID):
         select = """
@@ -237,6 +388,11 @@ class Database:
         select = 'SELECT object_id, access_level, subject_id FROM item_list_permissions WHERE object_id = %s'
         return self._fetchall(select, (object_id,))
 
+    def get_item_list_permissions_by_item_lists(self, object_ids: list[int]):
+        """Select the permissions of several item lists at once"""
+        select = 'SELECT object_id, access_level, subject_id FROM item_list_permissions WHERE object_id = ANY(%s)'
+        return self._fetchall(select, (object_ids,))
+
     def create_item_list_permissions(self, permission):
         insert = """
             INSERT INTO item_list_permissions (object_id, subject_id, access_level)
@@ -245,6 +401,14 @@ class Database:
         """
         return self._insert(insert, vars(permission))
 
+    def create_item_list_permissions_many(self, permissions):
+        insert = """
+            INSERT INTO item_list_permissions (object_id, subject_id, access_level)
+            VALUES (%(object_id)s, %(subject_id)s, %(access_level)s)
+            RETURNING *
+        """
+        return self._insertmany(insert, [vars(permission) for permission in permissions])
+
     def delete_item_list_permissions(self, object_id: int, subject_id: UUID):
         """Delete permission by primary key"""
         del_perms = 'DELETE FROM item_list_permissions WHERE object_id = %(object_id)s AND subject_id = %(subject_id)s'
@@ -261,30 +425,192 @@ class Database:
         return self._updateone(update, vars(permission), returning=True)
 
     # Route
-    def get_route(self, id, deleted=False):
-        select = 'SELECT * FROM routes WHERE id = %s'
-
+    def get_route(self, id, deleted=False, detail: int = None):
+        """Select a route, with the version simplified for the zoom level detail as route if given"""
+        select, params = self._route_select(detail)
+        select += ' WHERE id = %s'
         if deleted:
             select += ' AND deleted = TRUE'
         else:
             select += ' AND deleted = FALSE'
-        return self._fetchone(select, (id,))
-
-    def get_routes_by_owner(self, owner_id: str, deleted=False):
-        select = 'SELECT * FROM routes WHERE owner = %s'
+        return self._fetchone(select, (*params, id))
+
+    def get_routes_by_owner(
+        self,
+        owner_id: str,
+        deleted=False,
+        limit: int = None,
+        after: tuple = None,
+        detail: int = None,
+        since: int = None,
+    ):
+        select, params = self._route_select(detail)
+        select += ' WHERE owner = %s'
         if deleted:
             select += ' AND deleted = TRUE'
         else:
             select += ' AND deleted = FALSE'
-        return self._fetchall(select, (owner_id,))
+        select, vars = self._since(select, (*params, owner_id), since)
+        return self._fetchall(*self._paginate(select, vars, limit, after))
+
+    def get_trip_routes_stream(self, trip_id: int, subject_id: UUID):
+        """Stream the routes of a trip that subject_id can read, oldest first, see _stream"""
+        select, params = self._route_select()
+        select += """
+            WHERE id IN (SELECT route_id FROM trips_routes_references WHERE trip_id = %s)
+                AND (owner = %s OR id IN (SELECT object_id FROM route_permissions WHERE subject_id = %s))
+                AND deleted = FALSE
+            ORDER BY create_time, id
+        """
+        return self._stream(select, (*params, trip_id, subject_id, subject_id))
+
+    def get_routes_in_bbox(
+        self, subject_id: UUID, bbox: tuple, limit: int = None, after: tuple = None, detail: int = None
+    ):
+        """Select the routes subject_id can read with a bounding box intersecting bbox
+
+        Owned and shared routes are selected apart, so that each can use the
+        index that suits it, and only the routes of the page are read in full.
+        The planner can not tell how many routes a viewport holds, for a wide
+        one the owned routes are filtered on the bounding box without
+        routes_bbox_idx, scanning the owner index in order until the page is
+        full. Routes stored before routes were measured have no bounding box
+        and are left out
+        """
+        intersects = """
+            box(point(bbox[1], bbox[2]), point(bbox[3], bbox[4])) && box(point(%s, %s), point(%s, %s))
+            AND deleted = FALSE
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        if (max_lon - min_lon) * (max_lat - min_lat) > WIDE_VIEWPORT:
+            owned_filter = 'bbox[1] <= %s AND bbox[2] <= %s AND bbox[3] >= %s AND bbox[4] >= %s AND deleted = FALSE'
+            owned_bbox = (max_lon, max_lat, min_lon, min_lat)
+        else:
+            owned_filter, owned_bbox = intersects, bbox
+        owned, owned_vars = self._paginate(
+            f'SELECT id, create_time FROM routes WHERE owner = %s AND {owned_filter}',
+            (subject_id, *owned_bbox),
+            limit,
+            after,
+        )
+        shared, shared_vars = self._paginate(
+            f"""
+                SELECT id, create_time FROM routes
+                WHERE id IN (SELECT object_id FROM route_permissions WHERE subject_id = %s)
+                AND owner != %s AND {intersects}
+            """,
+            (subject_id, subject_id, *bbox),
+            limit,
+            after,
+        )
+        page = f'({owned}) UNION ALL ({shared}) ORDER BY create_time, id'
+        page_vars = (*owned_vars, *shared_vars)
+        if limit is not None:
+            page += ' LIMIT %s'
+            page_vars = (*page_vars, limit)
+
+        select, params = self._route_select(detail)
+        select += f' WHERE id IN (SELECT id FROM ({page}) page) ORDER BY create_time, id'
+        return self._fetchall(select, (*params, *page_vars))
+
+    def _route_select(self, detail: int = None) -> tuple[str, tuple]:
+        """SELECT of routes, with the version simplified for the zoom level detail as route if given
+
+        detail is the zoom level of the version selected, NULL for the
+        full route. Routes too short to simplify only have the full route
+        """
+        if detail is None:
+            return f'SELECT {ROUTE_COLUMNS}, route, NULL::int AS detail FROM routes', ()
+        select = f"""
+            SELECT {ROUTE_COLUMNS}, COALESCE(route_lod -> %s, route) AS route,
+                CASE WHEN route_lod ? %s THEN %s::int END AS detail
+            FROM routes
+        """
+        return select, (str(detail), str(detail), detail)
 
-    def create_route(self, route, owner, name, comment):
+    def create_route(self, route, owner, name, comment, route_lod=None, stats=None):
+        insert = f"""
+            INSERT INTO routes (route, owner, name, comment, route_lod, length, bbox, centroid, segment_lengths, points)
+            VALUES (
+                %(route)s, %(owner)s, %(name)s, %(comment)s, %(route_lod)s,
+                %(length)s, %(bbox)s, %(centroid)s, %(segment_lengths)s, %(points)s
+            )
+            RETURNING {ROUTE_COLUMNS}, route, NULL::int AS detail
+        """
+        return self._insert(
+            insert,
+            {
+                'route': Jsonb(route),
+                'owner': owner,
+                'name': name,
+                'comment': comment,
+                'route_lod': Jsonb(route_lod or {}),
+                **self._route_stats(stats),
+            },
+        )
+
+    def update_route(self, id, route, name, comment, route_lod=None, stats=None):
+        update = f"""
+            UPDATE routes
+                SET route=%(route)s, name=%(name)s, comment=%(comment)s, route_lod=%(route_lod)s,
+                    length=%(length)s, bbox=%(bbox)s, centroid=%(centroid)s,
+                    segment_lengths=%(segment_lengths)s, points=%(points)s, version=version + 1
+                WHERE id = %(id)s AND deleted = FALSE
+            RETURNING {ROUTE_COLUMNS}, route, NULL::int AS detail
+        """
+        return self._updateone(
+            update,
+            {
+                'id': id,
+                'route': Jsonb(route),
+                'name': name,
+                'comment': comment,
+                'route_lod': Jsonb(route_lod or {}),
+                **self._route_stats(stats),
+            },
+            returning=True,
+        )
+
+    @staticmethod
+    def _route_stats(stats) -> dict:
+        """Query parameters of the RouteStats columns, NULL if not measured"""
+        if stats is None:
+            return dict.fromkeys(('length', 'bbox', 'centroid', 'segment_lengths', 'points'))
+        return {
+            'length': stats.length,
+            'bbox': list(stats.bbox) if stats.bbox else None,
+            'centroid': list(stats.centroid) if stats.centroid else None,
+            'segment_lengths': list(stats.segment_lengths),
+            'points': stats.points,
+        }
+
+    def lock_route(self, id):
+        """Select the route and lock it until the end of the transaction"""
+        select = 'SELECT * FROM routes WHERE id = %s AND deleted = FALSE FOR UPDATE'
+        return self._fetchone(select, (id,))
+
+    # Route version
+    def create_route_version(self, route_id: int, version: int, patch: dict) -> TupleRow:
         insert = """
-            INSERT INTO routes (route, owner, name, comment)
-            VALUES (%(route)s, %(owner)s, %(name)s, %(comment)s)
-            RETURNING *
+            INSERT INTO route_versions (route_id, version, patch)
+            VALUES (%(route_id)s, %(version)s, %(patch)s)
+            RETURNING route_id, version, create_time
         """
-        return self._insert(insert, {'route': Jsonb(route), 'owner': owner, 'name': name, 'comment': comment})
+        return self._insert(insert, {'route_id': route_id, 'version': version, 'patch': Jsonb(patch)})
+
+    def get_route_versions(self, route_id: int) -> list[TupleRow]:
+        """Select the version numbers of a route and when they were replaced"""
+        select = 'SELECT version, create_time FROM route_versions WHERE route_id = %s ORDER BY version'
+        return self._fetchall(select, (route_id,))
+
+    def get_route_patches(self, route_id: int, version: int) -> list[TupleRow]:
+        """Select the patches back to version, latest first"""
+        select = """
+            SELECT version, patch FROM route_versions
+                WHERE route_id = %s AND version >= %s
+                ORDER BY version DESC
+        """
+        return self._fetchall(select, (route_id, version))
 
     def delete_route(self, id):
         update = """
@@ -339,14 +665,17 @@ class Database:
             select += ' AND deleted = FALSE'
         return self._fetchone(select, (id,))
 
-    def get_note_by_owner(self, owner_id: str, deleted=False):
+    def get_note_by_owner(
+        self, owner_id: str, deleted=False, limit: int = None, after: tuple = None, since: int = None
+    ):
         select = 'SELECT * FROM notes WHERE owner = %s'
 
         if deleted:
             select += ' AND deleted = TRUE'
         else:
             select += ' AND deleted = FALSE'
-        return self._fetchall(select, (owner_id,))
+        select, vars = self._since(select, (owner_id,), since)
+        return self._fetchall(*self._paginate(select, vars, limit, after))
 
     def create_note(self, note):
         insert = """
@@ -356,6 +685,21 @@ class Database:
         """
         return self._insert(insert, vars(note))
 
+    def copy_notes(self, owner: UUID, notes) -> list[int]:
+        """Load (name, content, private) rows with COPY, returning the ids in the same order"""
+        create = """
+            CREATE TEMP TABLE import_notes (
+                n int GENERATED ALWAYS AS IDENTITY, name text, content text, private boolean
+            ) ON COMMIT DROP
+        """
+        copy = 'COPY import_notes (name, content, private) FROM STDIN'
+        insert = """
+            INSERT INTO notes (name, content, private, owner)
+            SELECT name, content, private, %s FROM import_notes ORDER BY n
+            RETURNING id
+        """
+        return self._copy(create, copy, notes, insert, (owner,))
+
     def update_note(self, note):
         update = """
             UPDATE notes SET
@@ -447,7 +791,7 @@ class Database:
         select = 'SELECT * FROM users WHERE'
 
         if type == 'email':
-            select += ' email = %s'
+            select += ' lower(email) = lower(%s)'
 
         if deleted:
             select += ' AND deleted = TRUE'
@@ -491,7 +835,7 @@ class Database:
         return self._updateone(update, {'id': id, 'private': private})
 
     def check_admin_user(self, email):
-        select = 'SELECT id FROM users WHERE email=%s'
+        select = 'SELECT id FROM users WHERE lower(email) = lower(%s)'
         return self._fetchone(select, (email,))
 
     # Trip
@@ -559,24 +903,62 @@ class Database:
         """
         return self._insert(insert_ref, {'trip_id': trip_id, 'route_id': route_id})
 
-    def get_trip(self, trip_id: int, deleted=False):
-        select = 'SELECT * FROM trips WHERE id = %s'
+    # A trip with all of its children, aggregated in one statement.
+    # Dates and permissions are arrays of table rows, loaded as composites
+    _trip_hydrated_select = """
+        SELECT trips.*,
+            COALESCE(permissions.rows, '{}') AS permissions,
+            COALESCE(dates.rows, '{}') AS dates,
+            COALESCE(notes.ids, '{}') AS notes,
+            COALESCE(routes.ids, '{}') AS routes,
+            COALESCE(item_lists.ids, '{}') AS item_lists
+        FROM trips
+        LEFT JOIN LATERAL (
+            SELECT array_agg(trip_permissions) AS rows
+            FROM trip_permissions WHERE object_id = trips.id
+        ) permissions ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT array_agg(trip_dates ORDER BY start_time ASC) AS rows
+            FROM trip_dates WHERE trip_id = trips.id AND deleted = FALSE
+        ) dates ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT array_agg(note_id) AS ids
+            FROM trips_notes_references WHERE trip_id = trips.id
+        ) notes ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT array_agg(route_id) AS ids
+            FROM trips_routes_references WHERE trip_id = trips.id
+        ) routes ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT array_agg(item_list_id) AS ids
+            FROM trips_item_lists_references WHERE trip_id = trips.id
+        ) item_lists ON TRUE
+    """
+
+    def get_trip_hydrated(self, trip_id: int, deleted=False):
+        """Select a trip along with permissions, dates and references"""
+        select = self._trip_hydrated_select + ' WHERE trips.id = %s'
 
         if deleted:
-            select += ' AND deleted = TRUE'
+            select += ' AND trips.deleted = TRUE'
         else:
-            select += ' AND deleted = FALSE'
+            select += ' AND trips.deleted = FALSE'
 
         return self._fetchone(select, (trip_id,))
 
-    def get_trips_by_owner(self, owner_id: str, deleted=False):
-        select = 'SELECT * FROM trips WHERE owner = %s'
+    def get_trips_hydrated_by_owner(
+        self, owner_id: str, deleted=False, limit: int = None, after: tuple = None, since: int = None
+    ):
+        """Select trips of an owner along with permissions, dates and references"""
+        select = self._trip_hydrated_select + ' WHERE trips.owner = %s'
 
         if deleted:
-            select += ' AND deleted = TRUE'
+            select += ' AND trips.deleted = TRUE'
         else:
-            select += ' AND deleted = FALSE'
-        return self._fetchall(select, (owner_id,))
+            select += ' AND trips.deleted = FALSE'
+
+        select, vars = self._since(select, (owner_id,), since, table='trips')
+        return self._fetchall(*self._paginate(select, vars, limit, after, table='trips'))
 
     # Trip permissions
     def get_trip_subject_permissions(self, trip_id: int, owner_id: UUID):
@@ -595,6 +977,14 @@ class Database:
         """
         return self._insert(insert_trip_permission, vars(trip_permission))
 
+    def create_trip_permissions_many(self, trip_permissions):
+        insert_trip_permission = """
+            INSERT INTO trip_permissions (object_id, subject_id, access_level)
+            VALUES (%(object_id)s, %(subject_id)s, %(access_level)s)
+            RETURNING *
+        """
+        return self._insertmany(insert_trip_permission, [vars(permission) for permission in trip_permissions])
+
     def get_trip_notes(self, id):
         select = 'SELECT note_id FROM trips_notes_references WHERE trip_id = %s'
         return self._fetchall(select, (id,))
@@ -604,7 +994,7 @@ class Database:
         return self._fetchall(select, (id,))
 
     def get_trip_item_lists(self, id):
-        select = 'SELECT item_list_id FROM trips_item_lists_references WHERE item_list_id = %s'
+        select = 'SELECT item_list_id FROM trips_item_lists_references WHERE trip_id = %s'
         return self._fetchall(select, (id,))
 
     # Trip Date
@@ -620,6 +1010,18 @@ class Database:
         """
         return self._insert(insert, vars(trip_date))
 
+    def create_trip_dates(self, trip_dates):
+        insert = """
+            INSERT INTO trip_dates (
+                trip_id, start_time, end_time, owner, selected
+            )
+            VALUES (
+                %(trip_id)s, %(start_time)s, %(end_time)s, %(owner)s, %(selected)s
+            )
+            RETURNING *
+        """
+        return self._insertmany(insert, [vars(trip_date) for trip_date in trip_dates])
+
     def update_trip_date(self, trip_date):
         update = """
             UPDATE trip_dates
@@ -681,55 +1083,281 @@ class Database:
         """
         return self._updateone(update, {'id': trip_date_id}, returning=True)
 
+    # Revision
+    def get_revision(self, table: str, id: int, subject_id: UUID):
+        """Select the revision of a row of one of REVISION_TABLES if subject_id may read it
+
+        Routes are read by their owner and those they are shared with,
+        the others also by anyone if they are not private
+        """
+        public = '' if table == 'routes' else 'private = FALSE OR '
+        select = f"""
+            SELECT revision FROM {table}
+            WHERE id = %(id)s AND deleted = FALSE AND (
+                {public}owner = %(subject_id)s
+                OR EXISTS (
+                    SELECT 1 FROM {REVISION_TABLES[table]} WHERE object_id = %(id)s AND subject_id = %(subject_id)s
+                )
+            )
+        """
+        rec = self._fetchone(select, {'id': id, 'subject_id': subject_id})
+        return rec.revision if rec else None
+
+    def lock_revision(self, table: str, id: int):
+        """Select the revision of a row of one of REVISION_TABLES, locking the row until the transaction ends"""
+        rec = self._fetchone(f'SELECT revision FROM {table} WHERE id = %s AND deleted = FALSE FOR UPDATE', (id,))
+        return rec.revision if rec else None
+
+    # Sync
+    def get_sync_token(self) -> int:
+        """Select the oldest transaction still running
+
+        A change that is not visible yet is made by it or a later one,
+        see _since
+        """
+        return int(self._fetchone('SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS xid', ()).xid)
+
+    def get_deleted_ids(self, table: str, owner_id: UUID, since: int):
+        """Select the ids of rows of one of REVISION_TABLES deleted since the sync token since"""
+        select, vars = self._since(f'SELECT id FROM {table} WHERE owner = %s AND deleted = TRUE', (owner_id,), since)
+        return [rec.id for rec in self._fetchall(select + ' ORDER BY id', vars)]
+
     # Helpers
+    @staticmethod
+    def _since(select: str, vars: tuple, since: int = None, table: str = None):
+        """Append a filter on rows changed since a sync token to a select
+
+        Rows changed by the transaction of the token or a later one are
+        kept, some of them may have been read by the last sync already
+
+        Args:
+            select (str): Query with a WHERE clause
+            vars (tuple): Query parameters
+            since (int): Sync token from get_sync_token, None for all rows
+            table (str): Qualifies the change_xid column
+
+        Returns:
+            The query and its parameters
+        """
+        if since is None:
+            return select, vars
+        column = f'{table}.change_xid' if table else 'change_xid'
+        return f'{select} AND {column} >= %s::xid8', (*vars, str(since))
+
+    @staticmethod
+    def _paginate(select: str, vars: tuple, limit: int = None, after: tuple = None, table: str = None):
+        """Append keyset pagination on (create_time, id) to a select
+
+        Args:
+            select (str): Query with a WHERE clause
+            vars (tuple): Query parameters
+            limit (int): Max number of rows, None for all
+            after (tuple): Keyset (create_time, id) to continue after
+            table (str): Qualifies the keyset columns
+
+        Returns:
+            The query and its parameters
+        """
+        columns = f'{table}.create_time, {table}.id' if table else 'create_time, id'
+        if after is not None:
+            select += f' AND ({columns}) > (%s, %s)'
+            vars = (*vars, *after)
+        select += f' ORDER BY {columns}'
+        if limit is not None:
+            select += ' LIMIT %s'
+            vars = (*vars, limit)
+        return select, vars
+
+    @contextmanager
+    def _connection(self):
+        """Yield a database connection
+
+        In pooled mode a connection is checked out once per request and
+        returned on app context teardown. Outside of a request it is only
+        checked out for the duration of the block.
+        """
+        if self.pool is None:
+            yield self.conn
+        elif has_app_context():
+            if 'db_conn' not in g:
+                g.db_conn = self._getconn()
+            yield g.db_conn
+        else:
+            with self.pool.connection() as conn:
+                yield conn
+
+    def _getconn(self) -> psycopg.Connection:
+        start = time.perf_counter()
+        conn = self.pool.getconn()
+        log_db.debug(f'Waited {(time.perf_counter() - start) * 1000:.2f}ms for a pooled connection')
+        return conn
+
+    def _thread_cursor(self, conn: psycopg.Connection) -> psycopg.Cursor:
+        cur = getattr(self._local, 'cur', None)
+        if cur is None or cur.closed or cur.connection is not conn:
+            cur = self._local.cur = conn.cursor()
+        return cur
+
+    @contextmanager
+    def unit_of_work(self):
+        """Run every query in the block in a single transaction
+
+        Creating an aggregate, like an item list with its items and
+        permissions, otherwise commits once per row. Nested blocks join
+        the outermost one, an exception rolls back all of it.
+        """
+        if getattr(self._local, 'unit_of_work', None) is not None:
+            yield
+            return
+
+        with self._cursor() as cur:
+            self._local.unit_of_work = cur
+            try:
+                yield
+            finally:
+                self._local.unit_of_work = None
+
+    @contextmanager
+    def _cursor(self):
+        """Yield this thread's cursor inside a transaction"""
+        cur = getattr(self._local, 'unit_of_work', None)
+        if cur is not None:
+            yield cur
+            return
+
+        with self._connection() as conn:
+            with self._lock if self.pool is None else nullcontext():
+                with conn.transaction():
+                    yield self._thread_cursor(conn)
+
     def _insert(self, query, vars):
         """
         Insert, with return.
         """
-        self._log('_insert', query, vars)
-        with self.conn.transaction():
-            self.cur.execute(query, vars)
-            return self.cur.fetchone()
+        with self._cursor() as cur:
+            self._execute(cur, '_insert', query, vars)
+            return cur.fetchone()
+
+    def _insertmany(self, query, vars_list):
+        """
+        Insert several rows, with return.
+        The statements are pipelined, so it is one round-trip for all the rows.
+        """
+        if not vars_list:
+            return []
+
+        with self._cursor() as cur:
+            self._execute(cur, '_insertmany', query, vars_list, many=True)
+            rows = [cur.fetchone()]
+            while cur.nextset():
+                rows.append(cur.fetchone())
+            return rows
+
+    def _copy(self, create, copy, rows, insert, vars):
+        """
+        Load rows into a temporary table with COPY and insert them from there, with return.
+        COPY can not return the generated ids, the temporary table is dropped on commit.
+        An exception while reading rows rolls back all of them.
+        """
+        with self._cursor() as cur:
+            self._execute(cur, '_copy', create, None)
+            self._log(cur, '_copy', copy, None)
+            with cur.copy(copy) as loader:
+                for row in rows:
+                    loader.write_row(row)
+            self._execute(cur, '_copy', insert, vars)
+            return cur.fetchall()
 
     def _fetchone(self, query, vars):
         """
         Return none or one row.
         """
-        self._log('_fetchone', query, vars)
-        with self.conn.transaction():
-            self.cur.execute(query, vars)
-            return self.cur.fetchone()
+        with self._cursor() as cur:
+            self._execute(cur, '_fetchone', query, vars)
+            return cur.fetchone()
 
     def _fetchall(self, query, vars):
         """
         Return none or multiple row.
         """
-        self._log('_fetchall', query, vars)
-        with self.conn.transaction():
-            self.cur.execute(query, vars)
-            return self.cur.fetchall()
+        with self._cursor() as cur:
+            self._execute(cur, '_fetchall', query, vars)
+            return cur.fetchall()
+
+    def _stream(self, query, vars, size=STREAM_SIZE):
+        """
+        Yield rows from a server-side cursor, fetching size rows at a time.
+        The transaction is open until the generator is exhausted or closed,
+        with a single connection no other thread can run a query meanwhile.
+        """
+        with self._connection() as conn:
+            with self._lock if self.pool is None else nullcontext():
+                with conn.transaction():
+                    with conn.cursor(name='stream') as cur:
+                        cur.itersize = size
+                        self._execute(cur, '_stream', query, vars)
+                        yield from cur
 
     def _updateone(self, query, vars, returning=False):
         """
         Update, with optional return.
         """
-        self._log('_updateone', query, vars)
-        with self.conn.transaction():
-            self.cur.execute(query, vars)
-            return self.cur.fetchone() if returning else None
+        with self._cursor() as cur:
+            self._execute(cur, '_updateone', query, vars)
+            return cur.fetchone() if returning else None
 
     def _deleteone(self, query, vars, returning=False):
         """
         Delete, with optional return.
         """
-        self._log('_deleteone', query, vars)
-        with self.conn.transaction():
-            self.cur.execute(query, vars)
-            return self.cur.fetchone() if returning else None
+        with self._cursor() as cur:
+            self._execute(cur, '_deleteone', query, vars)
+            return cur.fetchone() if returning else None
 
-    def _log(self, func_name, query, vars):
-        log_db.debug(
-            '\n{stars} {func_name} {stars}\n{query}'.format(
-                stars='*' * 20, func_name=func_name, query=self.cur.mogrify(query, vars)
-            )
+    def _execute(self, cur, func_name, query, vars, many=False):
+        """Execute on cur, logging the query and, if slow, its duration
+
+        With many, vars is a list and the query is run once for each,
+        keeping the result of every execution.
+        """
+        self._log(cur, func_name, query, vars, many)
+        execute = partial(cur.executemany, returning=True) if many else cur.execute
+
+        if self.slow_query_ms <= 0:
+            return execute(query, vars)
+
+        start = time.perf_counter()
+        execute(query, vars)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= self.slow_query_ms:
+            self._log_slow(cur, func_name, duration_ms)
+
+    def _log(self, cur, func_name, query, vars, many=False):
+        # Interpolating the query is expensive, only do it when it gets logged
+        if not log_db.isEnabledFor(logging.DEBUG):
+            return
+
+        if many:
+            query = f'{query}\n-- executed {len(vars)} times'
+        elif isinstance(cur, (psycopg.ClientCursor, psycopg.AsyncClientCursor)):
+            query = cur.mogrify(query, vars)
+        else:
+            query = f'{query}\n-- vars: {vars!r}'
+        log_db.debug('\n{stars} {func_name} {stars}\n{query}'.format(stars='*' * 20, func_name=func_name, query=query))
+
+    def _log_slow(self, cur, func_name, duration_ms):
+        # The Database method is the last frame in this package, the caller the first one outside of it
+        method, caller = func_name, None
+        frame = sys._getframe(1)
+        while frame is not None:
+            if frame.f_globals.get('__name__', '').startswith(__package__):
+                method = frame.f_code.co_name
+            else:
+                caller = f'{frame.f_globals.get("__name__")}.{frame.f_code.co_name}'
+                break
+            frame = frame.f_back
+
+        log_db_slow.warning(
+            f'Slow query: {method} took {duration_ms:.1f}ms, {cur.rowcount} rows, called from {caller}',
+            extra={'duration_ms': round(duration_ms, 3), 'rows': cur.rowcount, 'method': method, 'caller': caller},
         )
@@ -5,6 +5,9 @@ BEGIN
     END IF;
 END$$;
 
+-- Revision of trips, notes, routes and item lists, see the triggers at the end
+CREATE SEQUENCE IF NOT EXISTS revisions;
+
 CREATE TABLE IF NOT EXISTS users (
     id UUID PRIMARY KEY,
     name text NOT NULL,
@@ -25,11 +28,40 @@ CREATE TABLE IF NOT EXISTS routes (
     name text,
     comment text,
     owner UUID REFERENCES users (id),
+    version int NOT NULL DEFAULT 1,
+    route_lod jsonb,
+    length double precision,
+    bbox double precision[],
+    centroid double precision[],
+    segment_lengths double precision[],
+    points int,
+    revision bigint NOT NULL DEFAULT nextval('revisions'),
+    change_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
     create_time timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
     deleted boolean DEFAULT FALSE,
     delete_time timestamp with time zone
 );
 
+ALTER TABLE routes ADD COLUMN IF NOT EXISTS version int NOT NULL DEFAULT 1;
+-- Simplified versions of route by zoom level, see turplanlegger.geo.simplify
+ALTER TABLE routes ADD COLUMN IF NOT EXISTS route_lod jsonb;
+-- Measured from route on create and update, see turplanlegger.geo.stats
+ALTER TABLE routes
+    ADD COLUMN IF NOT EXISTS length double precision,
+    ADD COLUMN IF NOT EXISTS bbox double precision[],
+    ADD COLUMN IF NOT EXISTS centroid double precision[],
+    ADD COLUMN IF NOT EXISTS segment_lengths double precision[],
+    ADD COLUMN IF NOT EXISTS points int;
+
+-- Earlier versions of a route, each as the patch from the version after it
+CREATE TABLE IF NOT EXISTS route_versions (
+    route_id int NOT NULL REFERENCES routes (id) ON DELETE CASCADE,
+    version int NOT NULL,
+    patch jsonb NOT NULL,
+    create_time timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (route_id, version)
+);
+
 CREATE TABLE IF NOT EXISTS route_permissions (
     object_id int NOT NULL REFERENCES routes (id) ON DELETE CASCADE,
     subject_id UUID NOT NULL REFERENCES users (id),
@@ -42,6 +74,8 @@ CREATE TABLE IF NOT EXISTS item_lists (
     name text,
     private boolean DEFAULT TRUE,
     owner UUID REFERENCES users (id),
+    revision bigint NOT NULL DEFAULT nextval('revisions'),
+    change_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
     create_time timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
     deleted boolean DEFAULT FALSE,
     delete_time timestamp with time zone
@@ -71,6 +105,8 @@ CREATE TABLE IF NOT EXISTS notes (
     content text NOT NULL,
     private boolean DEFAULT TRUE,
     owner UUID NOT NULL REFERENCES users (id),
+    revision bigint NOT NULL DEFAULT nextval('revisions'),
+    change_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
     create_time timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
     update_time timestamp with time zone,
     deleted boolean DEFAULT FALSE,
@@ -89,6 +125,8 @@ CREATE TABLE IF NOT EXISTS trips (
     name text NOT NULL,
     private boolean DEFAULT TRUE,
     owner UUID NOT NULL REFERENCES users (id),
+    revision bigint NOT NULL DEFAULT nextval('revisions'),
+    change_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
     create_time timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
     update_time timestamp with time zone,
     deleted boolean DEFAULT FALSE,
@@ -131,3 +169,112 @@ CREATE TABLE IF NOT EXISTS trips_item_lists_references (
     item_list_id int NOT NULL REFERENCES item_lists (id) ON DELETE CASCADE,
     PRIMARY KEY (trip_id, item_list_id)
 );
+
+-- Lookups by owner are paginated on (create_time, id)
+CREATE INDEX IF NOT EXISTS routes_owner_idx ON routes (owner, create_time, id) WHERE deleted = FALSE;
+CREATE INDEX IF NOT EXISTS notes_owner_idx ON notes (owner, create_time, id) WHERE deleted = FALSE;
+CREATE INDEX IF NOT EXISTS trips_owner_idx ON trips (owner, create_time, id) WHERE deleted = FALSE;
+CREATE INDEX IF NOT EXISTS item_lists_owner_idx ON item_lists (owner, create_time, id) WHERE deleted = FALSE;
+CREATE INDEX IF NOT EXISTS item_lists_public_idx ON item_lists (create_time, id) WHERE private = FALSE AND deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS lists_items_item_list_idx ON lists_items (item_list, id) WHERE deleted = FALSE;
+CREATE INDEX IF NOT EXISTS trip_dates_trip_id_idx ON trip_dates (trip_id, start_time) WHERE deleted = FALSE;
+
+-- Viewport search on the bounding box measured from the route
+CREATE INDEX IF NOT EXISTS routes_bbox_idx ON routes
+    USING gist (box(point(bbox[1], bbox[2]), point(bbox[3], bbox[4]))) WHERE deleted = FALSE;
+
+-- Not unique, existing databases may hold emails that only differ in case
+DROP INDEX IF EXISTS users_email_idx;
+CREATE INDEX IF NOT EXISTS users_email_lower_idx ON users (lower(email)) WHERE deleted = FALSE;
+
+-- The primary keys cover lookups by object, these cover lookups by subject
+CREATE INDEX IF NOT EXISTS route_permissions_subject_idx ON route_permissions (subject_id);
+CREATE INDEX IF NOT EXISTS item_list_permissions_subject_idx ON item_list_permissions (subject_id);
+CREATE INDEX IF NOT EXISTS note_permissions_subject_idx ON note_permissions (subject_id);
+CREATE INDEX IF NOT EXISTS trip_permissions_subject_idx ON trip_permissions (subject_id);
+
+-- Stamped with the next revision on every change to the row and to the rows
+-- it is made of, like its permissions, items or dates. Strong ETags and the
+-- If-Match precondition are made from it, see turplanlegger.utils.response
+ALTER TABLE routes ADD COLUMN IF NOT EXISTS revision bigint NOT NULL DEFAULT nextval('revisions');
+ALTER TABLE item_lists ADD COLUMN IF NOT EXISTS revision bigint NOT NULL DEFAULT nextval('revisions');
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS revision bigint NOT NULL DEFAULT nextval('revisions');
+ALTER TABLE trips ADD COLUMN IF NOT EXISTS revision bigint NOT NULL DEFAULT nextval('revisions');
+
+-- Transaction of the last change, stamped with the revision. A sync is read
+-- from the changes of the transactions since the oldest one running at the
+-- last sync, see turplanlegger.models.sync
+ALTER TABLE routes ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE item_lists ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE trips ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+
+CREATE INDEX IF NOT EXISTS routes_change_idx ON routes (owner, change_xid);
+CREATE INDEX IF NOT EXISTS item_lists_change_idx ON item_lists (owner, change_xid);
+CREATE INDEX IF NOT EXISTS notes_change_idx ON notes (owner, change_xid);
+CREATE INDEX IF NOT EXISTS trips_change_idx ON trips (owner, change_xid);
+
+CREATE OR REPLACE FUNCTION stamp_revision() RETURNS trigger AS $$
+BEGIN
+    IF NEW IS DISTINCT FROM OLD THEN
+        -- Unless it is stamped for a change of the rows it is made of
+        IF NEW.revision = OLD.revision THEN
+            NEW.revision := nextval('revisions');
+        END IF;
+        NEW.change_xid := pg_current_xact_id();
+    END IF;
+    RETURN NEW;
+END$$ LANGUAGE plpgsql;
+
+-- Once per statement, a bulk insert of list items stamps the item list once
+CREATE OR REPLACE FUNCTION stamp_parent_revision() RETURNS trigger AS $$
+BEGIN
+    EXECUTE format(
+        'UPDATE %I SET revision = nextval(''revisions'') WHERE id IN (SELECT %I FROM changed)',
+        TG_ARGV[0], TG_ARGV[1]
+    );
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    parent text;
+    child record;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['routes', 'item_lists', 'notes', 'trips'] LOOP
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER %I BEFORE UPDATE ON %I FOR EACH ROW EXECUTE FUNCTION stamp_revision()',
+            parent || '_revision', parent
+        );
+    END LOOP;
+
+    FOR child IN SELECT * FROM (VALUES
+        ('route_permissions', 'routes', 'object_id'),
+        ('item_list_permissions', 'item_lists', 'object_id'),
+        ('lists_items', 'item_lists', 'item_list'),
+        ('note_permissions', 'notes', 'object_id'),
+        ('trip_permissions', 'trips', 'object_id'),
+        ('trip_dates', 'trips', 'trip_id'),
+        ('trips_notes_references', 'trips', 'trip_id'),
+        ('trips_routes_references', 'trips', 'trip_id'),
+        ('trips_item_lists_references', 'trips', 'trip_id')
+    ) AS children (name, parent, parent_id) LOOP
+        -- A trigger with a transition table can only fire on one kind of event
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS changed '
+            'FOR EACH STATEMENT EXECUTE FUNCTION stamp_parent_revision(%L, %L)',
+            child.name || '_insert_revision', child.name, child.parent, child.parent_id
+        );
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER %I AFTER UPDATE ON %I REFERENCING NEW TABLE AS changed '
+            'FOR EACH STATEMENT EXECUTE FUNCTION stamp_parent_revision(%L, %L)',
+            child.name || '_update_revision', child.name, child.parent, child.parent_id
+        );
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS changed '
+            'FOR EACH STATEMENT EXECUTE FUNCTION stamp_parent_revision(%L, %L)',
+            child.name || '_delete_revision', child.name, child.parent, child.parent_id
+        );
+    END LOOP;
+END$$;
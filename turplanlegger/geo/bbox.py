@@ -0,0 +1,26 @@
+import math
+
+BBox = tuple[float, float, float, float]
+
+
+def parse_bbox(value: str) -> BBox:
+    """Parse a bounding box 'min lon,min lat,max lon,max lat', as in GeoJSON
+
+    Raises:
+        ValueError: if the bounding box is malformed, out of range or
+                    crosses the antimeridian
+
+    Returns:
+        The bounding box (min lon, min lat, max lon, max lat)
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError('bbox must be four numbers: min lon,min lat,max lon,max lat')
+    if not all(math.isfinite(part) for part in (min_lon, min_lat, max_lon, max_lat)):
+        raise ValueError('bbox must be four numbers: min lon,min lat,max lon,max lat')
+    if not (-180 <= min_lon <= max_lon <= 180):
+        raise ValueError('bbox longitudes must be between -180 and 180, min lon first')
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError('bbox latitudes must be between -90 and 90, min lat first')
+    return min_lon, min_lat, max_lon, max_lat
@@ -0,0 +1,180 @@
+import struct
+import sys
+import zlib
+from array import array
+from base64 import b64decode, b64encode
+from binascii import Error as B64Error
+from collections.abc import Callable, Iterator
+from itertools import accumulate
+from typing import Any
+
+# Fixed point scale per dimension: longitude and latitude to 1e-6 degrees (~0.1m), elevation to mm
+SCALES = (1e6, 1e6, 1e3)
+VERSION = 1
+_HEADER = struct.Struct('<BBBI')
+
+
+def encode_coordinates(coordinates: list) -> str | None:
+    """Encode the coordinates of a GeoJSON geometry
+
+    Positions are stored as fixed point int32 deltas from the previous
+    position and the lot is zlib compressed, a GPS track takes a fifth
+    of the space of the JSON text or less. Longitude and latitude are
+    kept to 6 decimals, elevation to 3.
+
+    Args:
+        coordinates (list): A position, or nested lists of positions
+
+    Returns:
+        The encoded coordinates as base64, None if they can not be encoded:
+        no positions, positions of mixed or more than 3 dimensions, values
+        that are not numbers or out of range
+    """
+    depth, node = 1, coordinates
+    while isinstance(node, list) and node and isinstance(node[0], list):
+        depth, node = depth + 1, node[0]
+    if depth == 1 or not 2 <= len(node) <= len(SCALES):
+        return None
+    dims = len(node)
+
+    counts, positions = array('I'), []
+    if not _flatten(coordinates, depth - 1, counts, positions):
+        return None
+
+    values = []
+    for position in positions:
+        if not isinstance(position, list) or len(position) != dims:
+            return None
+        values.extend(position)
+    if not values or not all(type(value) in (int, float) for value in values):
+        return None
+
+    try:
+        fixed = array('i', (round(value * SCALES[i % dims]) for i, value in enumerate(values)))
+        return pack(dims, depth - 1, counts, fixed)
+    except (OverflowError, ValueError):
+        return None
+
+
+def pack(dims: int, levels: int, counts: array, fixed: array) -> str:
+    """Encode positions given as fixed point values, as encode_coordinates does
+
+    For positions read one at a time, without nesting them in lists first
+
+    Args:
+        dims (int): Dimensions of every position
+        levels (int): Levels of lists above the positions, 1 for a LineString
+        counts (array): Length of every list above the positions, in the
+                        order the lists open, the outermost first
+        fixed (array): The values of every position in order, scaled by
+                       SCALES and rounded, as int32
+
+    Raises:
+        OverflowError: if the difference of two positions is out of range
+
+    Returns:
+        The encoded coordinates as base64
+    """
+    deltas = array('i', fixed)
+    for i in range(len(deltas) - 1, dims - 1, -1):
+        deltas[i] -= deltas[i - dims]
+
+    counts = array('I', counts)
+    if sys.byteorder == 'big':
+        counts.byteswap()
+        deltas.byteswap()
+    payload = _HEADER.pack(VERSION, dims, levels, len(counts)) + counts.tobytes() + deltas.tobytes()
+    return b64encode(zlib.compress(payload)).decode('ascii')
+
+
+def decode_coordinates(encoded: str) -> list:
+    """Decode coordinates encoded by encode_coordinates
+
+    Raises:
+        ValueError: if encoded is not valid
+
+    Returns:
+        The coordinates as nested lists of positions
+    """
+    try:
+        payload = zlib.decompress(b64decode(encoded, validate=True))
+        version, dims, depth, count_len = _HEADER.unpack_from(payload)
+    except (B64Error, zlib.error, struct.error):
+        raise ValueError('encoded coordinates are invalid')
+    if version != VERSION:
+        raise ValueError(f'encoded coordinates version {version} is not supported')
+
+    counts, deltas = array('I'), array('i')
+    offset = _HEADER.size + count_len * counts.itemsize
+    try:
+        counts.frombytes(payload[_HEADER.size : offset])
+        deltas.frombytes(payload[offset:])
+    except ValueError:
+        raise ValueError('encoded coordinates are invalid')
+    if sys.byteorder == 'big':
+        counts.byteswap()
+        deltas.byteswap()
+
+    axes = [[value / SCALES[dim] for value in accumulate(deltas[dim::dims])] for dim in range(dims)]
+    positions = [list(position) for position in zip(*axes)]
+    try:
+        return _nest(iter(positions), depth, iter(counts))
+    except StopIteration:
+        raise ValueError('encoded coordinates are invalid')
+
+
+def compact(geojson: Any) -> Any:
+    """Copy of a GeoJSON object with the coordinates of every geometry encoded
+
+    Geometries that can not be encoded, or already are, are left as they are
+    """
+    return map_coordinates(geojson, list, lambda coordinates: encode_coordinates(coordinates) or coordinates)
+
+
+def expand(geojson: Any) -> Any:
+    """Copy of a GeoJSON object with the coordinates of every geometry decoded
+
+    Raises:
+        ValueError: if encoded coordinates are invalid
+    """
+    return map_coordinates(geojson, str, decode_coordinates)
+
+
+def map_coordinates(geojson: Any, kind: type, func: Callable) -> Any:
+    """Copy geojson with the coordinates of every geometry that are of kind replaced by func(coordinates)"""
+    if not isinstance(geojson, dict):
+        return geojson
+
+    copy = dict(geojson)
+    if 'coordinates' in copy and isinstance(copy['coordinates'], kind):
+        copy['coordinates'] = func(copy['coordinates'])
+    if isinstance(copy.get('geometry'), dict):
+        copy['geometry'] = map_coordinates(copy['geometry'], kind, func)
+    for key in ('features', 'geometries'):
+        if isinstance(copy.get(key), list):
+            copy[key] = [map_coordinates(child, kind, func) for child in copy[key]]
+    return copy
+
+
+def _flatten(node: list, depth: int, counts: array, positions: list) -> bool:
+    """Collect the positions of node, a list nested depth levels above them,
+    and the length of every list on the way down in counts
+
+    Returns:
+        False if node is not nested evenly
+    """
+    if not isinstance(node, list):
+        return False
+    counts.append(len(node))
+    if depth == 1:
+        positions.extend(node)
+        return True
+    return all(_flatten(child, depth - 1, counts, positions) for child in node)
+
+
+def _nest(positions: Iterator, depth: int, counts: Iterator) -> list:
+    """Inverse of _flatten"""
+    count = next(counts)
+    if depth == 1:
+        return [next(positions) for _ in range(count)]
+    return [_nest(positions, depth - 1, counts) for _ in range(count)]
@@ -0,0 +1,159 @@
+from collections.abc import Iterable, Iterator
+from typing import Any, Dict
+from xml.sax.saxutils import escape
+
+import ujson
+
+from turplanlegger.geo.stats import parts
+
+JSON = Dict[str, any]
+
+FORMATS = {
+    'gpx': 'application/gpx+xml',
+    'geojson': 'application/geo+json',
+    'ndjson': 'application/x-ndjson',
+}
+# Positions written at a time
+BATCH_SIZE = 1000
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="Turplanlegger" xmlns="http://www.topografix.com/GPX/1/1">\n'
+)
+
+
+def export_format(name: str | None) -> str:
+    """Format of an export from the format query parameter, gpx if not given
+
+    Raises:
+        ValueError: if name is not one of FORMATS
+    """
+    name = name or 'gpx'
+    if name not in FORMATS:
+        raise ValueError(f'format must be one of {", ".join(FORMATS)}')
+    return name
+
+
+def export(routes: Iterable[tuple[JSON, Any]], format: str) -> Iterator[str]:
+    """Write routes as a document of format, a piece at a time
+
+    Routes are written as they are taken from routes, and long lines
+    BATCH_SIZE positions at a time, so a response can start before the
+    last route is read
+
+    Args:
+        routes (Iterable): The properties of every route, like id and name,
+                           and the route as GeoJSON
+        format (str): One of FORMATS
+
+    Returns:
+        An iterator of the text of the document
+    """
+    if format == 'gpx':
+        return gpx(routes)
+    if format == 'ndjson':
+        return ndjson(routes)
+    return geojson(routes)
+
+
+def gpx(routes: Iterable[tuple[JSON, Any]]) -> Iterator[str]:
+    """GPX 1.1 with a track for every route
+
+    Every line and polygon ring is a track segment, points are left out
+    """
+    yield GPX_HEADER
+    for properties, route in routes:
+        yield '<trk>'
+        if properties.get('name'):
+            yield f'<name>{escape(str(properties["name"]))}</name>'
+        if properties.get('comment'):
+            yield f'<desc>{escape(str(properties["comment"]))}</desc>'
+        for positions, is_line in parts(route):
+            if not is_line:
+                continue
+            yield '<trkseg>\n'
+            for start in range(0, len(positions), BATCH_SIZE):
+                yield ''.join(_trkpt(position) for position in positions[start : start + BATCH_SIZE])
+            yield '</trkseg>'
+        yield '</trk>\n'
+    yield '</gpx>\n'
+
+
+def geojson(routes: Iterable[tuple[JSON, Any]]) -> Iterator[str]:
+    """A GeoJSON FeatureCollection of the features of every route, see features"""
+    yield '{"type":"FeatureCollection","features":['
+    first = True
+    for properties, route in routes:
+        for feature in features(properties, route):
+            if not first:
+                yield ',\n'
+            first = False
+            yield from _json_feature(feature)
+    yield ']}\n'
+
+
+def ndjson(routes: Iterable[tuple[JSON, Any]]) -> Iterator[str]:
+    """Newline delimited GeoJSON Features of every route, see features"""
+    for properties, route in routes:
+        for feature in features(properties, route):
+            yield from _json_feature(feature)
+            yield '\n'
+
+
+def features(properties: JSON, route: Any) -> list[JSON]:
+    """The GeoJSON Features of a route, with properties added to the properties of each
+
+    A geometry is made a Feature, a FeatureCollection gives its Features
+    """
+    if not isinstance(route, dict):
+        return []
+    if route.get('type') == 'FeatureCollection':
+        found = [feature for feature in route.get('features') or [] if isinstance(feature, dict)]
+    elif route.get('type') == 'Feature':
+        found = [route]
+    else:
+        found = [{'type': 'Feature', 'geometry': route}]
+    return [{**feature, 'properties': {**(feature.get('properties') or {}), **properties}} for feature in found]
+
+
+def _trkpt(position: list) -> str:
+    if len(position) > 2:
+        return f'<trkpt lat="{position[1]:.6f}" lon="{position[0]:.6f}"><ele>{position[2]:.3f}</ele></trkpt>\n'
+    return f'<trkpt lat="{position[1]:.6f}" lon="{position[0]:.6f}"/>\n'
+
+
+def _json_feature(feature: JSON) -> Iterator[str]:
+    """A Feature as JSON, the coordinates of its geometry BATCH_SIZE positions at a time"""
+    geometry = feature.get('geometry')
+    if not isinstance(geometry, dict) or not isinstance(geometry.get('coordinates'), list):
+        yield ujson.dumps(feature, ensure_ascii=False)
+        return
+
+    yield _json_open(feature, 'geometry')
+    yield _json_open(geometry, 'coordinates')
+    yield from _json_coordinates(geometry['coordinates'])
+    yield '}}'
+
+
+def _json_open(obj: JSON, last: str) -> str:
+    """An object as JSON up to the value of its member last, the rest of the members first"""
+    rest = ujson.dumps({key: value for key, value in obj.items() if key != last}, ensure_ascii=False)[:-1]
+    return f'{rest}{"," if len(rest) > 1 else ""}"{last}":'
+
+
+def _json_coordinates(coordinates: list) -> Iterator[str]:
+    if not coordinates or not isinstance(coordinates[0], list):
+        yield ujson.dumps(coordinates)
+    elif coordinates[0] and isinstance(coordinates[0][0], list):
+        yield '['
+        for i, child in enumerate(coordinates):
+            if i:
+                yield ','
+            yield from _json_coordinates(child)
+        yield ']'
+    else:
+        yield '['
+        for start in range(0, len(coordinates), BATCH_SIZE):
+            batch = ujson.dumps(coordinates[start : start + BATCH_SIZE])[1:-1]
+            yield ',' + batch if start else batch
+        yield ']'
@@ -0,0 +1,112 @@
+from difflib import SequenceMatcher
+from typing import Any
+
+from turplanlegger.geo.encoding import compact, decode_coordinates, encode_coordinates, expand, map_coordinates
+
+
+def diff(source: Any, target: Any) -> dict:
+    """Patch that turns the GeoJSON source into target
+
+    If the two only differ in coordinates the patch holds a change per
+    geometry: the ranges of positions replaced for LineStrings and
+    MultiPoints, the new coordinates for other geometries. Otherwise it
+    holds all of target. Coordinates in the patch are encoded.
+
+    Both are compared position by position, expand them from their
+    compact form first so that equal positions compare equal.
+
+    Returns:
+        The patch, empty if source and target are equal
+    """
+    if source == target:
+        return {}
+    if _skeleton(source) != _skeleton(target):
+        return {'document': compact(target)}
+
+    geometries = []
+    for old, new in zip(_coordinates(source), _coordinates(target)):
+        if old == new:
+            geometries.append(None)
+        elif _is_positions(old) and _is_positions(new) and (edits := _edits(old, new)) is not None:
+            geometries.append({'edits': edits})
+        else:
+            geometries.append({'coordinates': _encoded(new)})
+    return {'geometries': geometries}
+
+
+def apply(source: Any, patch: dict) -> Any:
+    """Apply a patch made by diff to source
+
+    Returns:
+        A copy of source with the patch applied
+    """
+    if not patch:
+        return source
+    if 'document' in patch:
+        return expand(patch['document'])
+
+    changes = iter(patch['geometries'])
+
+    def patched(coordinates: Any) -> Any:
+        change = next(changes)
+        if change is None:
+            return coordinates
+        if 'coordinates' in change:
+            return _decoded(change['coordinates'])
+        positions = list(coordinates)
+        for start, end, replacement in reversed(change['edits']):
+            positions[start:end] = _decoded(replacement)
+        return positions
+
+    return map_coordinates(source, object, patched)
+
+
+def _skeleton(geojson: Any) -> Any:
+    """geojson without coordinates"""
+    return map_coordinates(geojson, object, lambda coordinates: None)
+
+
+def _coordinates(geojson: Any) -> list:
+    """The coordinates of every geometry in geojson, in order"""
+    found = []
+    map_coordinates(geojson, object, found.append)
+    return found
+
+
+def _is_positions(coordinates: Any) -> bool:
+    return isinstance(coordinates, list) and all(
+        isinstance(position, list) and not (position and isinstance(position[0], list)) for position in coordinates
+    )
+
+
+def _edits(old: list, new: list) -> list | None:
+    """Ranges [start, end, positions] of old to replace to get new
+
+    Returns:
+        None if the edits replace about all of old
+    """
+    a, b = [tuple(position) for position in old], [tuple(position) for position in new]
+
+    # Edits to tracks are mostly local, match the ends before the costly diff of the rest
+    prefix = 0
+    while prefix < min(len(a), len(b)) and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(a), len(b)) - prefix and a[-suffix - 1] == b[-suffix - 1]:
+        suffix += 1
+
+    matcher = SequenceMatcher(None, a[prefix : len(a) - suffix], b[prefix : len(b) - suffix], autojunk=False)
+    edits, replaced = [], 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            edits.append([prefix + i1, prefix + i2, _encoded(new[prefix + j1 : prefix + j2])])
+            replaced += j2 - j1
+    return edits if replaced < len(new) else None
+
+
+def _encoded(coordinates: Any) -> Any:
+    return encode_coordinates(coordinates) or coordinates
+
+
+def _decoded(coordinates: Any) -> Any:
+    return decode_coordinates(coordinates) if isinstance(coordinates, str) else coordinates
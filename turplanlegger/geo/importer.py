@@ -0,0 +1,367 @@
+import codecs
+import json
+import math
+import re
+from array import array
+from collections.abc import Callable, Iterator
+from typing import Any, BinaryIO, Dict
+from xml.etree.ElementTree import Element, ParseError, XMLPullParser
+
+from turplanlegger.geo.encoding import SCALES, pack
+
+JSON = Dict[str, any]
+
+CHUNK_SIZE = 64 * 1024
+# Media types of the formats, the first is the one written on export
+FORMATS = {
+    'gpx': ('application/gpx+xml', 'application/xml', 'text/xml'),
+    'geojson': ('application/geo+json', 'application/json'),
+}
+MIMETYPES = tuple(mimetype for mimetypes in FORMATS.values() for mimetype in mimetypes)
+# Objects and arrays nested deeper than this are refused, GeoJSON needs a handful of levels
+MAX_DEPTH = 64
+
+_NUMBER = r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?'
+# A position of 2 or 3 numbers is read as one token, they make up most of a document
+_TOKEN = re.compile(
+    rf"""[ \t\n\r]*(?:
+        \[[ \t\n\r]*({_NUMBER})[ \t\n\r]*,[ \t\n\r]*({_NUMBER})(?:[ \t\n\r]*,[ \t\n\r]*({_NUMBER}))?[ \t\n\r]*\]
+        |([\[\]{{}}:,])
+        |"((?:[^"\\\x00-\x1f]|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{{4}}))*)"
+        |({_NUMBER})
+        |(true|false|null)
+    )""",
+    re.VERBOSE,
+)
+_LITERALS = {'true': True, 'false': False, 'null': None}
+# Characters after a '[' to read before telling it does not start a position
+_LOOKAHEAD = 256
+
+
+def read_route(stream: BinaryIO, mimetype: str, chunk_size: int = CHUNK_SIZE) -> tuple[JSON, str | None]:
+    """Read a route from a GPX or GeoJSON document
+
+    The document is parsed as it is read from stream, chunk_size bytes
+    at a time, and positions are kept as fixed point values until they are
+    encoded. Neither the document nor its positions as lists of floats are
+    held in memory, a track takes 4 bytes per coordinate while it is read
+
+    Args:
+        stream (BinaryIO): The document, read until it ends
+        mimetype (str): One of MIMETYPES
+        chunk_size (int): Bytes to read at a time
+
+    Raises:
+        ValueError: if the document is not valid or has no positions,
+                    or mimetype is not supported
+
+    Returns:
+        The route as compact GeoJSON, and the name given in the document if any
+    """
+    if mimetype not in MIMETYPES:
+        raise ValueError(f'Content-Type must be one of {", ".join(MIMETYPES)}')
+
+    chunks = iter(lambda: stream.read(chunk_size), b'')
+    if mimetype in FORMATS['gpx']:
+        return read_gpx(chunks)
+    return read_geojson(chunks)
+
+
+def read_gpx(chunks: Iterator[bytes]) -> tuple[JSON, str | None]:
+    """Read the tracks and routes of a GPX document as a LineString or MultiLineString
+
+    Every track segment and route is a line, waypoints and times are left
+    out. Elevation is kept if every position has one. Lines of a single
+    position are left out
+
+    Returns:
+        The compact GeoJSON geometry, and the name of the first track or
+        route, or else of the document
+    """
+    parser = XMLPullParser(events=('start', 'end'))
+    # The number of lines, then the number of positions of every line
+    counts, fixed = array('I', [0]), array('i')
+    path: list[Element] = []
+    names, elevations, line_elevations = {}, 0, 0
+    tags = None
+
+    def events() -> Iterator[tuple[str, Element]]:
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
+
+    try:
+        for event, element in events():
+            if tags is None:
+                namespace, _, root = element.tag.rpartition('}')
+                if root != 'gpx':
+                    raise ValueError('document is not GPX')
+                tags = _GpxTags(namespace + '}' if namespace else '')
+            tag = element.tag
+
+            if event == 'start':
+                path.append(element)
+                if tag in tags.lines:
+                    counts[0] += 1
+                    counts.append(0)
+                    line_elevations = 0
+                continue
+
+            path.pop()
+            if tag in tags.points:
+                position = _gpx_position(element, tags.ele)
+                fixed.extend(round(value * scale) for value, scale in zip(position, SCALES))
+                if len(position) == 3:
+                    elevations += 1
+                    line_elevations += 1
+                else:
+                    fixed.append(0)
+                counts[-1] += 1
+            elif tag in tags.lines and counts[-1] < 2:
+                if counts[-1]:
+                    del fixed[-3 * counts[-1] :]
+                    elevations -= line_elevations
+                counts.pop()
+                counts[0] -= 1
+            elif tag == tags.name and path and path[-1].tag in tags.named:
+                names.setdefault(path[-1].tag == tags.metadata, (element.text or '').strip() or None)
+
+            if tag in tags.removed and path:
+                # Only what is still open is kept
+                path[-1].remove(element)
+    except ParseError as e:
+        raise ValueError(f'GPX is not valid XML: {e}')
+    except OverflowError:
+        raise ValueError('GPX has positions out of range')
+
+    if not counts[0]:
+        raise ValueError('GPX has no tracks or routes')
+    dims = 3
+    if elevations * 3 != len(fixed):
+        del fixed[2::3]
+        dims = 2
+    name = names.get(False) or names.get(True)
+    if counts[0] == 1:
+        return {'type': 'LineString', 'coordinates': pack(dims, 1, counts[1:], fixed)}, name
+    return {'type': 'MultiLineString', 'coordinates': pack(dims, 2, counts, fixed)}, name
+
+
+def read_geojson(chunks: Iterator[bytes]) -> tuple[JSON, str | None]:
+    """Read a GeoJSON document, with the coordinates of every geometry encoded
+
+    Coordinates are encoded as they are read, see encoding.pack, all
+    positions of a geometry must have the same 2 or 3 dimensions
+
+    Returns:
+        The compact GeoJSON object, and the name in the properties of a Feature
+    """
+    tokens = _Tokens(_json_tokens(chunks))
+    try:
+        geojson = _json_value(tokens, tokens.next(), None, 0)
+        if tokens.peek() is not None:
+            raise ValueError('GeoJSON has data after the document')
+    except StopIteration:
+        raise ValueError('GeoJSON ends before the document does')
+    except OverflowError:
+        raise ValueError('GeoJSON has positions out of range')
+
+    if not isinstance(geojson, dict) or not isinstance(geojson.get('type'), str):
+        raise ValueError('GeoJSON must be an object with a type')
+    properties = geojson.get('properties')
+    name = properties.get('name') if geojson['type'] == 'Feature' and isinstance(properties, dict) else None
+    return geojson, name if isinstance(name, str) else None
+
+
+class _GpxTags:
+    """Tags of the GPX elements that are read, in the namespace of the document"""
+
+    def __init__(self, namespace: str) -> None:
+        trk, rte, metadata = namespace + 'trk', namespace + 'rte', namespace + 'metadata'
+        self.points = {namespace + 'trkpt', namespace + 'rtept'}
+        self.lines = {namespace + 'trkseg', rte}
+        self.removed = {*self.points, *self.lines, trk, namespace + 'wpt'}
+        self.named = {trk, rte, metadata}
+        self.metadata, self.name, self.ele = metadata, namespace + 'name', namespace + 'ele'
+
+
+def _gpx_position(element: Element, ele_tag: str) -> tuple[float, ...]:
+    """(lon, lat) or (lon, lat, ele) of a GPX trkpt or rtept"""
+    try:
+        lon, lat = float(element.get('lon')), float(element.get('lat'))
+        ele = next((child.text for child in element if child.tag == ele_tag), None)
+        position = (lon, lat) if ele is None or not ele.strip() else (lon, lat, float(ele))
+    except (TypeError, ValueError):
+        raise ValueError('GPX positions must have a lat and lon, and elevation in meters')
+    if not all(math.isfinite(value) for value in position) or not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise ValueError('GPX has positions out of range')
+    return position
+
+
+class _Tokens:
+    """Tokens of a JSON document with one token of lookahead"""
+
+    def __init__(self, tokens: Iterator[tuple[str, Any]]) -> None:
+        self._tokens = tokens
+        self._next = None
+
+    def next(self) -> tuple[str, Any]:
+        if self._next is not None:
+            token, self._next = self._next, None
+            return token
+        return next(self._tokens)
+
+    def peek(self) -> tuple[str, Any] | None:
+        if self._next is None:
+            self._next = next(self._tokens, None)
+        return self._next
+
+
+def _json_tokens(chunks: Iterator[bytes]) -> Iterator[tuple[str, Any]]:
+    """Tokens of a JSON document read in chunks of UTF-8
+
+    Yields (kind, value): kind is 'position' for an array of 2 or 3 numbers
+    with the numbers as value, a punctuation character, 'string', 'number'
+    with the text of the number, or 'literal'
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer, pos, done = '', 0, False
+    while True:
+        match = _TOKEN.match(buffer, pos)
+        # A token that runs to the end of the buffer may continue in the next chunk
+        if match is None or (
+            not done
+            and (
+                (match.end() == len(buffer) and match.lastindex != 4)
+                or (match.group(4) == '[' and len(buffer) - match.end() < _LOOKAHEAD)
+            )
+        ):
+            if done:
+                if buffer[pos:].strip(' \t\n\r'):
+                    raise ValueError('GeoJSON is not valid JSON')
+                return
+            chunk = next(chunks, None)
+            done = chunk is None
+            try:
+                buffer = buffer[pos:] + decoder.decode(chunk or b'', final=done)
+            except UnicodeDecodeError:
+                raise ValueError('GeoJSON is not valid UTF-8')
+            pos = 0
+            continue
+
+        pos = match.end()
+        x, y, z, punctuation, string, number, literal = match.groups()
+        if x is not None:
+            yield 'position', (x, y) if z is None else (x, y, z)
+        elif punctuation is not None:
+            yield punctuation, None
+        elif string is not None:
+            yield 'string', _json_string(string)
+        elif number is not None:
+            yield 'number', number
+        else:
+            yield 'literal', _LITERALS[literal]
+
+
+def _json_string(string: str) -> str:
+    return json.loads(f'"{string}"') if '\\' in string else string
+
+
+def _json_number(text: str) -> int | float:
+    return int(text) if text.lstrip('-').isdigit() else float(text)
+
+
+def _json_value(tokens: _Tokens, token: tuple[str, Any], key: str | None, depth: int) -> Any:
+    """Read the JSON value that starts with token, encoding it if it is the coordinates of a geometry"""
+    kind, value = token
+    if depth > MAX_DEPTH:
+        raise ValueError('GeoJSON is nested too deep')
+    if kind == '{':
+        result = {}
+
+        def member(tokens: _Tokens) -> None:
+            kind, name = tokens.next()
+            if kind != 'string' or tokens.next()[0] != ':':
+                raise ValueError('GeoJSON is not valid JSON')
+            result[name] = _json_value(tokens, tokens.next(), name, depth + 1)
+
+        _json_items(tokens, '}', member)
+        return result
+    if key == 'coordinates' and kind in ('[', 'position'):
+        return _Coordinates().read(tokens, token)
+    if kind == '[':
+        result = []
+        _json_items(tokens, ']', lambda tokens: result.append(_json_value(tokens, tokens.next(), None, depth + 1)))
+        return result
+    if kind == 'position':
+        return [_json_number(number) for number in value]
+    if kind == 'number':
+        return _json_number(value)
+    if kind in ('string', 'literal'):
+        return value
+    raise ValueError('GeoJSON is not valid JSON')
+
+
+def _json_items(tokens: _Tokens, end: str, item: Callable[[_Tokens], None]) -> int:
+    """Read the items of an object or array after its opening bracket, calling item for each
+
+    Returns:
+        The number of items
+    """
+    if tokens.peek() == (end, None):
+        tokens.next()
+        return 0
+    count = 0
+    while True:
+        item(tokens)
+        count += 1
+        kind, _ = tokens.next()
+        if kind == end:
+            return count
+        if kind != ',':
+            raise ValueError('GeoJSON is not valid JSON')
+
+
+class _Coordinates:
+    """Reads the coordinates of a geometry into fixed point values as encoding.pack takes them"""
+
+    def __init__(self) -> None:
+        self.counts, self.fixed = array('I'), array('i')
+        self.dims = self.levels = None
+
+    def read(self, tokens: _Tokens, token: tuple[str, Any]) -> str | list:
+        """Read coordinates that start with token
+
+        Returns:
+            The encoded coordinates, or the position of a Point
+        """
+        kind, value = token
+        if kind == 'position':
+            return [_json_number(number) for number in value]
+        if tokens.peek()[0] == 'number':
+            raise ValueError('GeoJSON positions must have 2 or 3 dimensions')
+        self._lists(tokens, 1)
+        if not self.fixed:
+            raise ValueError('GeoJSON geometries must have positions')
+        return pack(self.dims, self.levels, self.counts, self.fixed)
+
+    def _lists(self, tokens: _Tokens, level: int) -> None:
+        slot = len(self.counts)
+        self.counts.append(0)
+        self.counts[slot] = _json_items(tokens, ']', lambda tokens: self._item(tokens, level))
+
+    def _item(self, tokens: _Tokens, level: int) -> None:
+        kind, value = tokens.next()
+        if kind == 'position':
+            if self.levels is None:
+                self.levels, self.dims = level, len(value)
+            elif (level, len(value)) != (self.levels, self.dims):
+                raise ValueError('GeoJSON positions of a geometry must be nested as deep and have the same dimensions')
+            self.fixed.extend([round(float(number) * scale) for number, scale in zip(value, SCALES)])
+        elif kind == '[' and level < MAX_DEPTH and tokens.peek()[0] != 'number':
+            self._lists(tokens, level + 1)
+        elif kind == '[':
+            raise ValueError('GeoJSON positions must have 2 or 3 dimensions')
+        else:
+            raise ValueError('GeoJSON coordinates must be arrays of positions')
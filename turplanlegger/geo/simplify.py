@@ -0,0 +1,163 @@
+from typing import Any
+
+from turplanlegger.geo.encoding import compact, map_coordinates
+
+# Zoom levels with a simplified version of every route, as in web map tiles
+ZOOMS = (8, 11, 14)
+DETAIL_LEVELS = {'low': 8, 'medium': 11, 'high': 14, 'full': None}
+MAX_ZOOM = 24
+
+
+def tolerance(zoom: int) -> float:
+    """Size of a pixel in degrees of longitude at zoom, for 256 pixel tiles"""
+    return 360 / (256 * 2**zoom)
+
+
+def level(zoom: int) -> int | None:
+    """Zoom of the stored version of routes with enough detail for zoom
+
+    Returns:
+        The zoom of the version, None if only the full route will do
+    """
+    return next((stored for stored in ZOOMS if stored >= zoom), None)
+
+
+def detail_args(args) -> int | None:
+    """Read 'detail' or 'zoom' from the query string
+
+    detail is one of DETAIL_LEVELS, zoom the zoom level of the map
+    the route is shown on, from 0 to MAX_ZOOM
+
+    Args:
+        args (MultiDict): request.args
+
+    Raises:
+        ValueError: if detail or zoom is invalid, or both are given
+
+    Returns:
+        The zoom of the stored version to serve, None for the full route
+    """
+    detail, zoom = args.get('detail', None), args.get('zoom', None)
+    if detail is not None and zoom is not None:
+        raise ValueError('detail and zoom can not be combined')
+    if detail is not None:
+        if detail not in DETAIL_LEVELS:
+            raise ValueError(f'detail must be one of {", ".join(DETAIL_LEVELS)}')
+        return DETAIL_LEVELS[detail]
+    if zoom is None:
+        return None
+    try:
+        zoom = int(zoom)
+    except ValueError:
+        raise ValueError('zoom must be an integer')
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f'zoom must be between 0 and {MAX_ZOOM}')
+    return level(zoom)
+
+
+def levels(geojson: Any) -> dict[str, Any]:
+    """Simplified versions of geojson for every zoom in ZOOMS, compact
+
+    Each version is simplified from the one with more detail. Versions
+    that keep every position are left out, the full route is used for
+    those zoom levels
+
+    Returns:
+        Dict of compact GeoJSON by zoom, keys as strings like in jsonb
+    """
+    versions = {}
+    previous, count = geojson, _count(geojson)
+    for zoom in reversed(ZOOMS):
+        simplified = simplify(previous, tolerance(zoom))
+        simplified_count = _count(simplified)
+        if simplified_count == count:
+            break
+        versions[str(zoom)] = compact(simplified)
+        previous, count = simplified, simplified_count
+    return versions
+
+
+def simplify(geojson: Any, tolerance: float) -> Any:
+    """Copy of geojson with every line and ring simplified with Douglas-Peucker
+
+    Rings are not simplified below 4 positions, points are left as they are
+    """
+    return map_coordinates(geojson, list, lambda coordinates: _simplify_coordinates(coordinates, tolerance))
+
+
+def simplify_positions(positions: list, tolerance: float) -> list:
+    """Douglas-Peucker simplification of a line
+
+    Keeps the positions further than tolerance from the line between
+    the positions kept on either side, and the first and last position
+
+    Args:
+        positions (list): The positions of the line
+        tolerance (float): Max distance from the simplified line, in the
+                           unit of the coordinates
+
+    Returns:
+        The positions kept
+    """
+    if len(positions) < 3:
+        return positions
+
+    keep = [False] * len(positions)
+    keep[0] = keep[-1] = True
+    max_distance = tolerance * tolerance
+    stack = [(0, len(positions) - 1)]
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = positions[first][0], positions[first][1]
+        dx, dy = positions[last][0] - x1, positions[last][1] - y1
+        length = dx * dx + dy * dy
+
+        farthest, distance = 0, max_distance
+        for i in range(first + 1, last):
+            px, py = positions[i][0] - x1, positions[i][1] - y1
+            if length:
+                # Squared distance to the segment, clamped to its ends
+                t = min(1.0, max(0.0, (px * dx + py * dy) / length))
+                px, py = px - t * dx, py - t * dy
+            d = px * px + py * py
+            if d > distance:
+                farthest, distance = i, d
+
+        if farthest:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [position for position, kept in zip(positions, keep) if kept]
+
+
+def _simplify_coordinates(coordinates: list, tolerance: float) -> list:
+    if not coordinates:
+        return coordinates
+    if isinstance(coordinates[0], list) and coordinates[0] and isinstance(coordinates[0][0], list):
+        return [_simplify_coordinates(child, tolerance) for child in coordinates]
+    if not isinstance(coordinates[0], list):
+        return coordinates
+
+    simplified = simplify_positions(coordinates, tolerance)
+    is_ring = len(coordinates) >= 4 and coordinates[0] == coordinates[-1]
+    return coordinates if is_ring and len(simplified) < 4 else simplified
+
+
+def _count(geojson: Any) -> int:
+    """Number of positions in geojson"""
+    count = 0
+
+    def add(coordinates: list) -> list:
+        nonlocal count
+        stack = [coordinates]
+        while stack:
+            node = stack.pop()
+            if node and isinstance(node[0], list):
+                stack.extend(node)
+            elif node:
+                count += 1
+        return coordinates
+
+    map_coordinates(geojson, list, add)
+    return count
@@ -0,0 +1,133 @@
+import math
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from turplanlegger.geo.encoding import decode_coordinates
+
+JSON = Dict[str, any]
+
+# Mean radius of the earth in meters
+EARTH_RADIUS = 6371008.8
+
+
+@dataclass(frozen=True)
+class RouteStats:
+    """Summary of the geometry of a route
+
+    Attributes:
+        length (float): Length of every line and ring, in meters
+        bbox (tuple): (min lon, min lat, max lon, max lat), None without positions
+        centroid (tuple): (lon, lat) of the middle of the lines weighted by length,
+                          or of the positions if there are no lines. None
+                          without positions
+        segment_lengths (tuple): Length of each line and ring, in meters, in order
+        points (int): Number of positions
+    """
+
+    length: float
+    bbox: tuple[float, float, float, float] | None
+    centroid: tuple[float, float] | None
+    segment_lengths: tuple[float, ...]
+    points: int
+
+    @property
+    def serialize(self) -> JSON:
+        return {
+            'length': self.length,
+            'bbox': self.bbox,
+            'centroid': self.centroid,
+            'segment_lengths': self.segment_lengths,
+            'points': self.points,
+        }
+
+
+def measure(geojson: Any) -> RouteStats:
+    """Measure the geometries of a GeoJSON object
+
+    Lengths are great circle distances between consecutive positions of
+    LineStrings and Polygon rings, elevation is not taken into account.
+    Coordinates may be encoded
+
+    Returns:
+        The RouteStats of geojson
+    """
+    min_lon = min_lat = math.inf
+    max_lon = max_lat = -math.inf
+    sum_lon = sum_lat = 0.0
+    weighted_lon = weighted_lat = 0.0
+    segment_lengths, points = [], 0
+
+    for positions, is_line in parts(geojson):
+        length = 0.0
+        previous = None
+        for position in positions:
+            lon, lat = float(position[0]), float(position[1])
+            points += 1
+            sum_lon += lon
+            sum_lat += lat
+            min_lon, max_lon = min(min_lon, lon), max(max_lon, lon)
+            min_lat, max_lat = min(min_lat, lat), max(max_lat, lat)
+
+            phi, cos_phi = math.radians(lat), math.cos(math.radians(lat))
+            if is_line and previous is not None:
+                prev_lon, prev_lat, prev_phi, prev_cos_phi = previous
+                a = (
+                    math.sin((phi - prev_phi) / 2) ** 2
+                    + prev_cos_phi * cos_phi * math.sin(math.radians(lon - prev_lon) / 2) ** 2
+                )
+                distance = 2 * EARTH_RADIUS * math.asin(math.sqrt(min(1.0, a)))
+                length += distance
+                weighted_lon += distance * (lon + prev_lon) / 2
+                weighted_lat += distance * (lat + prev_lat) / 2
+            previous = (lon, lat, phi, cos_phi)
+
+        if is_line:
+            segment_lengths.append(length)
+
+    if not points:
+        return RouteStats(length=0.0, bbox=None, centroid=None, segment_lengths=tuple(segment_lengths), points=0)
+
+    length = math.fsum(segment_lengths)
+    if length:
+        centroid = (weighted_lon / length, weighted_lat / length)
+    else:
+        centroid = (sum_lon / points, sum_lat / points)
+    return RouteStats(
+        length=length,
+        bbox=(min_lon, min_lat, max_lon, max_lat),
+        centroid=centroid,
+        segment_lengths=tuple(segment_lengths),
+        points=points,
+    )
+
+
+def parts(geojson: Any) -> Iterator[tuple[list, bool]]:
+    """The positions of every part of every geometry in geojson, and if they make up a line"""
+    if not isinstance(geojson, dict):
+        return
+
+    kind, coordinates = geojson.get('type'), geojson.get('coordinates')
+    if isinstance(coordinates, str):
+        coordinates = decode_coordinates(coordinates)
+    if isinstance(coordinates, list) and coordinates:
+        if kind == 'Point':
+            yield [coordinates], False
+        elif kind == 'MultiPoint':
+            yield coordinates, False
+        elif kind == 'LineString':
+            yield coordinates, True
+        elif kind in ('MultiLineString', 'Polygon'):
+            for line in coordinates:
+                yield line, True
+        elif kind == 'MultiPolygon':
+            for polygon in coordinates:
+                for ring in polygon:
+                    yield ring, True
+
+    if isinstance(geojson.get('geometry'), dict):
+        yield from parts(geojson['geometry'])
+    for key in ('features', 'geometries'):
+        if isinstance(geojson.get(key), list):
+            for child in geojson[key]:
+                yield from parts(child)
@@ -1,3 +1,5 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
 from typing import Dict, NamedTuple
 from uuid import UUID
 
@@ -29,10 +31,13 @@ class ItemList:
                         Default so False (public)
         name (str): Optional, name of the list
                     Default: empty list
-        items (list): List of items that are unchecked
+        items (list): List of items that are unchecked,
+                      in the order they were added (by id)
                       Default: empty list
-        items_checked (list): list of items that are checked
+        items_checked (list): list of items that are checked,
+                              in the order they were added (by id)
         permissions (list): List of permissions related to the item list
+        revision (int): Revision of the item list, its items and permissions
         create_time (datetime): Time of creation
     """
 
@@ -55,6 +60,7 @@ class ItemList:
         self.items = kwargs.get('items', [])
         self.items_checked = kwargs.get('items_checked', [])
         self.permissions = kwargs.get('permissions', None)
+        self.revision = kwargs.get('revision', None)
         self.create_time = kwargs.get('create_time', None)
 
     def __repr__(self):
@@ -106,7 +112,7 @@ class ItemList:
         """Serialize a ItemList and returns it as Dict(str, any)"""
         return {
             'id': self.id,
-            'owner': self.owner,
+            'owner': str(self.owner),
             'name': self.name,
             'private': self.private,
             'items': [item.serialize for item in self.items],
@@ -119,29 +125,34 @@ class ItemList:
         """Create a ItemList in the database
         Will also add ItemList.id and create ListItems instances
         and add them to the ItemList instance
+
+        The ItemList, its permissions and items are created in one transaction
         """
-        item_list = self.get_item_list(db.create_item_list(self))
-
-        if self.permissions:
-            permissions = []
-            for permission in self.permissions:
-                permission.object_id = item_list.id
-                permissions.append(permission.create_item_list())
-            item_list.permissions = permissions
-
-        if self.items:
-            items = []
-            for item in self.items:
-                item.item_list = item_list.id
-                items.append(item.create())
-            item_list.items, self.items = [items, items]
-
-        if self.items_checked:
-            items_checked = []
-            for item in self.items_checked:
-                item.item_list = item_list.id
-                items_checked.append(item.create())
-            item_list.items_checked, self.items_checked = [items_checked, items_checked]
+        with db.unit_of_work():
+            # A new list has no items or permissions to look up yet
+            rec = db.create_item_list(self)
+            item_list = ItemList(
+                id=rec.id,
+                owner=rec.owner,
+                name=rec.name,
+                private=rec.private,
+                permissions=(),
+                revision=rec.revision,
+                create_time=rec.create_time,
+            )
+
+            if self.permissions:
+                for permission in self.permissions:
+                    permission.object_id = item_list.id
+                item_list.permissions = Permission.create_item_list_many(self.permissions)
+
+            if self.items or self.items_checked:
+                for item in self.items + self.items_checked:
+                    item.item_list = item_list.id
+                created = ListItem.create_many(self.items + self.items_checked)
+                items, items_checked = created[: len(self.items)], created[len(self.items) :]
+                item_list.items, self.items = [items, items]
+                item_list.items_checked, self.items_checked = [items_checked, items_checked]
 
         return item_list
 
@@ -172,25 +183,61 @@ class ItemList:
         return ItemList.get_item_list(db.get_item_list(id))
 
     @staticmethod
-    def find_item_list_by_owner(owner_id: str) -> '[ItemList]':
-        """Looks ItemLists by owner
+    def find_revision(item_list_id: int, subject_id: UUID) -> int:
+        """Looks up the revision of an item list without reading the list and its items
+
+        Args:
+            item_list_id (int): Id of ItemList
+            subject_id (UUID): Id of the user reading the item list
+
+        Returns:
+            The revision, None if the item list is not found or the user can not read it
+        """
+        return db.get_revision('item_lists', item_list_id, subject_id)
+
+    @staticmethod
+    @contextmanager
+    def locked(item_list_id: int) -> Iterator[int]:
+        """Locks the item list until the end of the block, which is run in one transaction
+
+        Args:
+            item_list_id (int): Id of ItemList
+
+        Yields:
+            The revision of the item list, None if it is not found
+        """
+        with db.unit_of_work():
+            yield db.lock_revision('item_lists', item_list_id)
+
+    @staticmethod
+    def find_item_list_by_owner(
+        owner_id: str, limit: int = None, after: tuple = None, since: int = None
+    ) -> '[ItemList]':
+        """Looks ItemLists by owner, ordered by creation
 
         Args:
             owner_id (str): Id (uuid4) of owner
+            limit (int): Optional, max number of lists
+            after (tuple): Optional, keyset (create_time, id) to continue after
+            since (int): Optional, sync token to only look up those changed since
 
         Returns:
             A list of ItemList objects
         """
-        return [ItemList.get_item_list(item_list) for item_list in db.get_item_list_by_owner(owner_id)]
+        return ItemList.get_item_lists(db.get_item_list_by_owner(owner_id, limit=limit, after=after, since=since))
 
     @staticmethod
-    def find_public_item_lists() -> '[ItemList]':
-        """Fetches all public ItemLists
+    def find_public_item_lists(limit: int = None, after: tuple = None) -> '[ItemList]':
+        """Fetches public ItemLists, ordered by creation
+
+        Args:
+            limit (int): Optional, max number of lists
+            after (tuple): Optional, keyset (create_time, id) to continue after
 
         Returns:
             A list of ItemList objects
         """
-        return [ItemList.get_item_list(item_list) for item_list in db.get_public_item_lists()]
+        return ItemList.get_item_lists(db.get_public_item_lists(limit=limit, after=after))
 
     def change_owner(self, owner_id: UUID) -> bool:
         """Change owner of the item list
@@ -214,7 +261,7 @@ class ItemList:
 
     @staticmethod
     def add_permissions(permissions: tuple[Permission]) -> tuple[Permission]:
-        return tuple(perm.create_item_list() for perm in permissions)
+        return tuple(Permission.create_item_list_many(permissions))
 
     @staticmethod
     def delete_permission(permission: Permission) -> None:
@@ -238,13 +285,45 @@ class ItemList:
         if rec is None:
             return None
 
-        return ItemList(
-            id=rec.id,
-            owner=rec.owner,
-            name=rec.name,
-            private=rec.private,
-            items=ListItem.find_list_items(rec.id, checked=False),
-            items_checked=ListItem.find_list_items(rec.id, checked=True),
-            permissions=Permission.find_item_list_all_permissions(rec.id),
-            create_time=rec.create_time,
-        )
+        return cls.get_item_lists((rec,))[0]
+
+    @classmethod
+    def get_item_lists(cls, recs: list[NamedTuple]) -> list['ItemList']:
+        """Converts database records to ItemList objects
+        Items and permissions for all the lists are fetched with
+        one query each and partitioned per list
+
+        Args:
+            recs ([NamedTuple]): Database records
+
+        Returns:
+            A list of ItemList instances
+        """
+        if not recs:
+            return []
+
+        item_list_ids = [rec.id for rec in recs]
+        items = {item_list_id: [] for item_list_id in item_list_ids}
+        items_checked = {item_list_id: [] for item_list_id in item_list_ids}
+        permissions = {item_list_id: [] for item_list_id in item_list_ids}
+
+        for item in db.get_list_items_by_item_lists(item_list_ids):
+            (items_checked if item.checked else items)[item.item_list].append(ListItem.get_list_item(item))
+
+        for permission in db.get_item_list_permissions_by_item_lists(item_list_ids):
+            permissions[permission.object_id].append(Permission.get_permission(permission))
+
+        return [
+            ItemList(
+                id=rec.id,
+                owner=rec.owner,
+                name=rec.name,
+                private=rec.private,
+                items=items[rec.id],
+                items_checked=items_checked[rec.id],
+                permissions=tuple(permissions[rec.id]),
+                revision=rec.revision,
+                create_time=rec.create_time,
+            )
+            for rec in recs
+        ]
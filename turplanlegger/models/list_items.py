@@ -1,9 +1,10 @@
-from typing import Dict, NamedTuple
+from typing import Dict, Iterable, NamedTuple
 from uuid import UUID
 
 from flask import g
 
 from turplanlegger.app import db
+from turplanlegger.utils.bulk import boolean
 
 JSON = Dict[str, any]
 
@@ -100,7 +101,7 @@ class ListItem:
         """Serialize a ListItem and returns it as Dict(str, any)"""
         return {
             'id': self.id,
-            'owner': self.owner,
+            'owner': str(self.owner),
             'item_list': self.item_list,
             'content': self.content,
             'checked': self.checked,
@@ -118,6 +119,51 @@ class ListItem:
         """Create a ListItem in the database"""
         return self.get_list_item(db.create_list_item(self))
 
+    @staticmethod
+    def create_many(items: list['ListItem']) -> list['ListItem']:
+        """Create several ListItems in the database in one round-trip
+
+        Args:
+            items ([ListItem]): ListItems to create
+
+        Returns:
+            The created ListItems, in the same order
+        """
+        return [ListItem.get_list_item(item) for item in db.create_list_items(items)]
+
+    @staticmethod
+    def import_many(item_list_id: int, owner: UUID, records: Iterable[JSON]) -> list[int]:
+        """Import ListItems from records with 'content' and 'checked'
+        The records are streamed to the database with COPY, if one is
+        invalid none of them are imported
+
+        Args:
+            item_list_id (int): Id of ItemList to add the items to
+            owner (UUID): Owner of the items
+            records (Iterable[Dict[str, any]]): Records to import
+
+        Raises:
+            ValueError, TypeError: if a record is invalid
+
+        Returns:
+            Ids of the imported ListItems, in the same order
+        """
+
+        def rows():
+            for n, record in enumerate(records, start=1):
+                try:
+                    item = ListItem(
+                        owner=owner,
+                        checked=boolean(record.get('checked', False)),
+                        item_list=item_list_id,
+                        content=record.get('content', None),
+                    )
+                except (ValueError, TypeError) as e:
+                    raise type(e)(f'record {n}: {e}')
+                yield item.content, item.checked
+
+        return [rec.id for rec in db.copy_list_items(item_list_id, owner, rows())]
+
     @staticmethod
     def delete_list_items(item_list_id: int):
         """Deletes all ListItems in a ItemList
@@ -134,6 +180,20 @@ class ListItem:
         """Toggle checked flag of ItemList object"""
         return db.toggle_list_item_check(self.id, False if self.checked else True)
 
+    @staticmethod
+    def toggle_check_many(item_list_id: int, ids: list[int]) -> list['ListItem']:
+        """Toggle checked flag of several ListItems in a ItemList at once
+
+        Args:
+            item_list_id (int): Id of ItemList
+            ids ([int]): Ids of ListItems, ids not in the ItemList are ignored
+
+        Returns:
+            The toggled ListItems with their new checked flag, ordered by id
+        """
+        items = sorted(db.toggle_list_items_check(item_list_id, ids), key=lambda item: item.id)
+        return [ListItem.get_list_item(item) for item in items]
+
     def delete(self) -> bool:
         """Delete a ListItem.
         Returns True if deleted"""
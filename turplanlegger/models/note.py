@@ -1,10 +1,13 @@
-from typing import Dict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Dict, Iterable
 from uuid import UUID
 
 from flask import g
 
 from turplanlegger.app import db
 from turplanlegger.models.permission import Permission
+from turplanlegger.utils.bulk import boolean
 
 JSON = Dict[str, any]
 
@@ -28,6 +31,7 @@ class Note:
         name (str): The name/title of the note
         private (bool): Privacy of the note
         permissions (list): List of permissions related to the note
+        revision (int): Revision of the note and its permissions
         create_time (datetime): Time of creation
         update_time (datetime): Time of last update
         deleted (bool): Flag indicating if the note has been deleted
@@ -54,6 +58,7 @@ class Note:
         self.private = private
         self.id = kwargs.get('id', None)
         self.permissions = kwargs.get('permissions', None)
+        self.revision = kwargs.get('revision', None)
         self.create_time = kwargs.get('create_time', None)
         self.update_time = kwargs.get('update_time', None)
         self.deleted = kwargs.get('deleted', None)
@@ -88,7 +93,7 @@ class Note:
     def serialize(self) -> JSON:
         return {
             'id': self.id,
-            'owner': self.owner,
+            'owner': str(self.owner),
             'name': self.name,
             'content': self.content,
             'private': self.private,
@@ -106,6 +111,38 @@ class Note:
             note.permissions = permissions
         return note
 
+    @staticmethod
+    def import_many(owner: UUID, records: Iterable[JSON]) -> list[int]:
+        """Import Notes from records with 'content', 'name' and 'private'
+        The records are streamed to the database with COPY, if one is
+        invalid none of them are imported
+
+        Args:
+            owner (UUID): Owner of the notes
+            records (Iterable[Dict[str, any]]): Records to import
+
+        Raises:
+            ValueError, TypeError: if a record is invalid
+
+        Returns:
+            Ids of the imported Notes, in the same order
+        """
+
+        def rows():
+            for n, record in enumerate(records, start=1):
+                try:
+                    note = Note(
+                        owner=owner,
+                        content=record.get('content', None),
+                        name=record.get('name', None),
+                        private=boolean(record.get('private', True)),
+                    )
+                except (ValueError, TypeError) as e:
+                    raise type(e)(f'record {n}: {e}')
+                yield note.name, note.content, note.private
+
+        return [rec.id for rec in db.copy_notes(owner, rows())]
+
     def update(self) -> 'Note':
         return Note.get_note(db.update_note(self))
 
@@ -123,8 +160,37 @@ class Note:
         return Note.get_note(db.get_note(id))
 
     @staticmethod
-    def find_note_by_owner(owner_id: str) -> tuple['Note']:
-        return tuple(Note.get_note(note) for note in db.get_note_by_owner(owner_id))
+    def find_revision(note_id: int, subject_id: UUID) -> int:
+        """Looks up the revision of a note without reading the note
+
+        Args:
+            note_id (int): Id of Note
+            subject_id (UUID): Id of the user reading the note
+
+        Returns:
+            The revision, None if the note is not found or the user can not read it
+        """
+        return db.get_revision('notes', note_id, subject_id)
+
+    @staticmethod
+    @contextmanager
+    def locked(note_id: int) -> Iterator[int]:
+        """Locks the note until the end of the block, which is run in one transaction
+
+        Args:
+            note_id (int): Id of Note
+
+        Yields:
+            The revision of the note, None if it is not found
+        """
+        with db.unit_of_work():
+            yield db.lock_revision('notes', note_id)
+
+    @staticmethod
+    def find_note_by_owner(owner_id: str, limit: int = None, after: tuple = None, since: int = None) -> tuple['Note']:
+        return tuple(
+            Note.get_note(note) for note in db.get_note_by_owner(owner_id, limit=limit, after=after, since=since)
+        )
 
     def change_owner(self, owner_id: UUID) -> bool:
         """Change owner of the note
@@ -170,6 +236,7 @@ class Note:
             content=rec.content,
             private=rec.private,
             permissions=Permission.find_note_all_permissions(rec.id),
+            revision=rec.revision,
             create_time=rec.create_time,
             update_time=rec.update_time,
             deleted=rec.deleted,
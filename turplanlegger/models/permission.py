@@ -41,7 +41,7 @@ class Permission:
     @property
     def serialize(self) -> JSON:
         """Serialize the Permission instance and returns it as Dict(str, any)"""
-        return {'object_id': self.object_id, 'subject_id': self.subject_id, 'access_level': self.access_level}
+        return {'object_id': self.object_id, 'subject_id': str(self.subject_id), 'access_level': self.access_level}
 
     @staticmethod
     def verify(
@@ -126,6 +126,13 @@ class Permission:
         """Creates an Item List Permission instance in the database"""
         return self.get_permission(db.create_item_list_permissions(self))
 
+    @staticmethod
+    def create_item_list_many(permissions: list['Permission']) -> list['Permission']:
+        """Creates several Item List Permission instances in the database in one round-trip"""
+        return [
+            Permission.get_permission(permission) for permission in db.create_item_list_permissions_many(permissions)
+        ]
+
     def delete_item_list(self) -> None:
         """Removes an Item List Permission instance in the database"""
         return self.get_permission(db.delete_item_list_permissions(self.object_id, self.subject_id))
@@ -143,6 +150,11 @@ class Permission:
         """Creates a trip Permission instance in the database"""
         return self.get_permission(db.create_trip_permissions(self))
 
+    @staticmethod
+    def create_trip_many(permissions: list['Permission']) -> list['Permission']:
+        """Creates several trip Permission instances in the database in one round-trip"""
+        return [Permission.get_permission(permission) for permission in db.create_trip_permissions_many(permissions)]
+
     @classmethod
     def get_permission(cls, rec: NamedTuple) -> 'Permission':
         """Converts a database record to an Permission instance
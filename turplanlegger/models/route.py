@@ -1,10 +1,15 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
 from typing import Dict, NamedTuple
 from uuid import UUID
 
 from flask import g
 
 from turplanlegger.app import db
+from turplanlegger.geo import encoding, history, simplify
+from turplanlegger.geo.stats import RouteStats, measure
 from turplanlegger.models.permission import Permission
+from turplanlegger.utils.response import prefers_compact
 
 JSON = Dict[str, any]
 
@@ -25,8 +30,17 @@ class Route:
         comment (str): Optional route comment
         route (Dict[str, any]): JSON containing geometry
                                 that makes up the path/route
+        route_compact (Dict[str, any]): route with the coordinates
+                                        of every geometry encoded
         route_history (list): List of routes that makes up history
+        version (int): Version of the route, incremented by every update
+        detail (int): Optional, the zoom level route is simplified for,
+                      None if it is the full route
+        stats (RouteStats): Optional, length, bounding box and more of
+                            the route, measured when it is stored
         permissions (list): List of permissions related to the route
+        revision (int): Revision of the route and its permissions,
+                        unlike version also stamped on changes of name and comment
         create_time (datetime): Optional, time of creation
     """
 
@@ -44,16 +58,41 @@ class Route:
         self.name = kwargs.get('name', None)
         self.comment = kwargs.get('comment', None)
         self.route_history = kwargs.get('route_history', [])
+        self.version = kwargs.get('version', 1)
+        self.detail = kwargs.get('detail', None)
+        self.stats = kwargs.get('stats', None)
         self.permissions = kwargs.get('permissions', None)
+        self.revision = kwargs.get('revision', None)
         self.create_time = kwargs.get('create_time', None)
 
+    @property
+    def route(self) -> JSON:
+        """The route as GeoJSON, decoded on first access"""
+        if self._route is None:
+            self._route = encoding.expand(self._source)
+        return self._route
+
+    @route.setter
+    def route(self, route: JSON) -> None:
+        """Set the route, as GeoJSON or with encoded coordinates"""
+        self._source = route
+        self._route = None
+        self._route_compact = None
+
+    @property
+    def route_compact(self) -> JSON:
+        """The route with the coordinates of every geometry encoded, as stored"""
+        if self._route_compact is None:
+            self._route_compact = encoding.compact(self._source)
+        return self._route_compact
+
     def __repr__(self):
         return (
             f"Route(id='{self.id}', owner='{self.owner}', "
             f"name='{self.name}, comment='{self.comment}, "
             f'permissions={self.permissions}), '
             f'route={self.route}, route_history={self.route_history}, '
-            f'create_time={self.create_time})'
+            f'version={self.version}, create_time={self.create_time})'
         )
 
     @classmethod
@@ -72,10 +111,14 @@ class Route:
             raise TypeError('permissions has to be a list of permission objects')
         permissions[:] = [Permission.parse(permission) for permission in permissions]
 
+        route = json.get('route', None)
+        # Clients may send routes in compact form, catch invalid encodings here
+        encoding.expand(route)
+
         return Route(
             id=json.get('id', None),
             owner=g.user.id,
-            route=json.get('route', None),
+            route=route,
             route_history=json.get('route_history', []),
             name=json.get('name', None),
             comment=json.get('comment', None),
@@ -84,21 +127,41 @@ class Route:
 
     @property
     def serialize(self) -> JSON:
-        """Serialize the Route instance, returns it as Dict(str, any)"""
+        """Serialize the Route instance, returns it as Dict(str, any)
+
+        Routes are compact if the client prefers COMPACT_MIMETYPE in Accept
+        """
         return {
             'id': self.id,
-            'owner': self.owner,
-            'route': self.route,
-            'route_history': self.route_history,
+            'owner': str(self.owner),
+            'route': self.route_compact if prefers_compact() else self.route,
+            'route_history': [self.serialize_route(route) for route in self.route_history],
+            'version': self.version,
+            'detail': self.detail,
+            'stats': self.stats.serialize if self.stats else None,
             'create_time': self.create_time,
             'name': self.name,
             'comment': self.comment,
             'permissions': [permission.serialize for permission in self.permissions],
         }
 
+    @property
+    def properties(self) -> JSON:
+        """Properties of the route for the Features of an export, see geo.exporter"""
+        return {'id': self.id, 'name': self.name, 'comment': self.comment}
+
     def create(self) -> 'Route':
         """Creates the Route object in the database"""
-        route = self.get_route(db.create_route(self.route, self.owner, self.name, self.comment))
+        route = self.get_route(
+            db.create_route(
+                self.route_compact,
+                self.owner,
+                self.name,
+                self.comment,
+                simplify.levels(self.route),
+                measure(self.route),
+            )
+        )
         if self.permissions:
             permissions = []
             for permission in self.permissions:
@@ -107,34 +170,166 @@ class Route:
             route.permissions = permissions
         return route
 
+    @staticmethod
+    def serialize_route(route: JSON) -> JSON:
+        """Serialize a route compact or as GeoJSON, as the client prefers in Accept"""
+        return encoding.compact(route) if prefers_compact() else encoding.expand(route)
+
+    def update(self) -> 'Route':
+        """Updates the Route object in the database
+
+        The version it replaces is kept as the patch from the new geometry
+        to the old one, see find_version
+        """
+        with db.unit_of_work():
+            current = db.lock_route(self.id)
+            if current is None:
+                return None
+            route = self.route_compact
+            expanded = encoding.expand(route)
+            db.create_route_version(self.id, current.version, history.diff(expanded, encoding.expand(current.route)))
+            return self.get_route(
+                db.update_route(self.id, route, self.name, self.comment, simplify.levels(expanded), measure(expanded))
+            )
+
+    def find_versions(self) -> list[JSON]:
+        """Lists the versions of the route, oldest first
+
+        Returns:
+            A list of dicts with version and create_time
+        """
+        versions, create_time = [], self.create_time
+        for rec in db.get_route_versions(self.id):
+            versions.append({'version': rec.version, 'create_time': create_time})
+            # A version is replaced when the next is created
+            create_time = rec.create_time
+        versions.append({'version': self.version, 'create_time': create_time})
+        return versions
+
+    def find_version(self, version: int) -> JSON:
+        """Reconstructs the geometry of an earlier version of the route
+
+        Applies the patches from the current version back to version
+
+        Args:
+            version (int): The version to reconstruct
+
+        Returns:
+            The route as GeoJSON, None if there is no such version
+        """
+        if not 1 <= version <= self.version:
+            return None
+        route = self.route
+        for rec in db.get_route_patches(self.id, version):
+            route = history.apply(route, rec.patch)
+        return route
+
     def delete(self) -> bool:
         """Deletes the Route object from the database
         Returns True if deleted"""
         return db.delete_route(self.id)
 
     @staticmethod
-    def find_route(id: int) -> 'Route':
+    def find_route(id: int, detail: int = None) -> 'Route':
         """Looks up an Route based on id
 
         Args:
             id (int): Id of Route
+            detail (int): Optional, zoom level of a simplified version
+                          of the route to look up, see geo.simplify
 
         Returns:
             An Route
         """
-        return Route.get_route(db.get_route(id))
+        return Route.get_route(db.get_route(id, detail=detail))
+
+    @staticmethod
+    def find_revision(route_id: int, subject_id: UUID) -> int:
+        """Looks up the revision of a route without reading the route
+
+        Args:
+            route_id (int): Id of Route
+            subject_id (UUID): Id of the user reading the route
+
+        Returns:
+            The revision, None if the route is not found or the user can not read it
+        """
+        return db.get_revision('routes', route_id, subject_id)
 
     @staticmethod
-    def find_routes_by_owner(owner_id: str) -> '[Route]':
-        """Looks up Routes by owner
+    @contextmanager
+    def locked(route_id: int) -> Iterator[int]:
+        """Locks the route until the end of the block, which is run in one transaction
+
+        Args:
+            route_id (int): Id of Route
+
+        Yields:
+            The revision of the route, None if it is not found
+        """
+        with db.unit_of_work():
+            yield db.lock_revision('routes', route_id)
+
+    @staticmethod
+    def find_routes_by_owner(
+        owner_id: str, limit: int = None, after: tuple = None, detail: int = None, since: int = None
+    ) -> '[Route]':
+        """Looks up Routes by owner, ordered by creation
 
         Args:
             owner_id (str): Id (uuid4) of owner
+            limit (int): Optional, max number of routes
+            after (tuple): Optional, keyset (create_time, id) to continue after
+            detail (int): Optional, zoom level of simplified versions to look up
+            since (int): Optional, sync token to only look up those changed since
 
         Returns:
             A list of Route objects
         """
-        return [Route.get_route(route) for route in db.get_routes_by_owner(owner_id)]
+        return [
+            Route.get_route(route)
+            for route in db.get_routes_by_owner(owner_id, limit=limit, after=after, detail=detail, since=since)
+        ]
+
+    @staticmethod
+    def stream_trip_routes(trip_id: int, subject_id: UUID) -> Iterator['Route']:
+        """Looks up the Routes of a trip a user can read, ordered by creation
+
+        Routes are read from the database as they are taken, without
+        their permissions
+
+        Args:
+            trip_id (int): Id of the trip
+            subject_id (UUID): Id of the user
+
+        Returns:
+            An iterator of Route objects
+        """
+        for rec in db.get_trip_routes_stream(trip_id, subject_id):
+            yield Route.get_route(rec, permissions=False)
+
+    @staticmethod
+    def find_routes_in_bbox(
+        subject_id: UUID, bbox: tuple, limit: int = None, after: tuple = None, detail: int = None
+    ) -> '[Route]':
+        """Looks up the Routes a user can read that pass through a bounding box, ordered by creation
+
+        Routes are matched on their own bounding box, measured when they are stored
+
+        Args:
+            subject_id (UUID): Id of the user
+            bbox (tuple): (min lon, min lat, max lon, max lat)
+            limit (int): Optional, max number of routes
+            after (tuple): Optional, keyset (create_time, id) to continue after
+            detail (int): Optional, zoom level of simplified versions to look up
+
+        Returns:
+            A list of Route objects
+        """
+        return [
+            Route.get_route(route)
+            for route in db.get_routes_in_bbox(subject_id, bbox, limit=limit, after=after, detail=detail)
+        ]
 
     def change_owner(self, owner_id: UUID) -> bool:
         """Change owner of the Route
@@ -168,11 +363,12 @@ class Route:
         return permission.update_route()
 
     @classmethod
-    def get_route(cls, rec: NamedTuple) -> 'Route':
+    def get_route(cls, rec: NamedTuple, permissions: bool = True) -> 'Route':
         """Converts a database record to an Route object
 
         Args:
             rec (NamedTuple): Database record
+            permissions (bool): Look up the permissions of the route
 
         Returns:
             An Route object
@@ -180,13 +376,28 @@ class Route:
         if rec is None:
             return None
 
+        stats = None
+        # Routes stored before they were measured
+        if rec.length is not None:
+            stats = RouteStats(
+                length=rec.length,
+                bbox=tuple(rec.bbox) if rec.bbox else None,
+                centroid=tuple(rec.centroid) if rec.centroid else None,
+                segment_lengths=tuple(rec.segment_lengths),
+                points=rec.points,
+            )
+
         return Route(
             id=rec.id,
             owner=rec.owner,
             route=rec.route,
-            route_history=rec.route_history,
-            permissions=Permission.find_route_all_permissions(rec.id),
+            route_history=rec.route_history or [],
+            version=rec.version,
+            detail=rec.detail,
+            stats=stats,
+            permissions=Permission.find_route_all_permissions(rec.id) if permissions else [],
             name=rec.name,
             comment=rec.comment,
+            revision=rec.revision,
             create_time=rec.create_time,
         )
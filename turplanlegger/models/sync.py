@@ -0,0 +1,108 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as B64Error
+from typing import Dict
+from uuid import UUID
+
+from turplanlegger.app import db
+from turplanlegger.models.item_lists import ItemList
+from turplanlegger.models.note import Note
+from turplanlegger.models.route import Route
+from turplanlegger.models.trip import Trip
+
+JSON = Dict[str, any]
+
+# Kinds of objects in a sync, named as the tables they are stored in
+KINDS = ('trips', 'notes', 'routes', 'item_lists')
+
+
+def encode_token(xid: int) -> str:
+    """Encode the transaction a sync was read from as an opaque token"""
+    return urlsafe_b64encode(f'xid|{xid}'.encode('utf-8')).decode('ascii')
+
+
+def decode_token(token: str) -> int:
+    """Decode a token created by encode_token
+
+    Raises:
+        ValueError: if the token is malformed
+
+    Returns:
+        The transaction
+    """
+    try:
+        kind, xid = urlsafe_b64decode(token.encode('ascii')).decode('utf-8').split('|')
+        if kind != 'xid' or not xid.isdigit():
+            raise ValueError
+        return int(xid)
+    except (B64Error, UnicodeError, ValueError):
+        raise ValueError('since is not a sync token')
+
+
+class Sync:
+    """The trips, notes, routes and item lists of an owner that have
+    changed since the last sync
+
+    Args:
+        token (str): Token of the sync, to pass as since to the next one
+        **kwargs: Arbitrary keyword arguments.
+
+    Attributes:
+        token (str): Token of the sync, to pass as since to the next one
+        trips (list): Trips created or changed since the last sync
+        notes (list): Notes created or changed since the last sync
+        routes (list): Routes created or changed since the last sync
+        item_lists (list): Item lists created or changed since the last sync
+        deleted (dict): Ids of the trips, notes, routes and item lists
+                        deleted since the last sync
+    """
+
+    def __init__(self, token: str, **kwargs) -> None:
+        self.token = token
+        self.trips = kwargs.get('trips', [])
+        self.notes = kwargs.get('notes', [])
+        self.routes = kwargs.get('routes', [])
+        self.item_lists = kwargs.get('item_lists', [])
+        self.deleted = kwargs.get('deleted', {kind: [] for kind in KINDS})
+
+    @property
+    def serialize(self) -> JSON:
+        """Serialize the Sync instance and returns it as Dict(str, any)"""
+        return {
+            'token': self.token,
+            'trips': [trip.serialize for trip in self.trips],
+            'notes': [note.serialize for note in self.notes],
+            'routes': [route.serialize for route in self.routes],
+            'item_lists': [item_list.serialize for item_list in self.item_lists],
+            'deleted': self.deleted,
+        }
+
+    @staticmethod
+    def find_changes(owner_id: UUID, since: str = None) -> 'Sync':
+        """Looks up what an owner has changed since a sync
+
+        The token is read before the changes, so whatever is changed while
+        they are read is in the next sync as well. An object may be in two
+        syncs in a row, but never in none.
+
+        Args:
+            owner_id (UUID): Id of owner
+            since (str): Optional, token of the last sync, None for
+                         everything but what is deleted
+
+        Raises:
+            ValueError: if since is not a sync token
+
+        Returns:
+            A Sync instance
+        """
+        xid = decode_token(since) if since else None
+        token = encode_token(db.get_sync_token())
+
+        return Sync(
+            token=token,
+            trips=Trip.find_trips_by_owner(owner_id, since=xid),
+            notes=list(Note.find_note_by_owner(owner_id, since=xid)),
+            routes=Route.find_routes_by_owner(owner_id, since=xid),
+            item_lists=ItemList.find_item_list_by_owner(owner_id, since=xid),
+            deleted={kind: db.get_deleted_ids(kind, owner_id, xid) if xid is not None else [] for kind in KINDS},
+        )
@@ -1,17 +1,22 @@
 import datetime
+import hashlib
+import time
 from typing import Any
 
 import jwt
 from flask import current_app
-from httpx import HTTPError
 from jwt import DecodeError, ExpiredSignatureError, InvalidAudienceError
 
 from turplanlegger.models.user import User
+from turplanlegger.utils.cache import TTLCache
 from turplanlegger.utils.config import config
 
 JSON = dict[str, Any]
 dt = datetime.datetime
 
+# Decoded claims of verified tokens, keyed on the token hash
+verified_tokens = TTLCache(config.token_cache_size, config.token_cache_ttl)
+
 
 class JWT:
     def __init__(self, iss: int, sub: str, aud: str, exp: dt, nbf: dt, iat: dt, jti: str, typ: str, **kwargss) -> None:
@@ -25,15 +30,34 @@ class JWT:
         self.type = typ
 
     @classmethod
-    def parse(cls, token: str) -> 'JWT':
+    def decode(cls, token: str) -> JSON:
+        """Verify token and return its claims
+
+        Claims of a verified token are cached until it expires,
+        so the signature is only checked the first time a token is seen.
+        """
+        token_hash = hashlib.sha256(token.encode('utf-8')).digest()
+        claims = verified_tokens.get(token_hash)
+        if claims is not None:
+            return claims
+
         unverified_header = jwt.get_unverified_header(token)
         key = cls.find_correct_key(token, unverified_header)
 
         try:
-            jsonRes = jwt.decode(token, key, algorithms=[unverified_header['alg']], audience=config.audience)
+            claims = jwt.decode(token, key, algorithms=[unverified_header['alg']], audience=config.audience)
         except (DecodeError, ExpiredSignatureError, InvalidAudienceError):
             raise
 
+        if isinstance(claims.get('exp'), int | float):
+            verified_tokens.set(token_hash, claims, ttl=claims['exp'] - time.time())
+
+        return claims
+
+    @classmethod
+    def parse(cls, token: str) -> 'JWT':
+        jsonRes = cls.decode(token)
+
         return JWT(
             iss=jsonRes.get('iss', None),
             sub=jsonRes.get('sub', None),
@@ -47,13 +71,7 @@ class JWT:
 
     @classmethod
     def parse_user_from_token(cls, token: str) -> User:
-        unverified_header = jwt.get_unverified_header(token)
-        key = cls.find_correct_key(token, unverified_header)
-
-        try:
-            jsonRes = jwt.decode(token, key, algorithms=[unverified_header['alg']], audience=config.audience)
-        except (DecodeError, ExpiredSignatureError, InvalidAudienceError):
-            raise
+        jsonRes = cls.decode(token)
 
         return User(
             id=jsonRes.get('sub', None),
@@ -65,30 +83,12 @@ class JWT:
         )
 
     def find_correct_key(self, unverified_header: str) -> str:
-        try:
-            response = current_app.http_client.get(config.azure_ad_b2c_key_url)
-            response.raise_for_status()
-        except HTTPError:
-            raise
-
-        jwks = response.json()
-        rsa_key = ''
-
-        for key in jwks['keys']:
-            if key['kid'] == unverified_header['kid']:
-                rsa_key = jwt.algorithms.RSAAlgorithm.from_jwk(
-                    {'kty': key['kty'], 'kid': key['kid'], 'use': key['use'], 'n': key['n'], 'e': key['e']}
-                )
-                break
-
-        if rsa_key:
-            key = rsa_key
-        elif unverified_header['kid'] == config.secret_key_id:
-            key = config.secret_key
-        else:
-            key = ''
+        kid = unverified_header['kid']
+        # Tokens issued by /login never need the B2C key set
+        if kid == config.secret_key_id:
+            return config.secret_key
 
-        return key
+        return current_app.jwks.get_key(kid) or ''
 
     @property
     def serialize(self) -> JSON:
@@ -1,10 +1,12 @@
 from collections import namedtuple
+from collections.abc import Iterator
+from contextlib import contextmanager
 from typing import Dict, NamedTuple
 from uuid import UUID
 
 from flask import g
 
-from turplanlegger.app import db
+from turplanlegger.app import adb, db
 from turplanlegger.models.permission import Permission
 from turplanlegger.models.trip_date import TripDate
 
@@ -36,6 +38,8 @@ class Trip:
         item_list (list): List of item list ids that are related to
                           the trip
         permissions (list): List of permissions that are related to the trip
+        revision (int): Revision of the trip, stamped on changes to it
+                        and its dates, permissions and references
         create_time (datetime): Time of creation
         update_time (datetime): Time of update
 
@@ -63,6 +67,7 @@ class Trip:
         self.routes = kwargs.get('routes', [])
         self.item_lists = kwargs.get('item_lists', [])
         self.permissions = kwargs.get('permissions', None)
+        self.revision = kwargs.get('revision', None)
         self.create_time = kwargs.get('create_time', None)
         self.update_time = kwargs.get('update_time', None)
 
@@ -111,7 +116,7 @@ class Trip:
         """Serialize the Trip instance and returns it as Dict(str, any)"""
         return {
             'id': self.id,
-            'owner': self.owner,
+            'owner': str(self.owner),
             'name': self.name,
             'dates': [date.serialize for date in self.dates],
             'private': self.private,
@@ -123,20 +128,18 @@ class Trip:
         }
 
     def create(self) -> 'Trip':
-        """Creates the Trip instance along with any trip_dates in the database"""
-        trip = self.get_trip(db.create_trip(self))
-        if self.dates:
-            dates = []
-            for date in self.dates:
-                date.trip_id = trip.id
-                dates.append(date.create())
-            trip.dates = dates
-        if self.permissions:
-            permissions = []
-            for permission in self.permissions:
-                permission.object_id = trip.id
-                permissions.append(permission.create_trip())
-            trip.permissions = permissions
+        """Creates the Trip instance along with any trip_dates in the database
+        in one transaction"""
+        with db.unit_of_work():
+            trip = self.get_trip(db.create_trip(self))
+            if self.dates:
+                for date in self.dates:
+                    date.trip_id = trip.id
+                trip.dates = TripDate.create_many(self.dates)
+            if self.permissions:
+                for permission in self.permissions:
+                    permission.object_id = trip.id
+                trip.permissions = Permission.create_trip_many(self.permissions)
         return trip
 
     def delete(self) -> bool:
@@ -157,7 +160,7 @@ class Trip:
             dict of notes from the database
         """
         db.add_trip_note_reference(self.id, note_id)
-        self.notes = db.get_trip_notes(self.id)
+        self.notes = [rec.note_id for rec in db.get_trip_notes(self.id)]
 
     def add_route_reference(self, route_id: int) -> 'Trip':
         """Adds a route to the trip instance
@@ -169,11 +172,11 @@ class Trip:
             dict of routes from the database
         """
         db.add_trip_route_reference(self.id, route_id)
-        self.routes = db.get_trip_routes(self.id)
+        self.routes = [rec.route_id for rec in db.get_trip_routes(self.id)]
 
     def add_item_list_reference(self, item_list_id: int) -> 'Trip':
         db.add_trip_item_list_reference(self.id, item_list_id)
-        self.routes = db.get_trip_item_lists(self.id)
+        self.item_lists = [rec.item_list_id for rec in db.get_trip_item_lists(self.id)]
 
     @staticmethod
     def update_trip_dates(dates: JSON, trip: 'Trip') -> 'TRIP_DATE_UPDATE_STATUS':
@@ -256,19 +259,77 @@ class Trip:
         Returns:
             An Trip
         """
-        return Trip.get_trip(db.get_trip(int(trip_id)))
+        return Trip.get_trip(db.get_trip_hydrated(int(trip_id)))
 
     @staticmethod
-    def find_trips_by_owner(owner_id: str) -> 'list[Trip]':
-        """Looks up Trips by owner
+    def find_revision(trip_id: int, subject_id: UUID) -> int:
+        """Looks up the revision of a trip without reading the trip
+
+        Args:
+            trip_id (int): Id of Trip
+            subject_id (UUID): Id of the user reading the trip
+
+        Returns:
+            The revision, None if the trip is not found or the user can not read it
+        """
+        return db.get_revision('trips', int(trip_id), subject_id)
+
+    @staticmethod
+    @contextmanager
+    def locked(trip_id: int) -> Iterator[int]:
+        """Locks the trip until the end of the block, which is run in one transaction
+
+        Args:
+            trip_id (int): Id of Trip
+
+        Yields:
+            The revision of the trip, None if it is not found
+        """
+        with db.unit_of_work():
+            yield db.lock_revision('trips', int(trip_id))
+
+    @staticmethod
+    def find_trips_by_owner(owner_id: str, limit: int = None, after: tuple = None, since: int = None) -> 'list[Trip]':
+        """Looks up Trips by owner, ordered by creation
+
+        Args:
+            owner_id (str): Id (uuid4) of owner
+            limit (int): Optional, max number of trips
+            after (tuple): Optional, keyset (create_time, id) to continue after
+            since (int): Optional, sync token to only look up those changed since
+
+        Returns:
+            A list of Trip istances
+        """
+        trips = db.get_trips_hydrated_by_owner(owner_id, limit=limit, after=after, since=since)
+        return [Trip.get_trip(trip) for trip in trips]
+
+    @staticmethod
+    async def find_trip_async(trip_id: int) -> 'Trip':
+        """Looks up an trip based on id on the async database
+
+        Args:
+            id (int): Id of Trip
+
+        Returns:
+            An Trip
+        """
+        return Trip.get_trip(await adb.get_trip_hydrated(int(trip_id)))
+
+    @staticmethod
+    async def find_trips_by_owner_async(owner_id: str, limit: int = None, after: tuple = None) -> 'list[Trip]':
+        """Looks up Trips by owner on the async database, ordered by creation
 
         Args:
             owner_id (str): Id (uuid4) of owner
+            limit (int): Optional, max number of trips
+            after (tuple): Optional, keyset (create_time, id) to continue after
 
         Returns:
             A list of Trip istances
         """
-        return [Trip.get_trip(trip) for trip in db.get_trips_by_owner(owner_id)]
+        trips = await adb.get_trips_hydrated_by_owner(owner_id, limit=limit, after=after)
+        return [Trip.get_trip(trip) for trip in trips]
 
     def change_owner(self, owner_id: UUID) -> bool:
         """Change owner of the Trip
@@ -293,6 +354,8 @@ class Trip:
     @classmethod
     def get_trip(cls, rec: NamedTuple) -> 'Trip':
         """Converts a database record to an Trip instance
+        Children are read from the aggregated columns of a hydrated
+        record, a plain trips record has none
 
         Args:
             rec (NamedTuple): Database record
@@ -303,10 +366,16 @@ class Trip:
         if rec is None:
             return None
 
-        trip = Trip(id=rec.id, owner=rec.owner, name=rec.name, private=rec.private, create_time=rec.create_time)
-        trip.permissions = Permission.find_trip_all_permissions(trip.id)
-        trip.dates = TripDate.find_by_trip_id(trip.id)
-        trip.notes = [item.note_id for item in db.get_trip_notes(trip.id)]
-        trip.routes = [item.route_id for item in db.get_trip_routes(trip.id)]
-        trip.item_lists = [item.item_list_id for item in db.get_trip_item_lists(trip.id)]
-        return trip
+        return Trip(
+            id=rec.id,
+            owner=rec.owner,
+            name=rec.name,
+            private=rec.private,
+            revision=rec.revision,
+            create_time=rec.create_time,
+            permissions=[Permission.get_permission(perm) for perm in getattr(rec, 'permissions', [])],
+            dates=[TripDate.get_trip_date(date) for date in getattr(rec, 'dates', [])],
+            notes=list(getattr(rec, 'notes', [])),
+            routes=list(getattr(rec, 'routes', [])),
+            item_lists=list(getattr(rec, 'item_lists', [])),
+        )
@@ -108,7 +108,7 @@ class TripDate:
         """Serialize the TripDate instance and returns it as Dict(str, any)"""
         return {
             'id': self.id,
-            'owner': self.owner,
+            'owner': str(self.owner),
             'start_time': self.start_time.isoformat(),
             'end_time': self.end_time.isoformat(),
             'trip_id': self.trip_id,
@@ -121,6 +121,18 @@ class TripDate:
         date = db.create_trip_date(self)
         return self.get_trip_date(date) if return_result is True else None
 
+    @staticmethod
+    def create_many(dates: list['TripDate']) -> list['TripDate']:
+        """Creates several TripDate instances in the database in one round-trip
+
+        Args:
+            dates ([TripDate]): TripDates to create
+
+        Returns:
+            The created TripDates, in the same order
+        """
+        return [TripDate.get_trip_date(date) for date in db.create_trip_dates(dates)]
+
     def update(self) -> None:
         """Updates the TripDate instance in the database"""
         return db.update_trip_date(self)
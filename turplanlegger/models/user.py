@@ -2,12 +2,17 @@ import re
 from typing import Dict, NamedTuple
 from uuid import UUID, uuid4
 
-from turplanlegger.app import db
+from turplanlegger.app import adb, db
 from turplanlegger.auth import utils
+from turplanlegger.utils.cache import TTLCache
+from turplanlegger.utils.config import config
 from turplanlegger.utils.types import to_uuid
 
 JSON = Dict[str, any]
 
+# Users looked up by the auth decorator, keyed on id
+user_cache = TTLCache(config.user_cache_size, config.user_cache_ttl)
+
 
 class User:
     """A User object. Used for setting owner and sharing content
@@ -100,6 +105,8 @@ class User:
                 If password isn't supplied when auth_type is basic
                 If password is too short when auth_type is basic
                 If the password hashing failed
+            HasherBusy:
+                If the password hasher is at capacity
 
         Returns:
             A Route object
@@ -121,6 +128,8 @@ class User:
                 raise ValueError('Password too short')
         try:
             password = utils.hash_password(password)
+        except utils.HasherBusy:
+            raise
         except Exception:
             raise ValueError('Failed to create user')
 
@@ -158,16 +167,22 @@ class User:
     def rename(self) -> 'User':
         """Update name and last name
         Returns an updated instance of the user"""
-        return self.get_user(db.rename_user(self))
+        user = self.get_user(db.rename_user(self))
+        user_cache.pop(self.id)
+        return user
 
     def delete(self) -> bool:
         """Deletes the Route object from the database
         Returns True if deleted"""
-        return db.delete_user(self.id)
+        deleted = db.delete_user(self.id)
+        user_cache.pop(self.id)
+        return deleted
 
     def toggle_private(self) -> 'None':
         """Switch the privacy of the user"""
-        return db.toggle_private_user(self.id, False if self.private else True)
+        toggled = db.toggle_private_user(self.id, False if self.private else True)
+        user_cache.pop(self.id)
+        return toggled
 
     @staticmethod
     def find_user(id: UUID) -> 'User':
@@ -181,6 +196,39 @@ class User:
         """
         return User.get_user(db.get_user(id))
 
+    @staticmethod
+    async def find_user_async(id: UUID) -> 'User':
+        """Looks up an user based on id on the async database
+
+        Args:
+            id (UUID): Id (uuid4) of user
+
+        Returns:
+            An User instance
+        """
+        return User.get_user(await adb.get_user(id))
+
+    @staticmethod
+    def find_user_cached(id: UUID) -> 'User':
+        """Looks up an user based on id, served from a short lived cache
+
+        Only meant for authenticating requests, the cached user can be
+        up to `config.user_cache_ttl` seconds old
+
+        Args:
+            id (UUID): Id (uuid4) of user
+
+        Returns:
+            An User instance
+        """
+        user = user_cache.get(id)
+        if user is None:
+            user = User.find_user(id)
+            if user is not None:
+                user_cache.set(user.id, user)
+
+        return user
+
     @staticmethod
     def find_by_email(email: str) -> 'User':
         """Looks up an user based on email
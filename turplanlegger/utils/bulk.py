@@ -0,0 +1,86 @@
+import csv
+import io
+from typing import IO, Iterator
+
+import ujson
+
+from turplanlegger.utils.config import config
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+CSV_MIMETYPE = 'text/csv'
+
+MIMETYPES = (JSON_MIMETYPE, NDJSON_MIMETYPE, CSV_MIMETYPE)
+
+
+def read_records(stream: IO[bytes], mimetype: str, charset: str = 'utf-8') -> Iterator[dict]:
+    """Yield the records of a bulk import
+
+    NDJSON and CSV bodies are read one line at a time, a JSON array
+    has to be parsed in full. CSV needs a header row, every value is
+    read as a string and empty values are left out.
+
+    Args:
+        stream (IO[bytes]): The request body
+        mimetype (str): One of MIMETYPES
+        charset (str): Encoding of the body
+
+    Raises:
+        ValueError: if the body is malformed or has more than
+                    config.import_max_rows records
+
+    Returns:
+        An iterator of records
+    """
+    if mimetype not in MIMETYPES:
+        raise ValueError(f'Content-Type must be one of {", ".join(MIMETYPES)}')
+
+    text = io.TextIOWrapper(stream, encoding=charset, newline='' if mimetype == CSV_MIMETYPE else None)
+    if mimetype == JSON_MIMETYPE:
+        records = _json_records(text)
+    elif mimetype == NDJSON_MIMETYPE:
+        records = _ndjson_records(text)
+    else:
+        records = ({key: value for key, value in row.items() if value != ''} for row in csv.DictReader(text))
+
+    for n, record in enumerate(records, start=1):
+        if n > config.import_max_rows:
+            raise ValueError(f'import is limited to {config.import_max_rows} records')
+        if not isinstance(record, dict):
+            raise ValueError(f'record {n}: must be an object')
+        yield record
+
+
+def boolean(value) -> bool:
+    """Read a boolean from JSON or a CSV value like 'true' or '1'
+
+    Raises:
+        TypeError: if the value is not a boolean
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ('true', 't', '1', 'yes'):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ('false', 'f', '0', 'no'):
+        return False
+    raise TypeError(f"'{value}' is not a boolean")
+
+
+def _json_records(text: IO[str]) -> list:
+    try:
+        records = ujson.load(text)
+    except ValueError as e:
+        raise ValueError(f'invalid JSON: {e}')
+    if not isinstance(records, list):
+        raise ValueError('JSON body must be a list of objects')
+    return records
+
+
+def _ndjson_records(text: IO[str]) -> Iterator:
+    for n, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield ujson.loads(line)
+        except ValueError as e:
+            raise ValueError(f'line {n}: invalid JSON: {e}')
@@ -9,13 +9,32 @@ class Config:
     secret_key_id: str
     audience: str
     azure_ad_b2c_key_url: str
+    azure_ad_b2c_key_cache_time: int
+    azure_ad_b2c_key_refresh_interval: int
     token_expire_time: str
+    token_cache_size: int
+    token_cache_ttl: int
+    user_cache_size: int
+    user_cache_ttl: int
+    password_hash_workers: int
+    password_hash_queue_size: int
+    password_hash_timeout: int
     create_admin_user: bool
     admin_email: str
     admin_password: str
     database_uri: str
     database_max_retries: int
     database_timeout: int
+    database_slow_query_ms: int
+    database_cursor: str
+    database_prepare_threshold: int
+    database_pool: bool
+    database_pool_min_size: int
+    database_pool_max_size: int
+    database_pool_timeout: int
+    page_limit_default: int
+    page_limit_max: int
+    import_max_rows: int
     log_level: str
     log_to_file: bool
     log_file_path: str
@@ -34,13 +53,32 @@ class Config:
                 'https://turplanlegger.b2clogin.com/turplanlegger.onmicrosoft.com/discovery/v2.0/keys?p=b2c_1_signin',
                 required=True,
             ),
+            azure_ad_b2c_key_cache_time=Config.get_config_val('AZURE_AD_B2C_KEY_CACHE_TIME', int, 3600, True),
+            azure_ad_b2c_key_refresh_interval=Config.get_config_val('AZURE_AD_B2C_KEY_REFRESH_INTERVAL', int, 60, True),
             token_expire_time=Config.get_config_val('TOKEN_EXPIRE_TIME', int, 86400, required=True),
+            token_cache_size=Config.get_config_val('TOKEN_CACHE_SIZE', int, 1024, True),
+            token_cache_ttl=Config.get_config_val('TOKEN_CACHE_TTL', int, 300, True),
+            user_cache_size=Config.get_config_val('USER_CACHE_SIZE', int, 1024, True),
+            user_cache_ttl=Config.get_config_val('USER_CACHE_TTL', int, 30, True),
+            password_hash_workers=Config.get_config_val('PASSWORD_HASH_WORKERS', int, 1, True),
+            password_hash_queue_size=Config.get_config_val('PASSWORD_HASH_QUEUE_SIZE', int, 1, True),
+            password_hash_timeout=Config.get_config_val('PASSWORD_HASH_TIMEOUT', int, 5, True),
             create_admin_user=Config.get_config_val('CREATE_ADMIN_USER', bool, False),
             admin_email=Config.get_config_val('ADMIN_EMAIL', str),
             admin_password=Config.get_config_val('ADMIN_PASSWORD', str),
             database_uri=Config.get_config_val('DATABASE_URI', str, required=True),
             database_max_retries=Config.get_config_val('DATABASE_MAX_RETRIES', int, 5, True),
             database_timeout=Config.get_config_val('DATABASE_TIMEOUT', int, 10, True),
+            database_slow_query_ms=Config.get_config_val('DATABASE_SLOW_QUERY_MS', int, 0, True),
+            database_cursor=Config.get_config_val('DATABASE_CURSOR', str, 'client', required=True).lower(),
+            database_prepare_threshold=Config.get_config_val('DATABASE_PREPARE_THRESHOLD', int, 5, True),
+            database_pool=Config.get_config_val('DATABASE_POOL', bool, False),
+            database_pool_min_size=Config.get_config_val('DATABASE_POOL_MIN_SIZE', int, 1, True),
+            database_pool_max_size=Config.get_config_val('DATABASE_POOL_MAX_SIZE', int, 4, True),
+            database_pool_timeout=Config.get_config_val('DATABASE_POOL_TIMEOUT', int, 30, True),
+            page_limit_default=Config.get_config_val('PAGE_LIMIT_DEFAULT', int, 100, True),
+            page_limit_max=Config.get_config_val('PAGE_LIMIT_MAX', int, 500, True),
+            import_max_rows=Config.get_config_val('IMPORT_MAX_ROWS', int, 100000, True),
             log_level=Config.get_config_val('LOG_LEVEL', str, 'WARNING', required=True).upper(),
             log_to_file=Config.get_config_val('LOG_TO_FILE', bool, False),
             log_file_path=Config.get_config_val('LOG_FILE_PATH', bool),
@@ -58,10 +96,10 @@ class Config:
         envar = f'TP_{key}'
 
         val = environ.get(envar, default)
-        if isinstance(ent_type, bool) and not isinstance(val, bool):
-            if key.lower() in ['no', 'false', 'nei', '0']:
+        if ent_type is bool and not isinstance(val, bool):
+            if str(val).lower() in ['no', 'false', 'nei', '0']:
                 return False
-            if key.lower() in ['yes', 'true', 'ja', '1']:
+            if str(val).lower() in ['yes', 'true', 'ja', '1']:
                 return True
         if ent_type is int:
             try:
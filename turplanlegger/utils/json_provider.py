@@ -0,0 +1,29 @@
+from typing import Any
+
+import ujson
+from flask.json.provider import DefaultJSONProvider
+
+
+class UJSONProvider(DefaultJSONProvider):
+    """Flask's DefaultJSONProvider with ujson as encoder and decoder
+
+    Serializes the same types: UUID, date and datetime as HTTP dates,
+    dataclasses like Permission through dataclasses.asdict. StrEnums
+    like AccessLevel are plain strings to ujson. Differs from the
+    default in that Decimal is written as a number, and keys are not
+    sorted, ujson drops dicts returned by `default` when sorting.
+    """
+
+    sort_keys = False
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        kwargs.setdefault('escape_forward_slashes', False)
+        # ujson output is compact unless indented
+        kwargs.pop('separators', None)
+        return ujson.dumps(obj, **kwargs)
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return ujson.loads(s, **kwargs)
@@ -0,0 +1,140 @@
+import re
+import threading
+import time
+
+import httpx
+import jwt
+from flask import Flask
+
+from turplanlegger.utils.config import config
+from turplanlegger.utils.logger import log_auth
+
+MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class JwksCache:
+    """In-process cache of the JSON Web Key Set used to verify B2C tokens
+
+    Keys are kept as constructed RSA key objects keyed on `kid`, for as long
+    as the `Cache-Control` max-age of the key set response allows.
+    Once `refresh_ratio` of that time has passed the set is refreshed in a
+    background thread, it is only fetched while serving a request when it has
+    expired or a token carries an unknown `kid`. Fetches are rate limited by
+    `min_refresh_interval`, also when they fail, so an unreachable key set
+    costs one blocking request per interval and the expired keys are served
+    in the meantime.
+
+    Args:
+        url (str): URL of the key set, defaults to config.azure_ad_b2c_key_url
+        http_client (httpx.Client): client used to fetch, defaults to app.http_client
+    """
+
+    refresh_ratio = 0.8
+
+    def __init__(self, app: Flask = None, url: str = None, http_client: httpx.Client = None) -> None:
+        self.app = None
+        self.url = url
+        self.http_client = http_client
+        self.max_age = config.azure_ad_b2c_key_cache_time
+        self.min_refresh_interval = config.azure_ad_b2c_key_refresh_interval
+
+        self.keys = {}
+        self.fetched_at = 0.0
+        self.attempted_at = None
+        self.refresh_at = 0.0
+        self.expires_at = 0.0
+
+        self._lock = threading.Lock()
+        self._refresher_lock = threading.Lock()
+        self._refresher = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app: Flask = None) -> None:
+        self.url = self.url or config.azure_ad_b2c_key_url
+        self.http_client = self.http_client or app.http_client
+        app.jwks = self
+
+    def get_key(self, kid: str, refresh_unknown: bool = True):
+        """Look up the key for a `kid`
+
+        Args:
+            kid (str): Key id from the token header
+            refresh_unknown (bool): Fetch the key set if `kid` is not in it
+
+        Returns:
+            RSA public key, or None if the key set has no such `kid`
+        """
+        fetched_at = self.fetched_at
+        now = time.monotonic()
+        if now >= self.expires_at:
+            self._try_refresh(fetched_at)
+        elif now >= self.refresh_at:
+            self.refresh_in_background(fetched_at)
+
+        key = self.keys.get(kid)
+        if key is None and refresh_unknown:
+            self._try_refresh(self.fetched_at)
+            key = self.keys.get(kid)
+
+        return key
+
+    def refresh(self, fetched_at: float | None = None) -> None:
+        """Fetch the key set
+
+        Concurrent callers wait for a single fetch. Passing the `fetched_at`
+        they observed skips the fetch if another thread has refreshed since,
+        or if a fetch was attempted within `min_refresh_interval`.
+        """
+        with self._lock:
+            if fetched_at is not None and (self.fetched_at != fetched_at or not self._may_refresh()):
+                return
+            self._fetch()
+
+    def refresh_in_background(self, fetched_at: float) -> None:
+        with self._refresher_lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(
+                target=self._background_refresh, args=(fetched_at,), name='jwks-refresh', daemon=True
+            )
+            self._refresher.start()
+
+    def _background_refresh(self, fetched_at: float) -> None:
+        self._try_refresh(fetched_at)
+
+    def _try_refresh(self, fetched_at: float) -> None:
+        try:
+            self.refresh(fetched_at)
+        except Exception as e:
+            # Keep serving the current keys, retried after min_refresh_interval
+            self.refresh_at = time.monotonic() + self.min_refresh_interval
+            log_auth.warning(f'Failed to refresh JWKS from {self.url}: {str(e)}')
+
+    def _may_refresh(self) -> bool:
+        return self.attempted_at is None or time.monotonic() - self.attempted_at >= self.min_refresh_interval
+
+    def _fetch(self) -> None:
+        self.attempted_at = time.monotonic()
+        response = self.http_client.get(self.url)
+        response.raise_for_status()
+
+        keys = {}
+        for key in response.json()['keys']:
+            if key.get('kty') != 'RSA':
+                continue
+            keys[key['kid']] = jwt.algorithms.RSAAlgorithm.from_jwk(
+                {'kty': key['kty'], 'kid': key['kid'], 'use': key.get('use'), 'n': key['n'], 'e': key['e']}
+            )
+
+        max_age = self.max_age
+        match = MAX_AGE.search(response.headers.get('Cache-Control', ''))
+        if match:
+            max_age = max(int(match.group(1)), self.min_refresh_interval)
+
+        now = time.monotonic()
+        self.keys = keys
+        self.fetched_at = now
+        self.refresh_at = now + max(max_age * self.refresh_ratio, self.min_refresh_interval)
+        self.expires_at = now + max_age
+        log_auth.debug(f'Fetched {len(keys)} keys from {self.url}, cached for {max_age}s')
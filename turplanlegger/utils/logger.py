@@ -17,4 +17,5 @@ logging.basicConfig(level=log_level, format=log_format, handlers=handlers)
 
 log = logging.getLogger('turplanlegger')
 log_db = logging.getLogger('turplanlegger.database')
+log_db_slow = logging.getLogger('turplanlegger.database.slow')
 log_auth = logging.getLogger('turplanlegger.auth')
@@ -0,0 +1,68 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as B64Error
+from datetime import datetime
+
+from turplanlegger.utils.config import config
+
+Keyset = tuple[datetime, int]
+
+
+def encode_cursor(create_time: datetime, id: int) -> str:
+    """Encode the keyset (create_time, id) of the last object in a page
+    as an opaque cursor"""
+    return urlsafe_b64encode(f'{create_time.isoformat()}|{id}'.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Keyset:
+    """Decode a cursor created by encode_cursor
+
+    Raises:
+        ValueError: if the cursor is malformed
+
+    Returns:
+        The keyset (create_time, id)
+    """
+    try:
+        create_time, id = urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(create_time), int(id)
+    except (B64Error, UnicodeError, ValueError):
+        raise ValueError('cursor is invalid')
+
+
+def page_args(args) -> tuple[int, Keyset | None]:
+    """Read 'limit' and 'cursor' from the query string
+
+    Args:
+        args (MultiDict): request.args
+
+    Raises:
+        ValueError: if limit or cursor is invalid
+
+    Returns:
+        limit and the keyset to continue after, None for the first page
+    """
+    try:
+        limit = int(args.get('limit', config.page_limit_default))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 0 < limit <= config.page_limit_max:
+        raise ValueError(f'limit must be between 1 and {config.page_limit_max}')
+
+    cursor = args.get('cursor', None)
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def page(objects: list, limit: int) -> tuple[list, str | None]:
+    """Split a lookup of limit + 1 objects into a page and the next cursor
+
+    Args:
+        objects (list): Objects with create_time and id, ordered by both
+        limit (int): Page size
+
+    Returns:
+        The page and the cursor of the next page, None if this is the last
+    """
+    if len(objects) <= limit:
+        return objects, None
+    objects = objects[:limit]
+    return objects, encode_cursor(objects[-1].create_time, objects[-1].id)
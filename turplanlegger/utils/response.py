@@ -1,9 +1,16 @@
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+from functools import wraps
 from urllib.parse import urljoin
 
-from flask import request
+from flask import Response, has_request_context, request
 
+from turplanlegger.exceptions import ApiProblem
 from turplanlegger.utils.config import config
 
+# Routes with the coordinates of every geometry encoded, see turplanlegger.geo.encoding
+COMPACT_MIMETYPE = 'application/vnd.turplanlegger.compact+json'
+
 
 def absolute_url(path: str = '') -> str:
     try:
@@ -11,3 +18,79 @@ def absolute_url(path: str = '') -> str:
     except Exception:
         base_url = '/'
     return urljoin(base_url + '/', path.lstrip('/')) if path else base_url
+
+
+def prefers_compact() -> bool:
+    """True if the Accept header of the request prefers compact routes over plain JSON"""
+    if not has_request_context():
+        return False
+    return request.accept_mimetypes.best_match(('application/json', COMPACT_MIMETYPE)) == COMPACT_MIMETYPE
+
+
+def negotiated(response: Response) -> Response:
+    """Mark a response containing routes as depending on Accept"""
+    response.vary.add('Accept')
+    if prefers_compact():
+        response.mimetype = COMPACT_MIMETYPE
+    return response
+
+
+def etag(revision: int, *variant) -> str:
+    """Strong ETag of a revision of a trip, note, route or item list
+
+    Representations that differ for the same revision, like the zoom
+    levels of a route, add their variant to it, None is left out
+    """
+    return '-'.join(str(part) for part in (revision, *variant) if part is not None)
+
+
+def tagged(response: Response, revision: int, *variant) -> Response:
+    """Set the ETag of a response, see etag"""
+    response.set_etag(etag(revision, *variant))
+    return response
+
+
+def not_modified(find_revision: Callable[[], int | None], *variant) -> Response | None:
+    """A 304 response if If-None-Match has the ETag of the current revision, else None
+
+    find_revision is only called for a request with If-None-Match, and
+    is to give None if the object is not found or can not be read, so
+    that the request is answered like it had no If-None-Match
+    """
+    if not request.if_none_match:
+        return None
+    revision = find_revision()
+    if revision is None or not request.if_none_match.contains_weak(etag(revision, *variant)):
+        return None
+    return tagged(Response(status=304), revision, *variant)
+
+
+def if_match(locked: Callable[[str], AbstractContextManager[int | None]], key: str) -> Callable:
+    """Decorate a view to only run if If-Match has an ETag of the current revision
+
+    The object is looked up with locked by the view argument key, and
+    is locked until the view returns, which is run in one transaction,
+    so it can not change between the check and the update. The view is
+    run as is for a request without If-Match or if the object is not
+    found. Every variant of the revision matches.
+
+    Raises:
+        ApiProblem: 412 if the object has changed
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            if not request.if_match:
+                return func(*args, **kwargs)
+
+            with locked(kwargs[key]) as revision:
+                if revision is not None and not (
+                    request.if_match.star_tag or any(tag.split('-')[0] == str(revision) for tag in request.if_match)
+                ):
+                    raise ApiProblem('Precondition failed', 'The object has been changed since it was read', 412)
+                return func(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
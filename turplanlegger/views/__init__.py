@@ -2,15 +2,27 @@ from flask import Blueprint, current_app, jsonify, request
 
 from turplanlegger.__about__ import __version__
 from turplanlegger.exceptions import ApiProblem
+from turplanlegger.geo import importer
+from turplanlegger.utils import bulk
 from turplanlegger.utils.response import absolute_url
 
 api = Blueprint('api', __name__)  # noqa isort:skip
 
-from . import item_lists, notes, routes, users, trips  # noqa isort:skip
+from . import item_lists, notes, routes, sync, users, trips  # noqa isort:skip
+
+
+# Bulk imports are streamed as JSON, NDJSON or CSV, routes as GPX or GeoJSON
+IMPORT_ENDPOINTS = {
+    'api.import_list_items': bulk.MIMETYPES,
+    'api.import_notes': bulk.MIMETYPES,
+    'api.import_route': importer.MIMETYPES,
+}
 
 
 @api.before_request
 def before_request():
+    if request.mimetype in IMPORT_ENDPOINTS.get(request.endpoint, ()):
+        return
     if (request.method in ['POST', 'PUT'] or (request.method == 'PATCH' and request.data)) and not request.is_json:
         raise ApiProblem(
             'Request has wrong Content-Type',
@@ -9,6 +9,9 @@ from turplanlegger.models.item_lists import ItemList
 from turplanlegger.models.list_items import ListItem
 from turplanlegger.models.permission import Permission, PermissionResult
 from turplanlegger.models.user import User
+from turplanlegger.utils import bulk
+from turplanlegger.utils.pagination import page, page_args
+from turplanlegger.utils.response import if_match, not_modified, tagged
 
 from . import api
 
@@ -16,6 +19,9 @@ from . import api
 @api.route('/item_lists/<item_list_id>', methods=['GET'])
 @auth
 def get_item_list(item_list_id):
+    if response := not_modified(lambda: ItemList.find_revision(item_list_id, g.user.id)):
+        return response
+
     item_list = ItemList.find_item_list(item_list_id)
 
     if item_list and (
@@ -23,13 +29,14 @@ def get_item_list(item_list_id):
         or Permission.verify(item_list.owner, item_list.permissions, g.user.id, AccessLevel.READ)
         is PermissionResult.ALLOWED
     ):
-        return jsonify(status='ok', count=1, item_list=item_list.serialize)
+        return tagged(jsonify(status='ok', count=1, item_list=item_list.serialize), item_list.revision)
     else:
         raise ApiProblem('Item list not found', 'The requested item list was not found', 404)
 
 
 @api.route('/item_lists/<item_list_id>', methods=['DELETE'])
 @auth
+@if_match(ItemList.locked, 'item_list_id')
 def delete_item_list(item_list_id):
     item_list = ItemList.find_item_list(item_list_id)
 
@@ -75,6 +82,7 @@ def add_item_list():
 
 @api.route('/item_lists/<item_list_id>/add', methods=['PATCH'])
 @auth
+@if_match(ItemList.locked, 'item_list_id')
 def add_item_list_items(item_list_id):
     item_list = ItemList.find_item_list(item_list_id)
 
@@ -115,16 +123,45 @@ def add_item_list_items(item_list_id):
         raise ApiProblem('Failed to parse items', 'Unknown error', 500)
 
     try:
-        items = tuple(item.create() for item in items)
-        items_checked = tuple(item.create() for item in items_checked)
+        ListItem.create_many(items + items_checked)
     except Exception as e:
         raise ApiProblem('Failed to create item', str(e), 500)
 
     return jsonify(status='ok', count_items=len(items), count_items_checked=len(items_checked))
 
 
+@api.route('/item_lists/<item_list_id>/import', methods=['POST'])
+@auth
+def import_list_items(item_list_id):
+    item_list = ItemList.find_item_list(item_list_id)
+
+    if not item_list:
+        raise ApiProblem('Item list not found', 'The requested item list was not found', 404)
+
+    perms = Permission.verify(item_list.owner, item_list.permissions, g.user.id, AccessLevel.MODIFY)
+    if item_list.private is False:
+        if perms is not PermissionResult.ALLOWED:
+            raise ApiProblem('Insufficient permissions', 'Not sufficient permissions to modify the item list', 403)
+    else:
+        if perms is PermissionResult.NOT_FOUND:
+            raise ApiProblem('Item list not found', 'The requested item list was not found', 404)
+        if perms is PermissionResult.INSUFFICIENT_PERMISSIONS:
+            raise ApiProblem('Insufficient permissions', 'Not sufficient permissions to modify the item list', 403)
+
+    try:
+        records = bulk.read_records(request.stream, request.mimetype, request.mimetype_params.get('charset', 'utf-8'))
+        ids = ListItem.import_many(item_list.id, g.user.id, records)
+    except (ValueError, TypeError) as e:
+        raise ApiProblem('Failed to import items', str(e), 400)
+    except Exception as e:
+        raise ApiProblem('Failed to import items', str(e), 500)
+
+    return jsonify(status='ok', count=len(ids), ids=ids), 201
+
+
 @api.route('/item_lists/<item_list_id>/rename', methods=['PATCH'])
 @auth
+@if_match(ItemList.locked, 'item_list_id')
 def rename_item_list(item_list_id):
     item_list = ItemList.find_item_list(item_list_id)
 
@@ -151,6 +188,7 @@ def rename_item_list(item_list_id):
 
 @api.route('/item_lists/<item_list_id>/toggle_check', methods=['PATCH'])
 @auth
+@if_match(ItemList.locked, 'item_list_id')
 def toggle_list_item_check(item_list_id):
     item_list = ItemList.find_item_list(item_list_id)
     if not item_list:
@@ -166,24 +204,25 @@ def toggle_list_item_check(item_list_id):
         if perms is PermissionResult.INSUFFICIENT_PERMISSIONS:
             raise ApiProblem('Insufficient permissions', 'Not sufficient permissions to modify the item list', 403)
 
-    if not request.json.get('toggle_items', []):
+    toggle_items = request.json.get('toggle_items', [])
+    if (
+        not toggle_items
+        or not isinstance(toggle_items, list)
+        or not all(isinstance(id, int) and not isinstance(id, bool) for id in toggle_items)
+    ):
         raise ApiProblem(
             'Failed to get items', "Item(s) IDs must be supplied as a JSON list of ints in the key 'toggle_items'", 400
         )
 
-    toggle_items = tuple(item for item in item_list.items if item.id in request.json.get('toggle_items', [])) + tuple(
-        item for item in item_list.items_checked if item.id in request.json.get('toggle_items', [])
-    )
-
-    if not toggle_items:
-        raise ApiProblem('Failed to toggle item lisitems', 'No items were successfully parsed', 400)
-
     try:
-        tuple(item.toggle_check() for item in toggle_items)
+        toggled = ListItem.toggle_check_many(item_list.id, toggle_items)
     except Exception as e:
         raise ApiProblem('Failed to toggle item', str(e), 500)
 
-    return jsonify(status='ok')
+    if not toggled:
+        raise ApiProblem('Failed to toggle item lisitems', 'No items were successfully parsed', 400)
+
+    return jsonify(status='ok', count=len(toggled), items=[item.mini_serialize for item in toggled])
 
 
 @api.route('/item_lists/<item_list_id>/owner', methods=['PATCH'])
@@ -224,10 +263,20 @@ def change_item_list_owner(item_list_id: int):
 @api.route('/item_lists/mine', methods=['GET'])
 @auth
 def get_my_item_lists():
-    item_lists = ItemList.find_item_list_by_owner(g.user.id)
+    try:
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        raise ApiProblem('Failed to look up item lists', str(e), 400)
+
+    item_lists, next_cursor = page(ItemList.find_item_list_by_owner(g.user.id, limit=limit + 1, after=after), limit)
 
     if item_lists:
-        return jsonify(status='ok', count=len(item_lists), item_list=[item_list.serialize for item_list in item_lists])
+        return jsonify(
+            status='ok',
+            count=len(item_lists),
+            item_list=[item_list.serialize for item_list in item_lists],
+            next_cursor=next_cursor,
+        )
     else:
         raise ApiProblem('Item lists not found', 'No item lists were found for the requested user', 404)
 
@@ -235,10 +284,20 @@ def get_my_item_lists():
 @api.route('/item_lists/public', methods=['GET'])
 @auth
 def get_public_item_lists():
-    item_lists = ItemList.find_public_item_lists()
+    try:
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        raise ApiProblem('Failed to look up item lists', str(e), 400)
+
+    item_lists, next_cursor = page(ItemList.find_public_item_lists(limit=limit + 1, after=after), limit)
 
     if item_lists:
-        return jsonify(status='ok', count=len(item_lists), item_list=[item_list.serialize for item_list in item_lists])
+        return jsonify(
+            status='ok',
+            count=len(item_lists),
+            item_list=[item_list.serialize for item_list in item_lists],
+            next_cursor=next_cursor,
+        )
     else:
         raise ApiProblem('Item lists not found', 'No public item lists were found', 404)
 
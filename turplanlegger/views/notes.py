@@ -8,6 +8,9 @@ from turplanlegger.models.access_level import AccessLevel
 from turplanlegger.models.note import Note
 from turplanlegger.models.permission import Permission, PermissionResult
 from turplanlegger.models.user import User
+from turplanlegger.utils import bulk
+from turplanlegger.utils.pagination import page, page_args
+from turplanlegger.utils.response import if_match, not_modified, tagged
 
 from . import api
 
@@ -15,19 +18,23 @@ from . import api
 @api.route('/notes/<note_id>', methods=['GET'])
 @auth
 def get_note(note_id):
+    if response := not_modified(lambda: Note.find_revision(note_id, g.user.id)):
+        return response
+
     note = Note.find_note(note_id)
 
     if note and (
         note.private is False
         or Permission.verify(note.owner, note.permissions, g.user.id, AccessLevel.READ) is PermissionResult.ALLOWED
     ):
-        return jsonify(status='ok', count=1, note=note.serialize)
+        return tagged(jsonify(status='ok', count=1, note=note.serialize), note.revision)
     else:
         raise ApiProblem('Note not found', 'The requested note was not found', 404)
 
 
 @api.route('/notes/<note_id>', methods=['DELETE'])
 @auth
+@if_match(Note.locked, 'note_id')
 def delete_note(note_id):
     note = Note.find_note(note_id)
 
@@ -68,8 +75,23 @@ def add_note():
     return jsonify(note.serialize), 201
 
 
+@api.route('/notes/import', methods=['POST'])
+@auth
+def import_notes():
+    try:
+        records = bulk.read_records(request.stream, request.mimetype, request.mimetype_params.get('charset', 'utf-8'))
+        ids = Note.import_many(g.user.id, records)
+    except (ValueError, TypeError) as e:
+        raise ApiProblem('Failed to import notes', str(e), 400)
+    except Exception as e:
+        raise ApiProblem('Failed to import notes', str(e), 500)
+
+    return jsonify(status='ok', count=len(ids), ids=ids), 201
+
+
 @api.route('/notes/<note_id>', methods=['PUT'])
 @auth
+@if_match(Note.locked, 'note_id')
 def update_note(note_id):
     note_existing = Note.find_note(note_id)
 
@@ -104,7 +126,7 @@ def update_note(note_id):
     else:
         note = note_existing
 
-    return jsonify(status='ok', count=1, note=note.serialize)
+    return tagged(jsonify(status='ok', count=1, note=note.serialize), note.revision)
 
 
 @api.route('/notes/<note_id>/owner', methods=['PATCH'])
@@ -155,10 +177,15 @@ def update_note_content(note_id):
 @api.route('/notes/mine', methods=['GET'])
 @auth
 def get_my_notes():
-    notes = Note.find_note_by_owner(g.user.id)
+    try:
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        raise ApiProblem('Failed to look up notes', str(e), 400)
+
+    notes, next_cursor = page(Note.find_note_by_owner(g.user.id, limit=limit + 1, after=after), limit)
 
     if notes:
-        return jsonify(status='ok', count=len(notes), note=[note.serialize for note in notes])
+        return jsonify(status='ok', count=len(notes), note=[note.serialize for note in notes], next_cursor=next_cursor)
     else:
         raise ApiProblem('Note not found', 'No notes were found for the requested user', 404)
 
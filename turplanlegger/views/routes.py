@@ -1,13 +1,19 @@
 from uuid import UUID
 
-from flask import g, jsonify, request
+from flask import Response, g, jsonify, request
 
 from turplanlegger.auth.decorators import auth
 from turplanlegger.exceptions import ApiProblem
+from turplanlegger.geo.bbox import parse_bbox
+from turplanlegger.geo.exporter import FORMATS, export, export_format
+from turplanlegger.geo.importer import read_route
+from turplanlegger.geo.simplify import detail_args
 from turplanlegger.models.access_level import AccessLevel
 from turplanlegger.models.permission import Permission, PermissionResult
 from turplanlegger.models.route import Route
 from turplanlegger.models.user import User
+from turplanlegger.utils.pagination import page, page_args
+from turplanlegger.utils.response import if_match, negotiated, not_modified, prefers_compact, tagged
 
 from . import api
 
@@ -15,18 +21,133 @@ from . import api
 @api.route('/routes/<route_id>', methods=['GET'])
 @auth
 def get_route(route_id):
-    route = Route.find_route(route_id)
+    try:
+        detail = detail_args(request.args)
+    except ValueError as e:
+        raise ApiProblem('Failed to look up route', str(e), 400)
+
+    # Every zoom level, and compact or not, is a representation of its own
+    variant = (detail, 'compact' if prefers_compact() else None)
+    if response := not_modified(lambda: Route.find_revision(route_id, g.user.id), *variant):
+        response.vary.add('Accept')
+        return response
+
+    route = Route.find_route(route_id, detail=detail)
     if (
         route
         and Permission.verify(route.owner, route.permissions, g.user.id, AccessLevel.READ) is PermissionResult.ALLOWED
     ):
-        return jsonify(status='ok', count=1, route=route.serialize)
+        return tagged(negotiated(jsonify(status='ok', count=1, route=route.serialize)), route.revision, *variant)
+    else:
+        raise ApiProblem('Route not found', 'The requested route was not found', 404)
+
+
+@api.route('/routes/<route_id>', methods=['PUT'])
+@auth
+@if_match(Route.locked, 'route_id')
+def update_route(route_id):
+    route_existing = Route.find_route(route_id)
+    if not route_existing:
+        raise ApiProblem('Route not found', 'The requested route was not found', 404)
+
+    perms = Permission.verify(route_existing.owner, route_existing.permissions, g.user.id, AccessLevel.MODIFY)
+    if perms is PermissionResult.NOT_FOUND:
+        raise ApiProblem('Route not found', 'The requested route was not found', 404)
+    if perms is PermissionResult.INSUFFICIENT_PERMISSIONS:
+        raise ApiProblem('Insufficient permissions', 'Not sufficient permissions to modify the route', 403)
+
+    try:
+        route_update = Route.parse(request.json)
+    except (ValueError, TypeError) as e:
+        raise ApiProblem('Failed to parse route update', str(e), 400)
+
+    updated = False
+
+    if route_update.route_compact != route_existing.route_compact:
+        route_existing.route = route_update.route_compact
+        updated = True
+    for attribute in ('name', 'comment'):
+        if route_update.__getattribute__(attribute) != route_existing.__getattribute__(attribute):
+            route_existing.__setattr__(attribute, route_update.__getattribute__(attribute))
+            updated = True
+
+    if updated is True:
+        try:
+            route = route_existing.update()
+        except Exception as e:
+            raise ApiProblem('Failed to update route', str(e), 500)
+        if route is None:
+            raise ApiProblem('Route not found', 'The requested route was not found', 404)
     else:
+        route = route_existing
+
+    return tagged(
+        negotiated(jsonify(status='ok', count=1, route=route.serialize)),
+        route.revision,
+        None,
+        'compact' if prefers_compact() else None,
+    )
+
+
+@api.route('/routes/<route_id>/export', methods=['GET'])
+@auth
+def export_route(route_id):
+    try:
+        format = export_format(request.args.get('format', None))
+    except ValueError as e:
+        raise ApiProblem('Failed to export route', str(e), 400)
+
+    route = Route.find_route(route_id)
+    if (
+        not route
+        or Permission.verify(route.owner, route.permissions, g.user.id, AccessLevel.READ)
+        is not PermissionResult.ALLOWED
+    ):
+        raise ApiProblem('Route not found', 'The requested route was not found', 404)
+
+    return Response(
+        export([(route.properties, route.route)], format),
+        mimetype=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename="route-{route.id}.{format}"'},
+    )
+
+
+@api.route('/routes/<route_id>/history', methods=['GET'])
+@auth
+def get_route_history(route_id):
+    route = Route.find_route(route_id)
+    if not route:
+        raise ApiProblem('Route not found', 'The requested route was not found', 404)
+
+    perms = Permission.verify(route.owner, route.permissions, g.user.id, AccessLevel.READ)
+    if perms is not PermissionResult.ALLOWED:
+        raise ApiProblem('Route not found', 'The requested route was not found', 404)
+
+    versions = route.find_versions()
+    return jsonify(status='ok', count=len(versions), version=route.version, versions=versions)
+
+
+@api.route('/routes/<route_id>/history/<int:version>', methods=['GET'])
+@auth
+def get_route_version(route_id, version):
+    route = Route.find_route(route_id)
+    if not route:
         raise ApiProblem('Route not found', 'The requested route was not found', 404)
 
+    perms = Permission.verify(route.owner, route.permissions, g.user.id, AccessLevel.READ)
+    if perms is not PermissionResult.ALLOWED:
+        raise ApiProblem('Route not found', 'The requested route was not found', 404)
+
+    geometry = route.find_version(version)
+    if geometry is None:
+        raise ApiProblem('Route version not found', 'The requested version of the route was not found', 404)
+
+    return negotiated(jsonify(status='ok', count=1, version=version, route=Route.serialize_route(geometry)))
+
 
 @api.route('/routes/<route_id>', methods=['DELETE'])
 @auth
+@if_match(Route.locked, 'route_id')
 def delete_route(route_id):
     route = Route.find_route(route_id)
 
@@ -60,7 +181,29 @@ def add_route():
     except Exception as e:
         raise ApiProblem('Failed to create route', str(e), 500)
 
-    return jsonify(route.serialize), 201
+    return negotiated(jsonify(route.serialize)), 201
+
+
+@api.route('/routes/import', methods=['POST'])
+@auth
+def import_route():
+    try:
+        geometry, name = read_route(request.stream, request.mimetype)
+    except ValueError as e:
+        raise ApiProblem('Failed to import route', str(e), 400)
+
+    route = Route(
+        owner=g.user.id,
+        route=geometry,
+        name=request.args.get('name', name),
+        comment=request.args.get('comment', None),
+    )
+    try:
+        route = route.create()
+    except Exception as e:
+        raise ApiProblem('Failed to create route', str(e), 500)
+
+    return negotiated(jsonify(route.serialize)), 201
 
 
 @api.route('/routes/<route_id>/owner', methods=['PATCH'])
@@ -103,14 +246,48 @@ def change_route_owner(route_id):
 @api.route('/routes/mine', methods=['GET'])
 @auth
 def get_my_routes():
-    routes = Route.find_routes_by_owner(g.user.id)
+    try:
+        limit, after = page_args(request.args)
+        detail = detail_args(request.args)
+    except ValueError as e:
+        raise ApiProblem('Failed to look up routes', str(e), 400)
+
+    routes, next_cursor = page(
+        Route.find_routes_by_owner(g.user.id, limit=limit + 1, after=after, detail=detail), limit
+    )
 
     if routes:
-        return jsonify(status='ok', count=len(routes), route=[route.serialize for route in routes])
+        response = jsonify(
+            status='ok', count=len(routes), route=[route.serialize for route in routes], next_cursor=next_cursor
+        )
+        return negotiated(response)
     else:
         raise ApiProblem('route not found', 'No routes were found for the requested user', 404)
 
 
+@api.route('/routes/search', methods=['GET'])
+@auth
+def search_routes():
+    try:
+        bbox = parse_bbox(request.args.get('bbox', ''))
+        limit, after = page_args(request.args)
+        detail = detail_args(request.args)
+    except ValueError as e:
+        raise ApiProblem('Failed to search routes', str(e), 400)
+
+    routes, next_cursor = page(
+        Route.find_routes_in_bbox(g.user.id, bbox, limit=limit + 1, after=after, detail=detail), limit
+    )
+
+    if routes:
+        response = jsonify(
+            status='ok', count=len(routes), route=[route.serialize for route in routes], next_cursor=next_cursor
+        )
+        return negotiated(response)
+    else:
+        raise ApiProblem('route not found', 'No routes were found in the bounding box', 404)
+
+
 @api.route('/routes/<route_id>/permissions', methods=['PATCH'])
 @auth
 def add_route_permissions(route_id):
@@ -0,0 +1,19 @@
+from flask import g, jsonify, request
+
+from turplanlegger.auth.decorators import auth
+from turplanlegger.exceptions import ApiProblem
+from turplanlegger.models.sync import Sync
+from turplanlegger.utils.response import negotiated
+
+from . import api
+
+
+@api.route('/sync', methods=['GET'])
+@auth
+def get_sync():
+    try:
+        sync = Sync.find_changes(g.user.id, request.args.get('since', None))
+    except ValueError as e:
+        raise ApiProblem('Failed to sync', str(e), 400)
+
+    return negotiated(jsonify(status='ok', **sync.serialize))
@@ -1,9 +1,10 @@
 from uuid import UUID
 
-from flask import g, jsonify, request
+from flask import Response, g, jsonify, request, stream_with_context
 
 from turplanlegger.auth.decorators import auth
 from turplanlegger.exceptions import ApiProblem
+from turplanlegger.geo.exporter import FORMATS, export, export_format
 from turplanlegger.models.access_level import AccessLevel
 from turplanlegger.models.item_lists import ItemList
 from turplanlegger.models.note import Note
@@ -12,6 +13,8 @@ from turplanlegger.models.route import Route
 from turplanlegger.models.trip import Trip
 from turplanlegger.models.trip_date import TripDate
 from turplanlegger.models.user import User
+from turplanlegger.utils.pagination import page, page_args
+from turplanlegger.utils.response import if_match, not_modified, tagged
 
 from . import api
 
@@ -20,6 +23,8 @@ from . import api
 @auth
 def get_trip(trip_id):
     try:
+        if response := not_modified(lambda: Trip.find_revision(trip_id, g.user.id)):
+            return response
         trip = Trip.find_trip(trip_id)
     except (ValueError, TypeError):
         raise ApiProblem('Failed to look up trip', 'Unknown error', 400)
@@ -28,11 +33,35 @@ def get_trip(trip_id):
         trip.private is False
         or Permission.verify(trip.owner, trip.permissions, g.user.id, AccessLevel.READ) is PermissionResult.ALLOWED
     ):
-        return jsonify(status='ok', count=1, trip=trip.serialize)
+        return tagged(jsonify(status='ok', count=1, trip=trip.serialize), trip.revision)
     else:
         raise ApiProblem('Trip not found', 'The requested trip was not found', 404)
 
 
+@api.route('/trips/<trip_id>/export', methods=['GET'])
+@auth
+def export_trip(trip_id):
+    try:
+        format = export_format(request.args.get('format', None))
+        trip = Trip.find_trip(trip_id)
+    except (ValueError, TypeError) as e:
+        raise ApiProblem('Failed to export trip', str(e), 400)
+
+    if not trip or (
+        trip.private is True
+        and Permission.verify(trip.owner, trip.permissions, g.user.id, AccessLevel.READ) is not PermissionResult.ALLOWED
+    ):
+        raise ApiProblem('Trip not found', 'The requested trip was not found', 404)
+
+    # Routes are read as the response is sent, the request context is kept until it is done
+    routes = ((route.properties, route.route) for route in Route.stream_trip_routes(trip.id, g.user.id))
+    return Response(
+        stream_with_context(export(routes, format)),
+        mimetype=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename="trip-{trip.id}.{format}"'},
+    )
+
+
 @api.route('/trips', methods=['POST'])
 @auth
 def add_trip():
@@ -50,6 +79,7 @@ def add_trip():
 
 @api.route('/trips/<trip_id>', methods=['PUT'])
 @auth
+@if_match(Trip.locked, 'trip_id')
 def update_trip(trip_id: int):
     trip = Trip.find_trip(trip_id)
 
@@ -98,7 +128,7 @@ def update_trip(trip_id: int):
 
     trip = Trip.find_trip(trip.id)
 
-    return jsonify(status='ok', count=1, trip=trip.serialize, errors=errors)
+    return tagged(jsonify(status='ok', count=1, trip=trip.serialize, errors=errors), trip.revision)
 
 
 @api.route('/trips/<trip_id>/notes', methods=['PATCH'])
@@ -230,16 +260,22 @@ def change_trip_owner(trip_id: int):
 @api.route('/trips/mine', methods=['GET'])
 @auth
 def get_my_trips():
-    trips = Trip.find_trips_by_owner(g.user.id)
+    try:
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        raise ApiProblem('Failed to look up trips', str(e), 400)
+
+    trips, next_cursor = page(Trip.find_trips_by_owner(g.user.id, limit=limit + 1, after=after), limit)
 
     if trips:
-        return jsonify(status='ok', count=len(trips), trip=[trip.serialize for trip in trips])
+        return jsonify(status='ok', count=len(trips), trip=[trip.serialize for trip in trips], next_cursor=next_cursor)
     else:
         raise ApiProblem('Trip not found', 'No trips were found for the requested user', 404)
 
 
 @api.route('/trips/<trip_id>', methods=['DELETE'])
 @auth
+@if_match(Trip.locked, 'trip_id')
 def delete_trip(trip_id):
     trip = Trip.find_trip(trip_id)
     if not trip:
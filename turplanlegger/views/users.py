@@ -1,6 +1,7 @@
 from flask import g, jsonify, request
 
 from turplanlegger.auth.decorators import auth
+from turplanlegger.auth.utils import HasherBusy
 from turplanlegger.exceptions import ApiProblem
 from turplanlegger.models.user import User
 from turplanlegger.utils.types import to_uuid
@@ -54,6 +55,8 @@ def add_user():
         user = User.parse(request.json)
     except (ValueError, TypeError) as e:
         raise ApiProblem('Failed to parse user', str(e), 400)
+    except HasherBusy as e:
+        raise ApiProblem('Failed to create user', str(e), 503)
 
     try:
         user = user.create()